@@ -31,6 +31,8 @@ const VideoCallPage = () => {
   const canvasRef = useRef(null);
   const frameIntervalRef = useRef(null);
   const wsRef = useRef(null);
+  // Frame rate and JPEG settings recommended by the face recognition service
+  const pacingRef = useRef({ frame_interval_ms: 500, jpeg_quality: 0.8, max_width: 640, max_height: 480 });
 
   const {
     localStream,
@@ -59,7 +61,10 @@ const VideoCallPage = () => {
       ws.onmessage = (event) => {
         try {
           const data = JSON.parse(event.data);
-          if (data.frame_processed) {
+          if (data.type === 'pacing') {
+            pacingRef.current = data;
+          } else if (data.frame_processed) {
+            if (data.pacing) pacingRef.current = data.pacing;
             setPersonalFaceData({ ...data, timestamp: Date.now() });
           }
         } catch (err) {
@@ -110,6 +115,11 @@ const VideoCallPage = () => {
     const captureFrame = () => {
       if (!video.videoWidth || !video.videoHeight || !wsRef.current || wsRef.current.readyState !== WebSocket.OPEN) return;
 
+      const pacing = pacingRef.current;
+      if (canvas.width !== pacing.max_width || canvas.height !== pacing.max_height) {
+        canvas.width = pacing.max_width;
+        canvas.height = pacing.max_height;
+      }
       ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
 
       canvas.toBlob((blob) => {
@@ -136,11 +146,18 @@ const VideoCallPage = () => {
           wsRef.current?.send(message);
         };
         reader.readAsDataURL(blob);
-      }, 'image/jpeg', 0.8);
+      }, 'image/jpeg', pacing.jpeg_quality);
     };
 
-    frameIntervalRef.current = setInterval(captureFrame, 500);
-    return () => clearInterval(frameIntervalRef.current);
+    // Re-arm after every frame so a new recommended interval applies immediately
+    const scheduleNext = () => {
+      frameIntervalRef.current = setTimeout(() => {
+        captureFrame();
+        scheduleNext();
+      }, pacingRef.current.frame_interval_ms);
+    };
+    scheduleNext();
+    return () => clearTimeout(frameIntervalRef.current);
   }, [localStream, faceRecognitionEnabled, user, roomId]);
 
   // ---- Handlers ----
@@ -148,7 +165,7 @@ const VideoCallPage = () => {
     const newState = !faceRecognitionEnabled;
     setFaceRecognitionEnabled(newState);
     if (!newState) {
-      clearInterval(frameIntervalRef.current);
+      clearTimeout(frameIntervalRef.current);
       wsRef.current?.close();
       setPersonalFaceData(null);
     }
@@ -163,7 +180,7 @@ const VideoCallPage = () => {
   };
 
   const handleEndCall = async () => {
-    clearInterval(frameIntervalRef.current);
+    clearTimeout(frameIntervalRef.current);
     wsRef.current?.close();
     disconnect();
     navigate('/dashboard');
@@ -362,6 +379,8 @@ export default VideoCallPage;
   const canvasRef = useRef(null);
   const frameIntervalRef = useRef(null);
   const wsRef = useRef(null);
+  // Frame rate and JPEG settings recommended by the face recognition service
+  const pacingRef = useRef({ frame_interval_ms: 500, jpeg_quality: 0.8, max_width: 640, max_height: 480 });
 
   const {
     localStream,
@@ -390,7 +409,10 @@ export default VideoCallPage;
       ws.onmessage = (event) => {
         try {
           const data = JSON.parse(event.data);
-          if (data.frame_processed) {
+          if (data.type === 'pacing') {
+            pacingRef.current = data;
+          } else if (data.frame_processed) {
+            if (data.pacing) pacingRef.current = data.pacing;
             setPersonalFaceData({ ...data, timestamp: Date.now() });
           }
         } catch (err) {
@@ -441,6 +463,11 @@ export default VideoCallPage;
     const captureFrame = () => {
       if (!video.videoWidth || !video.videoHeight || !wsRef.current || wsRef.current.readyState !== WebSocket.OPEN) return;
 
+      const pacing = pacingRef.current;
+      if (canvas.width !== pacing.max_width || canvas.height !== pacing.max_height) {
+        canvas.width = pacing.max_width;
+        canvas.height = pacing.max_height;
+      }
       ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
 
       canvas.toBlob((blob) => {
@@ -467,11 +494,18 @@ export default VideoCallPage;
           wsRef.current?.send(message);
         };
         reader.readAsDataURL(blob);
-      }, 'image/jpeg', 0.8);
+      }, 'image/jpeg', pacing.jpeg_quality);
     };
 
-    frameIntervalRef.current = setInterval(captureFrame, 500);
-    return () => clearInterval(frameIntervalRef.current);
+    // Re-arm after every frame so a new recommended interval applies immediately
+    const scheduleNext = () => {
+      frameIntervalRef.current = setTimeout(() => {
+        captureFrame();
+        scheduleNext();
+      }, pacingRef.current.frame_interval_ms);
+    };
+    scheduleNext();
+    return () => clearTimeout(frameIntervalRef.current);
   }, [localStream, faceRecognitionEnabled, user, roomId]);
 
   // ---- Handlers ----
@@ -479,7 +513,7 @@ export default VideoCallPage;
     const newState = !faceRecognitionEnabled;
     setFaceRecognitionEnabled(newState);
     if (!newState) {
-      clearInterval(frameIntervalRef.current);
+      clearTimeout(frameIntervalRef.current);
       wsRef.current?.close();
       setPersonalFaceData(null);
     }
@@ -494,7 +528,7 @@ export default VideoCallPage;
   };
 
   const handleEndCall = async () => {
-    clearInterval(frameIntervalRef.current);
+    clearTimeout(frameIntervalRef.current);
     wsRef.current?.close();
     disconnect();
     navigate('/dashboard');
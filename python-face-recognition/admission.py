@@ -0,0 +1,160 @@
+"""Admission control and load shedding.
+
+Instead of queueing without bound, and so raising everyone's latency, the
+service turns work away early with a retry-after hint:
+
+* connections beyond max_clients are refused at the handshake;
+* frames are shed once max_in_flight frames are already being decoded and
+  detected. Attendees may only use (1 - host_reserve) of that budget, so
+  hosts keep being served after attendees start being turned away;
+* each session gets a token bucket of session_fps frames per second (burst
+  session_burst) so one large room cannot starve the others. Hosts are
+  exempt.
+
+Hosts are participants listed in host_ids (ADMISSION_HOST_IDS), or frames
+with role "host" in their header or hello from a trusted connection: the
+local Unix socket, or a client presenting the relay's RELAY_TOKEN. Other
+clients cannot promote themselves; their role claims are ignored.
+"""
+import hmac
+import time
+
+from config import env_float, env_int, env_str
+
+ROLE_HOST = 'host'
+ROLE_ATTENDEE = 'attendee'
+
+SHED_IN_FLIGHT = 'in_flight'
+SHED_SESSION_QUOTA = 'session_quota'
+
+
+class _TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+
+
+class AdmissionController:
+    """Connection and frame admission decisions, with counters for /stats"""
+
+    def __init__(self, max_clients=500, max_in_flight=32, host_reserve=0.25,
+                 session_fps=0.0, session_burst=None, min_retry_ms=250, host_ids=(), relay_token=None):
+        self.max_clients = max_clients
+        self.max_in_flight = max_in_flight
+        self.host_reserve = min(max(host_reserve, 0.0), 1.0)
+        self.session_fps = session_fps
+        self.session_burst = session_burst or max(1.0, session_fps * 2)
+        self.min_retry_ms = min_retry_ms
+        self.host_ids = frozenset(host_ids)
+        self.relay_token = relay_token
+        self._buckets = {}
+
+        self.connections_admitted = 0
+        self.connections_rejected = 0
+        self.frames_admitted = 0
+        self.role_claims_ignored = 0
+        self.shed = {SHED_IN_FLIGHT: {ROLE_HOST: 0, ROLE_ATTENDEE: 0},
+                     SHED_SESSION_QUOTA: {ROLE_HOST: 0, ROLE_ATTENDEE: 0}}
+
+    @classmethod
+    def from_env(cls, workers):
+        return cls(
+            max_clients=env_int('ADMISSION_MAX_CLIENTS', 500),
+            max_in_flight=env_int('ADMISSION_MAX_IN_FLIGHT', 0) or workers * 4,
+            host_reserve=env_float('ADMISSION_HOST_RESERVE', 0.25),
+            session_fps=env_float('ADMISSION_SESSION_FPS', 0.0),
+            session_burst=env_float('ADMISSION_SESSION_BURST', 0.0) or None,
+            min_retry_ms=env_int('ADMISSION_MIN_RETRY_MS', 250),
+            host_ids=[pid.strip() for pid in env_str('ADMISSION_HOST_IDS', '').split(',') if pid.strip()],
+            relay_token=env_str('RELAY_TOKEN')
+        )
+
+    def trusted(self, authorization=None, local=False):
+        """Whether a connection may assert its own role: the Unix socket or the relay's bearer token"""
+        if local:
+            return True
+        if not self.relay_token or not authorization or not authorization.startswith('Bearer '):
+            return False
+        return hmac.compare_digest(authorization[7:].encode(), self.relay_token.encode())
+
+    def role(self, info, trusted=False):
+        """Role a frame is admitted under; only trusted connections may claim host themselves"""
+        if str(info.get('participant_id')) in self.host_ids:
+            return ROLE_HOST
+        if str(info.get('role', '')).lower() != ROLE_HOST:
+            return ROLE_ATTENDEE
+        if trusted:
+            return ROLE_HOST
+        self.role_claims_ignored += 1
+        return ROLE_ATTENDEE
+
+    def admit_connection(self, connected, retry_ms=None):
+        """None if a new connection may proceed, otherwise retry-after milliseconds"""
+        self._prune(time.monotonic())
+        if self.max_clients > 0 and connected >= self.max_clients:
+            self.connections_rejected += 1
+            return max(self.min_retry_ms, retry_ms or 0) * 4
+        self.connections_admitted += 1
+        return None
+
+    def in_flight_limit(self, role):
+        if role == ROLE_HOST:
+            return self.max_in_flight
+        return max(1, int(self.max_in_flight * (1 - self.host_reserve)))
+
+    def admit_frame(self, session_id, role, in_flight, retry_ms=None, now=None):
+        """None if the frame may be processed, otherwise (reason, retry-after milliseconds)
+
+        retry_ms is the caller's estimate of how long the backlog needs to
+        drain (e.g. the current recommended frame interval).
+        """
+        retry_ms = max(self.min_retry_ms, int(retry_ms or 0))
+        if self.max_in_flight > 0 and in_flight >= self.in_flight_limit(role):
+            self.shed[SHED_IN_FLIGHT][role] += 1
+            return SHED_IN_FLIGHT, retry_ms
+
+        if self.session_fps > 0 and role != ROLE_HOST:
+            now = time.monotonic() if now is None else now
+            bucket = self._buckets.get(session_id)
+            if bucket is None:
+                bucket = self._buckets[session_id] = _TokenBucket(self.session_burst, now)
+            bucket.tokens = min(self.session_burst, bucket.tokens + (now - bucket.updated) * self.session_fps)
+            bucket.updated = now
+            if bucket.tokens < 1:
+                self.shed[SHED_SESSION_QUOTA][role] += 1
+                wait_ms = int((1 - bucket.tokens) / self.session_fps * 1000)
+                return SHED_SESSION_QUOTA, max(self.min_retry_ms, wait_ms)
+            bucket.tokens -= 1
+
+        self.frames_admitted += 1
+        return None
+
+    def _prune(self, now):
+        # A bucket idle long enough to have refilled is the same as no bucket
+        if self.session_fps <= 0:
+            return
+        idle = self.session_burst / self.session_fps
+        for session_id in [sid for sid, b in self._buckets.items() if now - b.updated >= idle]:
+            del self._buckets[session_id]
+
+    def frames_shed(self):
+        return sum(count for by_role in self.shed.values() for count in by_role.values())
+
+    def info(self):
+        return {
+            'max_clients': self.max_clients,
+            'max_in_flight': self.max_in_flight,
+            'attendee_in_flight_limit': self.in_flight_limit(ROLE_ATTENDEE),
+            'session_fps': self.session_fps,
+            'session_burst': self.session_burst,
+            'connections_admitted': self.connections_admitted,
+            'connections_rejected': self.connections_rejected,
+            'frames_admitted': self.frames_admitted,
+            'host_ids': len(self.host_ids),
+            'relay_token': bool(self.relay_token),
+            'role_claims_ignored': self.role_claims_ignored,
+            'frames_shed': self.frames_shed(),
+            'shed': self.shed
+        }
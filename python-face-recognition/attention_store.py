@@ -0,0 +1,516 @@
+"""Durable, append-only attention store.
+
+Layout of the store directory, per generation N:
+
+    frames-N.bin     fixed 9-byte records: participant id (u32), ms since the
+                     participant's start (u32), face detected (u8)
+    meta-N.jsonl     participant definitions and resets, one JSON per line
+    snapshot-N.pkl   full state as of the start of generation N
+
+Frame and meta events are buffered in memory and written by a background
+task in the default executor, so the event loop never blocks on disk I/O.
+Every snapshot starts a new generation and deletes older ones. Recovery
+loads the newest snapshot and replays later generations; frame records
+are parsed with NumPy and applied per participant in bulk.
+
+Participant ids are never reused, and resets record the highest id they
+cover. Replay therefore does not depend on the relative order of meta and
+frame records, which is why they can live in separate files.
+"""
+import asyncio
+import glob
+import json
+import logging
+import os
+import pickle
+import re
+import struct
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from config import env_bool, env_float, env_int, env_str
+from participants import ParticipantState
+
+logger = logging.getLogger(__name__)
+
+FRAME_RECORD = np.dtype([('pid', '<u4'), ('t', '<u4'), ('d', 'u1')])
+_FRAME_STRUCT = struct.Struct('<IIB')
+SNAPSHOT_VERSION = 1
+_GENERATION_RE = re.compile(r'^(frames|meta|snapshot)-(\d+)\.(bin|jsonl|pkl)$')
+
+
+class AttentionStore:
+    """Append-only event log plus periodic snapshots for attention_data"""
+
+    def __init__(self, directory, flush_interval=0.5, snapshot_interval=30.0,
+                 segment_bytes=64 * 1024 * 1024, fsync=False):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.snapshot_interval = snapshot_interval
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+
+        self.generation = 0
+        self._next_pid = 1
+        self._frames = bytearray()
+        self._meta = []
+        self._segment_size = 0
+        self._write_lock = None
+        self._tasks = []
+
+        self.events_written = 0
+        self.bytes_written = 0
+        self.snapshots_written = 0
+        self.last_recovery_ms = None
+        self.last_snapshot_ms = None
+
+    @classmethod
+    def from_env(cls, default_directory):
+        """Build a store from ATTENTION_STORE_* settings; None if disabled"""
+        if not env_bool('ATTENTION_STORE', True):
+            return None
+        return cls(
+            env_str('ATTENTION_STORE_DIR', default_directory),
+            flush_interval=env_float('ATTENTION_STORE_FLUSH_SECONDS', 0.5),
+            snapshot_interval=env_float('ATTENTION_STORE_SNAPSHOT_SECONDS', 30.0),
+            segment_bytes=env_int('ATTENTION_STORE_SEGMENT_MB', 64) * 1024 * 1024,
+            fsync=env_bool('ATTENTION_STORE_FSYNC', False)
+        )
+
+    def _path(self, kind, generation):
+        extension = {'frames': 'bin', 'meta': 'jsonl', 'snapshot': 'pkl'}[kind]
+        return os.path.join(self.directory, f"{kind}-{generation:06d}.{extension}")
+
+    def _generations(self):
+        found = defaultdict(set)
+        for path in glob.glob(os.path.join(self.directory, '*-*.*')):
+            match = _GENERATION_RE.match(os.path.basename(path))
+            if match:
+                found[match.group(1)].add(int(match.group(2)))
+        return found
+
+    # Recording (called on the event loop; never touches the disk)
+
+    def add_participant(self, session_id, participant_id, participant):
+        participant.store_id = self._next_pid
+        self._next_pid += 1
+        self._meta.append({
+            't': 'participant',
+            'pid': participant.store_id,
+            'session': session_id,
+            'participant': participant_id,
+            'name': participant.name,
+            'start': participant.start_wall
+        })
+
+    def record_frame(self, participant, face_detected, now):
+        self._frames += _FRAME_STRUCT.pack(
+            participant.store_id, int((now - participant.start_mono) * 1000), 1 if face_detected else 0)
+
+    def reset(self, session_id=None):
+        """Log that a session (or everything, if None) was cleared"""
+        self._meta.append({'t': 'reset', 'session': session_id, 'max_pid': self._next_pid - 1})
+
+    def remove_participant(self, participant):
+        """Log that a single participant was dropped from attention_data"""
+        if participant.store_id is not None:
+            self._meta.append({'t': 'remove', 'pid': participant.store_id})
+
+    # Recovery
+
+    def recover(self, ring_size, windows):
+        """Rebuild attention_data from the newest snapshot plus later log records"""
+        start = time.perf_counter()
+        os.makedirs(self.directory, exist_ok=True)
+        found = self._generations()
+
+        snapshot = None
+        snapshot_generation = None
+        for generation in sorted(found['snapshot'], reverse=True):
+            try:
+                with open(self._path('snapshot', generation), 'rb') as f:
+                    snapshot = pickle.load(f)
+                if snapshot.get('version') != SNAPSHOT_VERSION:
+                    raise ValueError(f"unsupported snapshot version {snapshot.get('version')}")
+            except Exception as e:
+                logger.error(f"❌ Skipping unreadable snapshot {generation}: {e}")
+                snapshot = None
+                continue
+            snapshot_generation = generation
+            break
+
+        log_generations = sorted(found['frames'] | found['meta'])
+        if snapshot_generation is not None:
+            log_generations = [g for g in log_generations if g >= snapshot_generation]
+
+        block = _RecoveryBlock(ring_size)
+        if snapshot is not None:
+            block.load_snapshot(snapshot)
+            self._next_pid = max(self._next_pid, snapshot['next_pid'])
+
+        resets, removed = self._read_meta(log_generations, block)
+        replayed = 0
+        for generation in log_generations:
+            replayed += block.apply_frames(self._read_frames(generation))
+
+        attention_data = block.build(windows, resets, removed)
+
+        self.generation = max([snapshot_generation or 0] + log_generations) + 1
+        self.last_recovery_ms = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(f"💾 Recovered {sum(len(s) for s in attention_data.values())} participants "
+                    f"in {len(attention_data)} sessions ({replayed} logged frames) "
+                    f"in {self.last_recovery_ms} ms")
+        return attention_data
+
+    def _read_meta(self, generations, block):
+        resets = []
+        removed = set()
+        for generation in generations:
+            path = self._path('meta', generation)
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn final line from a crash mid-write
+                        continue
+                    if event['t'] == 'participant':
+                        block.add(event['pid'], event['session'], event['participant'], event['name'], event['start'])
+                        self._next_pid = max(self._next_pid, event['pid'] + 1)
+                    elif event['t'] == 'reset':
+                        resets.append((event['session'], event['max_pid']))
+                    elif event['t'] == 'remove':
+                        removed.add(event['pid'])
+        return resets, removed
+
+    def _read_frames(self, generation):
+        path = self._path('frames', generation)
+        if not os.path.exists(path):
+            return np.zeros(0, dtype=FRAME_RECORD)
+        with open(path, 'rb') as f:
+            data = f.read()
+        # Ignore a torn trailing record
+        return np.frombuffer(data, dtype=FRAME_RECORD, count=len(data) // FRAME_RECORD.itemsize)
+
+    # Background writing
+
+    async def start(self, get_state):
+        """Start the flush and snapshot tasks; get_state returns attention_data"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._write_lock = asyncio.Lock()
+        self._tasks = [
+            asyncio.create_task(self._flush_loop()),
+            asyncio.create_task(self._snapshot_loop(get_state))
+        ]
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"❌ Attention store flush failed: {e}")
+
+    async def _snapshot_loop(self, get_state):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                await self.snapshot(get_state())
+            except Exception as e:
+                logger.error(f"❌ Attention store snapshot failed: {e}")
+
+    def _take_buffers(self):
+        frames, self._frames = self._frames, bytearray()
+        meta, self._meta = self._meta, []
+        return bytes(frames), meta
+
+    def _write(self, generation, frames, meta):
+        # Runs in the executor
+        written = 0
+        if meta:
+            data = ''.join(json.dumps(event, separators=(',', ':')) + '\n' for event in meta).encode('utf-8')
+            written += self._append(self._path('meta', generation), data)
+        if frames:
+            written += self._append(self._path('frames', generation), frames)
+        return written
+
+    def _append(self, path, data):
+        with open(path, 'ab') as f:
+            f.write(data)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        return len(data)
+
+    async def flush(self):
+        """Write buffered events to the current generation's segment files"""
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        async with self._write_lock:
+            if not self._frames and not self._meta:
+                return
+            generation = self.generation
+            frames, meta = self._take_buffers()
+            loop = asyncio.get_running_loop()
+            written = await loop.run_in_executor(None, self._write, generation, frames, meta)
+            self.events_written += len(frames) // FRAME_RECORD.itemsize + len(meta)
+            self.bytes_written += written
+            self._segment_size += len(frames)
+            if self._segment_size >= self.segment_bytes:
+                # Start a new segment; recovery replays every generation since the snapshot
+                self.generation += 1
+                self._segment_size = 0
+
+    async def snapshot(self, attention_data):
+        """Write a full snapshot and drop the log generations it supersedes"""
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        async with self._write_lock:
+            start = time.perf_counter()
+            # Capture state and the buffered events that belong to the old
+            # generation without yielding, so nothing recorded meanwhile is lost.
+            # The rings are only referenced here and copied in the executor.
+            generation = self.generation
+            frames, meta = self._take_buffers()
+            state = _snapshot_state(attention_data, self._next_pid)
+            self.generation += 1
+            self._segment_size = 0
+            snapshot_generation = self.generation
+
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._write, generation, frames, meta)
+            await loop.run_in_executor(None, self._write_snapshot, snapshot_generation, state)
+            self.snapshots_written += 1
+            self.last_snapshot_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    def _write_snapshot(self, generation, state):
+        # Runs in the executor
+        state = _stack_rings(state)
+        path = self._path('snapshot', generation)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        for kind, generations in self._generations().items():
+            for old in generations:
+                if old < generation:
+                    try:
+                        os.remove(self._path(kind, old))
+                    except FileNotFoundError:
+                        pass
+
+    async def close(self, attention_data):
+        """Stop background tasks and leave a fresh snapshot behind"""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        await self.snapshot(attention_data)
+
+    def info(self):
+        return {
+            'directory': self.directory,
+            'generation': self.generation,
+            'buffered_bytes': len(self._frames),
+            'events_written': self.events_written,
+            'bytes_written': self.bytes_written,
+            'snapshots_written': self.snapshots_written,
+            'last_snapshot_ms': self.last_snapshot_ms,
+            'last_recovery_ms': self.last_recovery_ms
+        }
+
+
+def _snapshot_state(attention_data, next_pid):
+    """Capture attention_data as plain rows plus references to each ring array
+
+    Copying every ring is the expensive part, so it is left to _stack_rings
+    in the executor. Frames recorded meanwhile may already be in the copied
+    rings; they are also in the next generation's log, and replay writes
+    them to the same slots, so recovery ends up with the same rings.
+    """
+    rows = []
+    times = []
+    detected = []
+    ring_size = 0
+    for session_id, participants in attention_data.items():
+        for participant_id, participant in participants.items():
+            last_seen_ms = 0
+            if participant.last_seen_mono is not None:
+                last_seen_ms = int((participant.last_seen_mono - participant.start_mono) * 1000)
+            rows.append((participant.store_id, session_id, participant_id, participant.name,
+                         participant.start_wall, participant.total_frames,
+                         participant.face_detected_frames, last_seen_ms))
+            times.append(participant._times)
+            detected.append(participant._detected)
+            ring_size = max(ring_size, participant.ring_size)
+
+    return {
+        'version': SNAPSHOT_VERSION,
+        'next_pid': next_pid,
+        'created_at': time.time(),
+        'rows': rows,
+        'ring_size': ring_size,
+        'times': times,
+        'detected': detected
+    }
+
+
+def _stack(rings, width, dtype):
+    if all(len(ring) == width for ring in rings):
+        return np.stack(rings)
+    # Rings that have not grown to full size yet hold frame i in slot i;
+    # the slots past their length are beyond total_frames and never read
+    block = np.zeros((len(rings), width), dtype=dtype)
+    for row, ring in zip(block, rings):
+        row[:len(ring)] = ring
+    return block
+
+
+def _stack_rings(state):
+    """Copy the captured ring arrays into one 2-D block each, as snapshots store them"""
+    times, detected, width = state['times'], state['detected'], state['ring_size']
+    return {
+        **state,
+        'times': _stack(times, width, np.uint32) if times else None,
+        'detected': _stack(detected, width, np.uint8) if detected else None
+    }
+
+
+class _RecoveryBlock:
+    """All recovered participants as rows of 2-D ring arrays, updated with NumPy
+
+    Replaying the log tail one frame at a time through ParticipantState is
+    far too slow for tens of thousands of participants, so frames are
+    scattered into the block in bulk and the sliding windows are recomputed
+    with array operations.
+    """
+
+    def __init__(self, ring_size):
+        self.ring_size = ring_size
+        self.rows = []
+        self.row_of = {}
+        self.times = np.zeros((0, ring_size), dtype=np.uint32)
+        self.detected = np.zeros((0, ring_size), dtype=np.uint8)
+        self.totals = np.zeros(0, dtype=np.int64)
+        self.face = np.zeros(0, dtype=np.int64)
+        self.last_seen = np.zeros(0, dtype=np.int64)
+
+    def load_snapshot(self, snapshot):
+        rows = snapshot['rows']
+        if not rows:
+            return
+        self.rows = [list(row[:5]) for row in rows]
+        self.row_of = {row[0]: i for i, row in enumerate(rows)}
+        self.totals = np.array([row[5] for row in rows], dtype=np.int64)
+        self.face = np.array([row[6] for row in rows], dtype=np.int64)
+        self.last_seen = np.array([row[7] for row in rows], dtype=np.int64)
+
+        times, detected = snapshot['times'], snapshot['detected']
+        if times.shape[1] != self.ring_size:
+            times, detected = self._resize_rings(times, detected)
+        self.times, self.detected = times, detected
+
+    def _resize_rings(self, times, detected):
+        # ATTENTION_RING_SIZE changed since the snapshot: keep the newest frames
+        logger.info(f"Resizing attention rings from {times.shape[1]} to {self.ring_size} frames")
+        new_times = np.zeros((len(times), self.ring_size), dtype=np.uint32)
+        new_detected = np.zeros((len(times), self.ring_size), dtype=np.uint8)
+        old_size = times.shape[1]
+        for i, total in enumerate(self.totals.tolist()):
+            count = min(total, old_size)
+            order = (np.arange(count) + (total - count)) % old_size
+            keep = order[-self.ring_size:]
+            slots = (np.arange(len(keep)) + (total - len(keep))) % self.ring_size
+            new_times[i, slots] = times[i, keep]
+            new_detected[i, slots] = detected[i, keep]
+        return new_times, new_detected
+
+    def add(self, pid, session_id, participant_id, name, start_wall):
+        """Add a participant defined in the meta log after the snapshot"""
+        if pid in self.row_of:
+            return
+        self.row_of[pid] = len(self.rows)
+        self.rows.append([pid, session_id, participant_id, name, start_wall])
+
+    def _grow(self):
+        # Give rows added from the meta log their (empty) ring arrays in one go
+        missing = len(self.rows) - len(self.totals)
+        if missing <= 0:
+            return
+        self.times = np.vstack((self.times, np.zeros((missing, self.ring_size), dtype=np.uint32)))
+        self.detected = np.vstack((self.detected, np.zeros((missing, self.ring_size), dtype=np.uint8)))
+        self.totals = np.concatenate((self.totals, np.zeros(missing, dtype=np.int64)))
+        self.face = np.concatenate((self.face, np.zeros(missing, dtype=np.int64)))
+        self.last_seen = np.concatenate((self.last_seen, np.zeros(missing, dtype=np.int64)))
+
+    def apply_frames(self, records):
+        """Scatter logged frame records into the rings; returns how many applied"""
+        self._grow()
+        if not len(records) or not self.row_of:
+            return 0
+
+        # Map participant ids to rows; records of unknown ids are ignored
+        max_pid = max(int(records['pid'].max()), max(self.row_of))
+        pid_to_row = np.full(max_pid + 1, -1, dtype=np.int64)
+        pid_to_row[list(self.row_of)] = list(self.row_of.values())
+        rows = pid_to_row[records['pid']]
+        known = rows >= 0
+        records, rows = records[known], rows[known]
+        if not len(records):
+            return 0
+
+        # Stable sort keeps each participant's frames in log order
+        order = np.argsort(rows, kind='stable')
+        records, rows = records[order], rows[order]
+        unique_rows, starts, counts = np.unique(rows, return_index=True, return_counts=True)
+        rank = np.arange(len(rows)) - np.repeat(starts, counts)
+        group_counts = np.repeat(counts, counts)
+
+        # Only the newest ring_size frames per participant survive in the ring
+        keep = rank >= group_counts - self.ring_size
+        slots = (self.totals[rows[keep]] + rank[keep]) % self.ring_size
+        self.times[rows[keep], slots] = records['t'][keep]
+        self.detected[rows[keep], slots] = records['d'][keep]
+
+        self.totals[unique_rows] += counts
+        self.face += np.bincount(rows, weights=records['d'], minlength=len(self.face)).astype(np.int64)
+        self.last_seen[unique_rows] = records['t'][starts + counts - 1]
+        return len(records)
+
+    def build(self, windows, resets, removed):
+        """Create ParticipantState records and the attention_data mapping"""
+        self._grow()
+        ring_size = self.ring_size
+        filled = np.minimum(self.totals, ring_size)
+        valid = np.arange(ring_size)[None, :] < filled[:, None]
+        hit = valid & (self.detected > 0)
+        window_counts = []
+        for seconds in windows:
+            cutoff = np.maximum(self.last_seen - seconds * 1000, 0).astype(np.uint32)
+            in_window = self.times >= cutoff[:, None]
+            window_counts.append(((in_window & valid).sum(axis=1), (in_window & hit).sum(axis=1)))
+        counts_by_row = list(zip(*[zip(frames.tolist(), hits.tolist()) for frames, hits in window_counts]))
+        totals, face, last_seen = self.totals.tolist(), self.face.tolist(), self.last_seen.tolist()
+
+        attention_data = {}
+        # Ids are allocated in creation order, so sorting by id keeps sessions
+        # and participants in the order they originally appeared
+        for i in sorted(range(len(self.rows)), key=lambda i: self.rows[i][0]):
+            pid, session_id, participant_id, name, start_wall = self.rows[i]
+            if pid in removed or any(
+                    pid <= max_pid and (reset_session is None or reset_session == session_id)
+                    for reset_session, max_pid in resets):
+                continue
+            participant = ParticipantState.restore(
+                name, start_wall, totals[i], face[i], last_seen[i],
+                # Copy the rows so evicting a participant later frees its memory
+                self.times[i].copy(), self.detected[i].copy(), windows, counts_by_row[i])
+            participant.store_id = pid
+            attention_data.setdefault(session_id, {})[participant_id] = participant
+        return attention_data
@@ -0,0 +1,464 @@
+"""Offline batch analysis of recorded sessions.
+
+Re-scores recorded video files and directories of captured frames with the
+detector and attention bookkeeping the live service uses, and writes the
+result in the /session/{session_id}/report shape:
+
+    python server.py batch alice=alice.mp4 bob=captures/bob/ --session class-42 --output class-42.json
+
+Every source is one participant (the id before '=', by default the file or
+directory name). Sources are cut into segments of --segment-seconds of
+footage that run in a process pool; each worker opens, seeks and decodes
+its own segment, so frames never cross process boundaries. --fps samples
+the footage at the rate the live client sends frames (0 analyzes every
+frame); frames in between are only grabbed, never converted. Within a
+segment, face tracking and change detection work as they do for a live
+participant.
+
+Finished segments are checkpointed (by default next to --output), so an
+interrupted run resumes where it stopped; the checkpoint is removed once
+the report is written. Per-frame results are then replayed in order into
+ParticipantState at their media timestamps, so lifetime and sliding-window
+scores match a live session streamed at the sampled rate.
+"""
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import math
+import os
+import sys
+import time
+import zipfile
+from collections import Counter
+
+import cv2
+import numpy as np
+
+from config import env_bool, env_float, env_int, env_str
+from detection_engine import BACKENDS, DetectionEngine, detect_frame
+from detectors import create_detector
+from participants import DEFAULT_RING_SIZE, ParticipantState, parse_windows
+from reports import ReportAggregates, session_report_payload
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png', '*.bmp')
+DEFAULT_SAMPLE_FPS = 2.0  # What the live client sends
+DEFAULT_SEGMENT_SECONDS = 120.0
+FALLBACK_VIDEO_FPS = 25.0
+
+
+def tracking_settings():
+    """Face tracking and change detection settings, from the same env vars as the live service"""
+    return {
+        'tracking': env_bool('FACE_TRACKING', True),
+        'full_scan_interval': max(1, env_int('TRACKING_FULL_SCAN_INTERVAL', 10)),
+        'tracking_margin': env_float('TRACKING_MARGIN', 0.5),
+        'change_detection': env_bool('CHANGE_DETECTION', True),
+        'change_threshold': env_float('CHANGE_THRESHOLD', 2.0),
+        'change_refresh_frames': max(1, env_int('CHANGE_REFRESH_FRAMES', 10)),
+        'thumbnail_size': max(4, env_int('CHANGE_THUMBNAIL_SIZE', 16))
+    }
+
+
+class FrameTracker:
+    """Per-segment tracking state, kept the way the service keeps it per participant"""
+
+    __slots__ = ('settings', 'last_face', 'last_faces', 'frames_since_full_scan', 'thumbnail',
+                 'unchanged_frames', 'scans')
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.last_face = None
+        self.last_faces = None
+        self.frames_since_full_scan = 0
+        self.thumbnail = None
+        self.unchanged_frames = 0
+        self.scans = Counter()
+
+    def options(self, options):
+        """Add ROI and change-detection hints for the next frame to its detector options"""
+        settings = self.settings
+        if settings['change_detection']:
+            options['thumbnail_size'] = settings['thumbnail_size']
+            if self.thumbnail is not None and self.unchanged_frames < settings['change_refresh_frames']:
+                options['previous_thumbnail'] = self.thumbnail
+                options['change_threshold'] = settings['change_threshold']
+        if (settings['tracking'] and self.last_face
+                and self.frames_since_full_scan < settings['full_scan_interval']):
+            options['roi'] = self.last_face
+            options['roi_margin'] = settings['tracking_margin']
+        return options
+
+    def update(self, detection):
+        """Take in a detection result; returns the faces the frame counts as having"""
+        scan = detection.get('scan', 'full')
+        self.scans[scan] += 1
+        if scan == 'skip':
+            self.unchanged_frames += 1
+            return self.last_faces or []
+        faces = detection['faces']
+        self.thumbnail = detection.get('thumbnail')
+        self.last_faces = faces
+        self.unchanged_frames = 0
+        self.frames_since_full_scan = self.frames_since_full_scan + 1 if scan == 'roi' else 0
+        self.last_face = max(faces, key=lambda f: f[2] * f[3])[:4] if faces else None
+        return faces
+
+
+class Segment:
+    """One pool job: frames [start, stop) of a source, every step-th one analyzed
+
+    stop is None for the last segment of a video, which reads to the end
+    (container frame counts are not always exact). Image directories carry
+    the sampled paths themselves.
+    """
+
+    __slots__ = ('key', 'path', 'paths', 'start', 'stop', 'step', 'fps', 'settings')
+
+    def __init__(self, key, path, paths, start, stop, step, fps, settings):
+        self.key = key
+        self.path = path
+        self.paths = paths
+        self.start = start
+        self.stop = stop
+        self.step = step
+        self.fps = fps
+        self.settings = settings
+
+
+def _segment_frames(segment):
+    """Yield (frame index, payload, detector options) for a segment's sampled frames"""
+    if segment.paths is not None:
+        for offset, path in enumerate(segment.paths):
+            with open(path, 'rb') as f:
+                yield segment.start + offset * segment.step, f.read(), {}
+        return
+
+    capture = cv2.VideoCapture(segment.path)
+    try:
+        if segment.start:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, segment.start)
+        index = segment.start
+        while segment.stop is None or index < segment.stop:
+            if (index - segment.start) % segment.step:
+                if not capture.grab():
+                    break
+            else:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                # Already decoded: hand the pixels over as a raw frame
+                yield index, frame.reshape(-1), {'format': 'bgr' if frame.ndim == 3 else 'gray',
+                                                 'width': frame.shape[1], 'height': frame.shape[0]}
+            index += 1
+    finally:
+        capture.release()
+
+
+def analyze_segment(segment):
+    """Detect faces in one segment's sampled frames. Runs inside a pool worker."""
+    tracker = FrameTracker(segment.settings)
+    times_ms, detected = [], []
+    undecodable = 0
+    last_index = segment.start - 1
+    for index, payload, options in _segment_frames(segment):
+        last_index = index
+        detection = detect_frame(payload, tracker.options(options))
+        if not detection['decoded']:
+            undecodable += 1
+            continue
+        faces = tracker.update(detection)
+        times_ms.append(round(index * 1000 / segment.fps))
+        detected.append(1 if faces else 0)
+    stop = segment.stop if segment.stop is not None else last_index + segment.step
+    return {
+        'times_ms': np.array(times_ms, dtype=np.uint32),
+        'detected': np.array(detected, dtype=np.uint8),
+        'media_seconds': max(0, stop - segment.start) / segment.fps,
+        'undecodable': undecodable,
+        'scans': dict(tracker.scans)
+    }
+
+
+class BatchSource:
+    """A video file or a directory of images, analyzed as one participant"""
+
+    def __init__(self, spec, sample_fps, image_fps):
+        participant_id, path = '', spec
+        if '=' in spec and not os.path.exists(spec):
+            participant_id, path = spec.split('=', 1)
+        self.path = os.path.abspath(path)
+        self.participant_id = participant_id or os.path.splitext(os.path.basename(self.path.rstrip(os.sep)))[0]
+
+        if os.path.isdir(self.path):
+            self.paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(self.path, pattern)))
+            if not self.paths:
+                raise ValueError(f"No images ({', '.join(IMAGE_PATTERNS)}) in {path}")
+            self.fps = image_fps
+            self.frame_count = len(self.paths)
+            self.started_at = os.path.getmtime(self.paths[0])
+        else:
+            capture = cv2.VideoCapture(self.path)
+            try:
+                if not capture.isOpened():
+                    raise ValueError(f"Cannot open {path} as a video")
+                fps = capture.get(cv2.CAP_PROP_FPS)
+                count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+            finally:
+                capture.release()
+            if not fps or not math.isfinite(fps) or fps <= 0:
+                logger.warning(f"{path} does not report a frame rate, assuming {FALLBACK_VIDEO_FPS:g} fps")
+                fps = FALLBACK_VIDEO_FPS
+            self.paths = None
+            self.fps = fps
+            self.frame_count = count if count > 0 else None
+            # The file was last written when the recording ended
+            self.started_at = os.path.getmtime(self.path) - (self.frame_count or 0) / self.fps
+
+        self.step = max(1, round(self.fps / sample_fps)) if sample_fps > 0 else 1
+        stat = os.stat(self.path)
+        self.identity = [self.path, stat.st_size, stat.st_mtime_ns, self.frame_count]
+
+    @property
+    def sample_rate(self):
+        return self.fps / self.step
+
+    def segments(self, segment_seconds, settings, fingerprint):
+        # Boundaries fall on sampled frames, so the frames analyzed do not
+        # depend on how the source is cut
+        length = max(1, round(segment_seconds * self.sample_rate)) * self.step
+        starts = range(0, self.frame_count, length) if self.frame_count else [0]
+        for start in starts:
+            stop = start + length if self.frame_count and start + length < self.frame_count else None
+            paths = None
+            if self.paths is not None:
+                stop = min(start + length, self.frame_count)
+                paths = self.paths[start:stop:self.step]
+            key = hashlib.sha1(json.dumps(
+                [self.identity, start, stop, self.step, self.fps, settings, fingerprint], sort_keys=True
+            ).encode()).hexdigest()[:20]
+            yield Segment(key, self.path, paths, start, stop, self.step, self.fps, settings)
+
+
+class BatchCheckpoint:
+    """Finished segment results on disk, one .npz per segment keyed by everything that shaped it
+
+    Keys cover the source file, the cut, the sampling and the detector
+    settings, so results from a run with other settings are never reused.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'segment-{key}.npz')
+
+    def load(self, key):
+        try:
+            with np.load(self._path(key)) as data:
+                return {
+                    'times_ms': data['times_ms'],
+                    'detected': data['detected'],
+                    'media_seconds': float(data['media_seconds']),
+                    'undecodable': int(data['undecodable']),
+                    'scans': json.loads(str(data['scans']))
+                }
+        except FileNotFoundError:
+            return None
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+            logger.warning(f"Ignoring unreadable checkpoint for segment {key}: {e}")
+            return None
+
+    def save(self, key, result):
+        path = self._path(key)
+        with open(f'{path}.tmp', 'wb') as f:
+            np.savez(f, times_ms=result['times_ms'], detected=result['detected'],
+                     media_seconds=result['media_seconds'], undecodable=result['undecodable'],
+                     scans=json.dumps(result['scans']))
+        os.replace(f'{path}.tmp', path)
+
+    def remove(self):
+        for path in glob.glob(os.path.join(self.directory, 'segment-*')):
+            os.remove(path)
+        try:
+            os.rmdir(self.directory)
+        except OSError:
+            pass
+
+
+def _duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes // 60}:{minutes % 60:02d}:{seconds:02d}"
+
+
+async def analyze_segments(engine, segments, checkpoint):
+    """Run every segment not already checkpointed through the pool; returns {key: result}"""
+    results = {}
+    pending = []
+    for segment in segments:
+        cached = checkpoint.load(segment.key) if checkpoint is not None else None
+        if cached is not None:
+            results[segment.key] = cached
+        else:
+            pending.append(segment)
+    if results:
+        logger.info(f"♻️ Resuming: {len(results)} of {len(segments)} segments already analyzed")
+
+    started = time.monotonic()
+    media_seconds = 0.0
+    tasks = {asyncio.ensure_future(engine.run(analyze_segment, segment)): segment for segment in pending}
+    remaining = set(tasks)
+    try:
+        while remaining:
+            done, remaining = await asyncio.wait(remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                segment = tasks[task]
+                result = results[segment.key] = task.result()
+                if checkpoint is not None:
+                    checkpoint.save(segment.key, result)
+                media_seconds += result['media_seconds']
+                elapsed = max(time.monotonic() - started, 1e-6)
+                logger.info(f"⏱️ {len(results)}/{len(segments)} segments: {_duration(media_seconds)} of footage "
+                            f"in {_duration(elapsed)} ({media_seconds / elapsed:.1f}x real-time)")
+    finally:
+        for task in remaining:
+            task.cancel()
+    return results
+
+
+def replay(source, segments, results, ring_size, windows):
+    """Feed a source's per-frame results, in order, into a fresh ParticipantState"""
+    participant = ParticipantState(source.participant_id, ring_size, windows, now=0.0)
+    participant.start_wall = source.started_at
+    for segment in segments:
+        result = results[segment.key]
+        for offset_ms, face_detected in zip(result['times_ms'].tolist(), result['detected'].tolist()):
+            participant.record_frame(face_detected, offset_ms / 1000)
+    return participant
+
+
+async def run_batch(args, sources, engine, checkpoint):
+    settings = tracking_settings()
+    fingerprint = {'detector': engine.detector_name, 'decode': engine.decode_settings}
+    cuts = {source.participant_id: list(source.segments(args.segment_seconds, settings, fingerprint))
+            for source in sources}
+    segments = [segment for source_segments in cuts.values() for segment in source_segments]
+    logger.info(f"🎞️ {len(sources)} source(s) in {len(segments)} segments on {engine.workers} "
+                f"{engine.backend} worker(s)")
+
+    started = time.monotonic()
+    engine.start()
+    results = await analyze_segments(engine, segments, checkpoint)
+    elapsed = time.monotonic() - started
+
+    windows = parse_windows(env_str('ATTENTION_WINDOWS'))
+    # The ring must hold the longest window at the highest sampling rate for exact window scores
+    ring_size = max(env_int('ATTENTION_RING_SIZE', DEFAULT_RING_SIZE),
+                    math.ceil(max(windows) * max(source.sample_rate for source in sources)))
+    aggregates = ReportAggregates()
+    participants, source_info = [], []
+    for source in sources:
+        source_results = [results[segment.key] for segment in cuts[source.participant_id]]
+        participant = replay(source, cuts[source.participant_id], results, ring_size, windows)
+        aggregates.record(args.session, source.participant_id, 0, participant.attention_score, new_participant=True)
+        participants.append({"participant_id": source.participant_id,
+                             **participant.to_dict(participant.last_seen_mono or 0.0)})
+        scans = Counter()
+        for result in source_results:
+            scans.update(result['scans'])
+        source_info.append({
+            'participant_id': source.participant_id,
+            'path': source.path,
+            'fps': round(source.fps, 3),
+            'step': source.step,
+            'media_seconds': round(sum(r['media_seconds'] for r in source_results), 1),
+            'frames_analyzed': participant.total_frames,
+            'undecodable_frames': sum(r['undecodable'] for r in source_results),
+            'scans': dict(scans)
+        })
+
+    report = session_report_payload(args.session, participants, aggregates.sessions[args.session].overall_score())
+    media_seconds = sum(info['media_seconds'] for info in source_info)
+    report['batch'] = {
+        'sample_fps': args.fps,
+        'segments': len(segments),
+        'detector': engine.detector_name,
+        'workers': engine.workers,
+        'elapsed_seconds': round(elapsed, 1),
+        'media_seconds': round(media_seconds, 1),
+        'sources': source_info
+    }
+    logger.info(f"✅ {_duration(media_seconds)} of footage analyzed in {_duration(elapsed)}")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='server.py batch', description=__doc__.splitlines()[0])
+    parser.add_argument('sources', nargs='+', metavar='[PARTICIPANT=]PATH',
+                        help='video file (anything cv2.VideoCapture opens) or directory of images')
+    parser.add_argument('--session', default='batch', help='session id of the report (default: batch)')
+    parser.add_argument('--fps', type=float, default=DEFAULT_SAMPLE_FPS,
+                        help='frames analyzed per second of footage, 0 for every frame (default: %(default)g)')
+    parser.add_argument('--image-fps', type=float, default=DEFAULT_SAMPLE_FPS,
+                        help='rate image directories were captured at (default: %(default)g)')
+    parser.add_argument('--segment-seconds', type=float, default=DEFAULT_SEGMENT_SECONDS,
+                        help='footage per pool job (default: %(default)g)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='pool size (default: DETECTION_WORKERS, else one per core)')
+    parser.add_argument('--backend', choices=BACKENDS, default='process')
+    parser.add_argument('--output', help='write the report here instead of stdout')
+    parser.add_argument('--checkpoint', help='directory for finished segments (default: OUTPUT.progress)')
+    parser.add_argument('--keep-checkpoint', action='store_true', help='keep the checkpoint after success')
+    args = parser.parse_args(argv)
+    if args.fps < 0 or args.image_fps <= 0 or args.segment_seconds <= 0:
+        parser.error('--fps must be >= 0, --image-fps and --segment-seconds > 0')
+
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    try:
+        sources = [BatchSource(spec, args.fps, args.image_fps) for spec in args.sources]
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    ids = [source.participant_id for source in sources]
+    if len(set(ids)) != len(ids):
+        parser.error(f"Participant ids must be unique, got {', '.join(ids)}; name them with PARTICIPANT=PATH")
+
+    engine = DetectionEngine(backend=args.backend, workers=args.workers or None)
+    # Workers load their own detector; fail here rather than score every frame as faceless
+    detector = create_detector(engine.detector_name)
+    if detector is None:
+        parser.error(f"Face detector '{engine.detector_name or 'haar'}' could not be loaded")
+    engine.detector_name = detector.name
+
+    checkpoint_dir = args.checkpoint or (f'{args.output}.progress' if args.output else None)
+    checkpoint = BatchCheckpoint(checkpoint_dir) if checkpoint_dir else None
+    try:
+        report = asyncio.run(run_batch(args, sources, engine, checkpoint))
+    except KeyboardInterrupt:
+        if checkpoint is not None:
+            logger.warning(f"🛑 Interrupted; finished segments are kept in {checkpoint.directory}")
+        return 130
+    finally:
+        engine.shutdown(cancel_futures=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(f'{args.output}.tmp', 'w') as f:
+            f.write(text + '\n')
+        os.replace(f'{args.output}.tmp', args.output)
+        logger.info(f"📄 Report written to {args.output}")
+    else:
+        print(text)
+    if checkpoint is not None and not args.keep_checkpoint:
+        checkpoint.remove()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
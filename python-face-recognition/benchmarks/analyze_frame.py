@@ -0,0 +1,85 @@
+"""Micro-benchmark of FaceRecognitionService.analyze_frame without the network.
+
+Calls analyze_frame (and analyze_frame_compact, the v2 path) in-process,
+one frame at a time, so the numbers cover decode, detection, scheduling
+and bookkeeping but not WebSocket I/O or queueing behind other clients.
+Cases:
+
+* distinct   - a different frame every call, so every frame is detected
+* repeated   - the same frame every call, the change-detection skip path
+* compact    - distinct frames through the v2 binary result encoder
+
+    python benchmarks/analyze_frame.py --iterations 200 --output micro.json
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from common import load_frames, percentiles, write_result
+
+CASES = ('distinct', 'repeated', 'compact')
+
+
+async def run_case(service, case, frames, iterations):
+    frame_info = {'session_id': f'micro-{case}', 'participant_id': 'p1', 'name': 'Micro', 'channel': 0}
+    # One untimed call creates the participant and warms the detector
+    await service.analyze_frame(dict(frame_info), memoryview(frames[0]))
+
+    timings = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        image = frames[0] if case == 'repeated' else frames[i % len(frames)]
+        info = dict(frame_info, seq=i)
+        start = time.perf_counter()
+        if case == 'compact':
+            await service.analyze_frame_compact(info, memoryview(image))
+        else:
+            await service.analyze_frame(info, memoryview(image))
+        timings.append((time.perf_counter() - start) * 1000)
+    elapsed = time.perf_counter() - started
+    return {'calls_per_second': round(iterations / elapsed, 2), 'latency': percentiles(timings)}
+
+
+async def run(args, frames):
+    # Imported here so the environment set in main() applies to the service
+    from server import service
+
+    service.engine.start()
+    try:
+        results = {}
+        for case in args.cases.split(','):
+            results[case] = await run_case(service, case, frames, args.iterations)
+            print(f"{case:9s} {results[case]['calls_per_second']:>8.1f} calls/s   "
+                  f"p50 {results[case]['latency']['p50_ms']:.2f} ms   p99 {results[case]['latency']['p99_ms']:.2f} ms")
+        results['stages'] = service.metrics.summary()['stages']
+        results['detection_engine'] = service.engine.info()
+        return results
+    finally:
+        service.engine.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--cases', default=','.join(CASES))
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--quality', type=int, default=80)
+    parser.add_argument('--frames', help='directory of images or a video file (default: synthetic)')
+    parser.add_argument('--output', help='write the JSON result here')
+    args = parser.parse_args()
+    unknown = set(args.cases.split(',')) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+
+    # Keep the durable store out of the measurement
+    os.environ.setdefault('ATTENTION_STORE', 'false')
+    frames = load_frames(args.frames, args.width, args.height, args.quality)
+    results = asyncio.run(run(args, frames))
+    write_result(args.output, 'analyze_frame', {key: value for key, value in vars(args).items()
+                                                if key != 'output'}, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+"""Shared pieces of the benchmark scripts: test frames, a local server
+process, CPU/RSS sampling, percentiles and the JSON result envelope.
+
+Every script writes the same envelope so results can be diffed across
+releases with compare.py:
+
+    {"schema": 1, "kind": "...", "created_at": "...", "environment": {...},
+     "config": {...}, "results": {...}}
+"""
+import glob
+import json
+import os
+import platform
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+SCHEMA_VERSION = 1
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png', '*.bmp')
+
+
+def synthetic_frame(width, height, seed=0):
+    """A BGR test card with enough texture that JPEG does not compress it to nothing"""
+    rng = np.random.default_rng(seed)
+    image = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(image, (9, 9), 0)
+
+
+def _moving_frame(width, height, index, count):
+    # Texture alone looks the same at thumbnail scale; a large shape that
+    # moves across the frame makes consecutive frames genuinely different
+    image = synthetic_frame(width, height, index)
+    radius = max(8, min(width, height) // 5)
+    x = radius + (width - 2 * radius) * index // max(1, count - 1)
+    cv2.circle(image, (x, height // 2), radius, (40, 40, 40), -1)
+    return image
+
+
+def _read_images(source, limit):
+    if os.path.isdir(source):
+        paths = sorted(path for pattern in IMAGE_PATTERNS for path in glob.glob(os.path.join(source, pattern)))
+        for path in paths[:limit]:
+            image = cv2.imread(path, cv2.IMREAD_COLOR)
+            if image is not None:
+                yield image
+        return
+
+    capture = cv2.VideoCapture(source)
+    try:
+        count = 0
+        while count < limit:
+            ok, image = capture.read()
+            if not ok:
+                break
+            yield image
+            count += 1
+    finally:
+        capture.release()
+
+
+def load_frames(source=None, width=640, height=480, quality=80, count=30):
+    """JPEG-encoded test frames at width x height
+
+    source is a directory of images or a video file (anything
+    cv2.VideoCapture opens); without one, `count` distinct synthetic frames
+    are generated so change detection cannot skip them all.
+    """
+    if source:
+        images = list(_read_images(source, count))
+        if not images:
+            raise SystemExit(f"No frames could be read from {source}")
+    else:
+        images = [_moving_frame(width, height, seed, count) for seed in range(count)]
+
+    frames = []
+    for image in images:
+        if image.shape[1] != width or image.shape[0] != height:
+            image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+        frames.append(cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+    return frames
+
+
+def percentiles(values_ms):
+    """count/mean/p50/p90/p95/p99/max of a list of milliseconds"""
+    if not values_ms:
+        return {'count': 0}
+    values = np.asarray(values_ms, dtype=np.float64)
+    p50, p90, p95, p99 = np.percentile(values, [50, 90, 95, 99])
+    return {
+        'count': int(values.size),
+        'mean_ms': round(float(values.mean()), 3),
+        'p50_ms': round(float(p50), 3),
+        'p90_ms': round(float(p90), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'max_ms': round(float(values.max()), 3)
+    }
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class ServerProcess:
+    """Runs server.py on free ports with a throwaway attention store"""
+
+    def __init__(self, env=None, startup_timeout=60.0):
+        self.http_port = free_port()
+        self.ws_port = free_port()
+        self.store_dir = tempfile.mkdtemp(prefix='face-bench-')
+        self.env = dict(os.environ, HTTP_PORT=str(self.http_port), WS_PORT=str(self.ws_port),
+                        ATTENTION_STORE_DIR=self.store_dir, PYTHONUNBUFFERED='1',
+                        WS_UNIX_SOCKET=os.path.join(self.store_dir, 'ws.sock'))
+        self.env.update(env or {})
+        self.startup_timeout = startup_timeout
+        self.process = None
+        self.log = None
+
+    @property
+    def http_url(self):
+        return f'http://127.0.0.1:{self.http_port}'
+
+    @property
+    def ws_url(self):
+        return f'ws://127.0.0.1:{self.ws_port}'
+
+    @property
+    def ws_unix_socket(self):
+        return self.env.get('WS_UNIX_SOCKET')
+
+    def __enter__(self):
+        self.log = open(os.path.join(self.store_dir, 'server.log'), 'w')
+        self.process = subprocess.Popen([sys.executable, 'server.py'], cwd=SERVICE_DIR, env=self.env,
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise SystemExit(f"Server exited during startup; see {self.log.name}")
+            try:
+                urllib.request.urlopen(f'{self.http_url}/ready', timeout=1)
+                return self
+            except OSError:
+                time.sleep(0.1)
+        self.__exit__()
+        raise SystemExit(f"Server did not start within {self.startup_timeout:.0f}s; see {self.log.name}")
+
+    def __exit__(self, *exc):
+        if self.process is not None and self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self.log is not None:
+            self.log.close()
+
+
+def get_json(url, timeout=10):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+class ProcessSampler:
+    """CPU and RSS of a process tree (e.g. the server and its detection pool)
+
+    Reads /proc, so samples are only collected on Linux; elsewhere
+    summary() reports the sampler as unavailable.
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.available = os.path.isdir(f'/proc/{pid}')
+        self.ticks = os.sysconf('SC_CLK_TCK') if self.available else 100
+        self.page_size = os.sysconf('SC_PAGE_SIZE') if self.available else 4096
+        self.samples = []
+        self._last = None
+
+    def _tree(self):
+        # pid -> parent pid for every process, to find the server's children
+        parents = {}
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                try:
+                    with open(f'/proc/{entry}/stat') as f:
+                        parents[int(entry)] = int(f.read().rsplit(')', 1)[1].split()[1])
+                except (OSError, IndexError, ValueError):
+                    continue
+        tree, frontier = {self.pid}, [self.pid]
+        while frontier:
+            parent = frontier.pop()
+            children = [pid for pid, ppid in parents.items() if ppid == parent and pid not in tree]
+            tree.update(children)
+            frontier.extend(children)
+        return tree
+
+    def _usage(self):
+        cpu_ticks, rss_pages = 0, 0
+        for pid in self._tree():
+            try:
+                with open(f'/proc/{pid}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+                cpu_ticks += int(fields[11]) + int(fields[12])  # utime + stime
+                with open(f'/proc/{pid}/statm') as f:
+                    rss_pages += int(f.read().split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+        return cpu_ticks / self.ticks, rss_pages * self.page_size
+
+    def sample(self, elapsed):
+        """Record one sample at `elapsed` seconds into the run"""
+        if not self.available:
+            return
+        now = time.monotonic()
+        cpu_seconds, rss = self._usage()
+        if self._last is not None:
+            last_time, last_cpu = self._last
+            self.samples.append({
+                't': round(elapsed, 2),
+                'cpu_percent': round((cpu_seconds - last_cpu) / max(now - last_time, 1e-6) * 100, 1),
+                'rss_mb': round(rss / 1048576, 1)
+            })
+        self._last = (now, cpu_seconds)
+
+    def summary(self):
+        if not self.available:
+            return {'available': False}
+        cpu = [s['cpu_percent'] for s in self.samples] or [0.0]
+        rss = [s['rss_mb'] for s in self.samples] or [0.0]
+        return {
+            'available': True,
+            'cpu_percent_mean': round(sum(cpu) / len(cpu), 1),
+            'cpu_percent_max': max(cpu),
+            'rss_mb_max': max(rss),
+            'rss_mb_end': rss[-1]
+        }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVICE_DIR, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment_info():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'git_revision': git_revision()
+    }
+
+
+def write_result(path, kind, config, results):
+    """Wrap results in the common envelope, print it and optionally save it"""
+    document = {
+        'schema': SCHEMA_VERSION,
+        'kind': kind,
+        'created_at': datetime.now().isoformat(),
+        'environment': environment_info(),
+        'config': config,
+        'results': results
+    }
+    text = json.dumps(document, indent=2)
+    if path:
+        with open(path, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+    return document
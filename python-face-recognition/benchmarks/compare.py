@@ -0,0 +1,84 @@
+"""Compare two benchmark result files and flag regressions.
+
+Walks the numeric fields of both "results" objects and prints every
+metric whose direction is known (latencies, CPU, memory and drop rates
+should go down; throughput should go up) with its relative change. Exits
+with status 1 if any metric got worse by more than --threshold, so it
+can gate a release in CI.
+
+    python benchmarks/compare.py baseline.json candidate.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+# Substrings of a metric's path that say which way is better
+LOWER_IS_BETTER = ('_ms', 'rss_mb', 'cpu_percent', 'drop_rate', 'shed_rate', 'errors', 'bytes')
+HIGHER_IS_BETTER = ('throughput', 'calls_per_second', 'completed')
+# Lists (time series), sample counts and single-sample maxima are too noisy to gate on
+SKIPPED = ('timeline', 'resource_samples', 'client_failures', 'count', 'max_ms')
+
+
+def flatten(value, prefix=''):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from flatten(item, f'{prefix}.{key}' if prefix else key)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        yield prefix, value
+
+
+def direction(path):
+    leaf = path.rsplit('.', 1)[-1]
+    if any(part in SKIPPED for part in path.split('.')) or leaf in SKIPPED:
+        return None
+    if any(token in path for token in HIGHER_IS_BETTER):
+        return 1
+    if any(token in path for token in LOWER_IS_BETTER):
+        return -1
+    return None
+
+
+def compare(baseline, candidate, threshold):
+    base = dict(flatten(baseline['results']))
+    rows, regressions = [], []
+    for path, new in flatten(candidate['results']):
+        sign = direction(path)
+        old = base.get(path)
+        if sign is None or old is None:
+            continue
+        change = (new - old) / abs(old) if old else (0.0 if new == old else float('inf'))
+        worse = -sign * change > threshold
+        rows.append((path, old, new, change, worse))
+        if worse:
+            regressions.append(path)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative change counted as a regression (default 0.10 = 10%%)')
+    parser.add_argument('--all', action='store_true', help='print unchanged metrics too')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    if baseline.get('kind') != candidate.get('kind'):
+        sys.exit(f"Cannot compare a {baseline.get('kind')} result with a {candidate.get('kind')} result")
+
+    rows, regressions = compare(baseline, candidate, args.threshold)
+    print(f"{baseline['environment'].get('git_revision')} -> {candidate['environment'].get('git_revision')} "
+          f"({baseline['kind']}, threshold {args.threshold:.0%})")
+    for path, old, new, change, worse in rows:
+        if args.all or abs(change) > args.threshold:
+            print(f"{'REGRESSION ' if worse else '           '}{path:60s} {old:>12.3f} -> {new:>12.3f}  {change:+.1%}")
+    print(f"{len(regressions)} regression(s) in {len(rows)} compared metrics")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Bytes allocated per frame on the ingestion path, before and after zero-copy decoding.
+
+"before" repeats what process_binary_message and the decoder used to do:
+slice the payload out of the message (a full copy) and let every
+cvtColor/resize allocate a fresh output. "after" is the current path: a
+memoryview of the message and FrameDecoder's reusable scratch buffers.
+
+Allocations are measured with tracemalloc, which sees NumPy and OpenCV
+array data as well as Python objects; the figure reported is the peak
+extra memory held while one frame is ingested and decoded.
+
+    python benchmarks/ingest_alloc.py --width 1280 --height 720 --frames 200
+"""
+import argparse
+import json
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from common import synthetic_frame
+from frame_decode import FrameDecoder
+
+HEADER = b'{"participant_id": "bench", "session_id": "bench", "name": "Bench"}\n'
+
+
+def payload(image, frame_format):
+    if frame_format == 'jpeg':
+        return cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes()
+    if frame_format == 'gray':
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY).tobytes()
+    return cv2.cvtColor(image, cv2.COLOR_BGR2YUV_I420).tobytes()
+
+
+def legacy_ingest(message, options, color, scale):
+    header_end = message.find(b'\n')
+    json.loads(message[:header_end].decode('utf-8'))
+    image_data = message[header_end + 1:]
+    frame_format = options['format']
+    if frame_format == 'jpeg':
+        flags = cv2.IMREAD_COLOR if color else cv2.IMREAD_GRAYSCALE
+        image = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), flags)
+        if scale > 1:
+            image = cv2.resize(image, (image.shape[1] // scale, image.shape[0] // scale),
+                               interpolation=cv2.INTER_AREA)
+        return image
+    width, height = options['width'], options['height']
+    buffer = np.frombuffer(image_data, dtype=np.uint8)
+    if frame_format == 'gray':
+        image = buffer[:width * height].reshape(height, width)
+        if color:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    elif color:
+        image = cv2.cvtColor(buffer.reshape(height * 3 // 2, width), cv2.COLOR_YUV2BGR_I420)
+    else:
+        image = buffer[:width * height].reshape(height, width)
+    if scale > 1:
+        image = cv2.resize(image, (width // scale, height // scale), interpolation=cv2.INTER_AREA)
+    return image
+
+
+def zero_copy_ingest(decoder, message, options, color, detector_min_face):
+    header_end = message.find(b'\n')
+    json.loads(message[:header_end].decode('utf-8'))
+    image_data = memoryview(message)[header_end + 1:]
+    return decoder.decode(image_data, options, color, detector_min_face)[0]
+
+
+def measure(ingest, frames):
+    """Mean and max peak bytes allocated per call, after one warm-up call"""
+    ingest()
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(frames):
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            image = ingest()
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+            del image
+    finally:
+        tracemalloc.stop()
+    return {'mean_bytes': int(sum(peaks) / len(peaks)), 'max_bytes': max(peaks)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--formats', default='jpeg,gray,yuv420')
+    parser.add_argument('--color', action='store_true', help='decode to BGR as the DNN detectors need')
+    parser.add_argument('--scale', type=int, default=2, help='fixed decode scale (1, 2, 4 or 8)')
+    args = parser.parse_args()
+
+    image = synthetic_frame(args.width, args.height)
+    decoder = FrameDecoder(scale=args.scale)
+    results = {}
+    for frame_format in args.formats.split(','):
+        data = payload(image, frame_format)
+        message = HEADER + data
+        options = {'format': frame_format, 'width': args.width, 'height': args.height}
+        before = measure(lambda: legacy_ingest(message, options, args.color, args.scale), args.frames)
+        after = measure(lambda: zero_copy_ingest(decoder, message, options, args.color, 1), args.frames)
+        results[frame_format] = {'payload_bytes': len(data), 'before': before, 'after': after}
+        print(f"{frame_format:7s} payload {len(data):>9,d} B   "
+              f"before {before['mean_bytes']:>10,d} B/frame   after {after['mean_bytes']:>10,d} B/frame")
+
+    print(json.dumps({'width': args.width, 'height': args.height, 'color': args.color,
+                      'scale': args.scale, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
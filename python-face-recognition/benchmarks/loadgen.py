@@ -0,0 +1,277 @@
+"""Load generator: many simulated WebSocket clients against a local service.
+
+Starts server.py on free ports (or targets --ws-url/--http-url), connects
+--clients participants spread over --sessions sessions and has each send
+JPEG frames at --fps, using either the JSON-header protocol (v1) or the
+binary channel protocol (v2), over TCP, the local Unix socket or a
+shared-memory frame ring (--transport). After --warmup seconds it
+measures for --duration seconds and reports:
+
+* throughput (results per second) and what happened to every frame sent:
+  completed, shed by admission control, failed, or dropped (never
+  answered: superseded in the latest-frame-wins mailbox);
+* end-to-end latency percentiles measured by the clients, and the
+  server's own per-stage percentiles from /stats (cumulative since the
+  server started, so they include the warm-up);
+* CPU and RSS of the server process tree over time, and a per-second
+  timeline of throughput and latency.
+
+    python benchmarks/loadgen.py --clients 20 --fps 2 --duration 30 --output before.json
+    python benchmarks/compare.py before.json after.json
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+
+import websockets
+
+from common import ProcessSampler, ServerProcess, get_json, load_frames, percentiles, write_result
+from frame_ring import SLOT_HEADER_BYTES, FrameRingWriter
+from protocol import FRAME_HEADER, PROTOCOL_V2, RESULT_HEADER, RESULT_PREFIX, STATUS_OK, STATUS_OVERLOADED
+
+
+class RunStats:
+    """Frame outcomes and latencies gathered by every client during the measured window"""
+
+    def __init__(self, measure_from, measure_to):
+        self.measure_from = measure_from
+        self.measure_to = measure_to
+        self.sent = 0
+        self.completed = 0
+        self.shed = 0
+        self.errors = 0
+        self.faces = 0
+        self.latencies_ms = []
+        self.buckets = defaultdict(list)
+
+    def measured(self, sent_at):
+        return self.measure_from <= sent_at < self.measure_to
+
+    def on_sent(self, sent_at):
+        if self.measured(sent_at):
+            self.sent += 1
+
+    def on_answer(self, sent_at, outcome, faces=0):
+        if sent_at is None or not self.measured(sent_at):
+            return
+        now = time.monotonic()
+        if outcome == 'shed':
+            self.shed += 1
+        elif outcome == 'error':
+            self.errors += 1
+        else:
+            latency_ms = (now - sent_at) * 1000
+            self.completed += 1
+            self.faces += 1 if faces else 0
+            self.latencies_ms.append(latency_ms)
+            self.buckets[int(now - self.measure_from)].append(latency_ms)
+
+    def timeline(self):
+        return [
+            {'t': second, 'completed': len(values),
+             'p50_ms': percentiles(values)['p50_ms'], 'p95_ms': percentiles(values)['p95_ms']}
+            for second, values in sorted(self.buckets.items())
+        ]
+
+
+def connect(args, ws_url):
+    if args.transport == 'tcp':
+        return websockets.connect(ws_url, max_size=None)
+    return websockets.unix_connect(args.ws_unix_socket, max_size=None)
+
+
+async def run_client(index, args, frames, ws_url, stats, start_at):
+    participant_id = f'bench-{index}'
+    session_id = f'bench-s{index % args.sessions}'
+    interval = 1.0 / args.fps
+    in_flight = {}
+
+    async with connect(args, ws_url) as ws:
+        ring = None
+        if args.transport == 'ring':
+            # Enough slots that a frame is answered long before its slot comes round again
+            ring = FrameRingWriter(slots=args.ring_slots,
+                                   slot_bytes=max(map(len, frames)) + 1024 + SLOT_HEADER_BYTES)
+            await ws.send(ring.attach_message())
+            reply = json.loads(await ws.recv())
+            if reply.get('type') != 'ring_attached':
+                ring.close()
+                raise RuntimeError(reply.get('error', reply))
+        channel = None
+        if args.protocol == 'v2':
+            await ws.send(json.dumps({'type': 'hello', 'protocol': PROTOCOL_V2, 'session_id': session_id,
+                                      'participant_id': participant_id, 'name': participant_id}))
+            while channel is None:
+                reply = json.loads(await ws.recv())
+                if reply.get('type') == 'hello_error':
+                    raise RuntimeError(reply['error'])
+                if reply.get('type') == 'hello_ack':
+                    channel = reply['channel']
+
+        async def receive():
+            nonlocal interval
+            async for message in ws:
+                if isinstance(message, bytes):
+                    _, status, _, seq = RESULT_PREFIX.unpack_from(message)
+                    faces = RESULT_HEADER.unpack_from(message)[4] if status == STATUS_OK else 0
+                    outcome = 'ok' if status == STATUS_OK else 'shed' if status == STATUS_OVERLOADED else 'error'
+                    stats.on_answer(in_flight.pop(seq, None), outcome, faces)
+                    continue
+                reply = json.loads(message)
+                pacing = reply.get('pacing') if reply.get('type') != 'pacing' else reply
+                if args.follow_pacing and pacing:
+                    interval = pacing['frame_interval_ms'] / 1000
+                if reply.get('type') == 'pacing':
+                    continue
+                if reply.get('type') == 'ring_error':
+                    raise RuntimeError(reply['error'])
+                sent_at = in_flight.pop(reply.get('frame_id'), None)
+                if reply.get('type') == 'overloaded':
+                    stats.on_answer(sent_at, 'shed')
+                elif 'error' in reply:
+                    stats.on_answer(sent_at, 'error')
+                else:
+                    stats.on_answer(sent_at, 'ok', reply.get('faces_detected'))
+
+        receiver = asyncio.create_task(receive())
+        # Spread clients over the interval so they do not all send in lockstep
+        next_send = start_at + interval * index / args.clients
+        seq = 0
+        try:
+            while next_send < stats.measure_to:
+                await asyncio.sleep(max(0.0, next_send - time.monotonic()))
+                image = frames[(index + seq) % len(frames)]
+                if channel is not None:
+                    message = FRAME_HEADER.pack(PROTOCOL_V2, 0, channel, seq, 0, 0) + image
+                else:
+                    header = {'participant_id': participant_id, 'session_id': session_id,
+                              'name': participant_id, 'frame_id': seq}
+                    message = json.dumps(header).encode() + b'\n' + image
+                sent_at = time.monotonic()
+                in_flight[seq] = sent_at
+                stats.on_sent(sent_at)
+                await ws.send(message if ring is None else ring.frame_message(ring.write(message)))
+                seq = (seq + 1) & 0xFFFFFFFF
+                next_send += interval
+            # Give frames still being analyzed a chance to come back
+            deadline = time.monotonic() + args.drain
+            while in_flight and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+        finally:
+            receiver.cancel()
+            if ring is not None:
+                ring.close()
+
+
+async def sample_resources(sampler, start, stop_at, interval):
+    while time.monotonic() < stop_at:
+        sampler.sample(time.monotonic() - start)
+        await asyncio.sleep(interval)
+    sampler.sample(time.monotonic() - start)
+
+
+async def run(args, ws_url, http_url, server_pid):
+    frames = load_frames(args.frames, args.width, args.height, args.quality)
+    start_at = time.monotonic() + 0.5
+    stats = RunStats(start_at + args.warmup, start_at + args.warmup + args.duration)
+    sampler = ProcessSampler(server_pid) if server_pid else None
+
+    sampling = None
+    if sampler is not None:
+        sampling = asyncio.create_task(
+            sample_resources(sampler, stats.measure_from, stats.measure_to, args.sample_interval))
+
+    async def server_counters_at(moment):
+        await asyncio.sleep(max(0.0, moment - time.monotonic()))
+        return (await asyncio.to_thread(get_json, f'{http_url}/stats'))['stats']
+
+    before = asyncio.create_task(server_counters_at(stats.measure_from))
+    clients = await asyncio.gather(
+        *(run_client(i, args, frames, ws_url, stats, start_at) for i in range(args.clients)),
+        return_exceptions=True)
+    failures = [repr(c) for c in clients if isinstance(c, BaseException)]
+    before = await before
+    after = (await asyncio.to_thread(get_json, f'{http_url}/stats'))['stats']
+    if sampling is not None:
+        await sampling
+
+    dropped = max(0, stats.sent - stats.completed - stats.shed - stats.errors)
+    results = {
+        'offered_fps': round(args.clients * args.fps, 2),
+        'throughput_fps': round(stats.completed / args.duration, 2),
+        'frames': {
+            'sent': stats.sent,
+            'completed': stats.completed,
+            'shed': stats.shed,
+            'errors': stats.errors,
+            'dropped': dropped,
+            'with_faces': stats.faces
+        },
+        'drop_rate': round(dropped / stats.sent, 4) if stats.sent else 0.0,
+        'shed_rate': round(stats.shed / stats.sent, 4) if stats.sent else 0.0,
+        'latency': {
+            'end_to_end': percentiles(stats.latencies_ms),
+            'server_stages': after.get('latency', {}).get('stages', {}),
+            'event_loop_lag': after.get('latency', {}).get('event_loop_lag', {})
+        },
+        'server': {
+            'frames_received': after['frames_received'] - before['frames_received'],
+            'frames_dropped': after['frames_dropped'] - before['frames_dropped'],
+            'detection_engine': after.get('detection_engine'),
+            'pacing': after.get('pacing', {}).get('recommendation')
+        },
+        'resources': sampler.summary() if sampler is not None else {'available': False},
+        'client_failures': failures,
+        'timeline': stats.timeline(),
+        'resource_samples': sampler.samples if sampler is not None else []
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=10)
+    parser.add_argument('--sessions', type=int, default=1)
+    parser.add_argument('--fps', type=float, default=2.0, help='frames per second per client')
+    parser.add_argument('--duration', type=float, default=30.0, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5.0, help='seconds of load before measuring')
+    parser.add_argument('--drain', type=float, default=5.0, help='seconds to wait for late results')
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--quality', type=int, default=80, help='JPEG quality of the replayed frames')
+    parser.add_argument('--frames', help='directory of images or a video file to replay (default: synthetic)')
+    parser.add_argument('--protocol', choices=('v1', 'v2'), default='v1')
+    parser.add_argument('--transport', choices=('tcp', 'unix', 'ring'), default='tcp',
+                        help='TCP WebSocket, the local Unix socket, or the Unix socket plus a shared-memory ring')
+    parser.add_argument('--ring-slots', type=int, default=16, help='slots per client ring (--transport ring)')
+    parser.add_argument('--follow-pacing', action='store_true', help="obey the server's frame interval")
+    parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE',
+                        help='environment for the spawned server (repeatable)')
+    parser.add_argument('--ws-url', help='use a running service instead of spawning one')
+    parser.add_argument('--http-url', help='HTTP API of the running service (with --ws-url)')
+    parser.add_argument('--ws-unix-socket', help='Unix socket of the running service (with --ws-url)')
+    parser.add_argument('--sample-interval', type=float, default=1.0, help='seconds between CPU/RSS samples')
+    parser.add_argument('--output', help='write the JSON result here')
+    args = parser.parse_args()
+    args.clients = max(1, args.clients)
+    args.sessions = max(1, args.sessions)
+
+    config = {key: value for key, value in vars(args).items() if key != 'output'}
+    if args.ws_url:
+        if not args.http_url:
+            parser.error('--ws-url needs --http-url')
+        if args.transport != 'tcp' and not args.ws_unix_socket:
+            parser.error('--transport unix/ring with --ws-url needs --ws-unix-socket')
+        results = asyncio.run(run(args, args.ws_url, args.http_url, None))
+    else:
+        env = dict(item.split('=', 1) for item in args.server_env)
+        with ServerProcess(env) as server:
+            args.ws_unix_socket = server.ws_unix_socket
+            results = asyncio.run(run(args, server.ws_url, server.http_url, server.process.pid))
+    write_result(args.output, 'loadgen', config, results)
+
+
+if __name__ == '__main__':
+    main()
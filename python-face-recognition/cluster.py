@@ -0,0 +1,606 @@
+"""Multi-process mode: one supervisor, N service workers.
+
+With SERVER_WORKERS=N (N > 1) `python server.py` becomes a supervisor that
+starts N copies of itself. Every worker runs the full service with its own
+event loop, detection pool and attention store, and binds the public
+WebSocket port with SO_REUSEPORT so the kernel spreads connections across
+them. Each worker serves its HTTP API on a private Unix socket. With
+WS_UNIX_SOCKET set, the supervisor binds that local WebSocket socket once
+and every worker inherits the listening descriptor, so the kernel spreads
+local connections the same way.
+
+The supervisor owns the public HTTP port. Report, stats and metrics
+requests are fanned out to every worker over those sockets and merged, so
+clients see fleet-wide results; a participant whose reconnects landed on
+different workers is merged by reports.merge_participant_reports. Workers
+that exit are restarted with backoff.
+"""
+import asyncio
+import json
+import logging
+import marshal
+import os
+import re
+import signal
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from urllib.parse import quote
+
+import aiohttp
+import aiohttp_cors
+from aiohttp import web
+
+from config import env_float, env_str
+from frame_batch import READ_CHUNK_BYTES
+from profiling import (is_admin_request, merge_pstats, parse_profile_query, parse_tracemalloc_query,
+                       render_collapsed, render_pstats)
+from startup import announce, remove_ports_file
+from reports import (EXPORT_CHUNK_BYTES, MERGE_FIELDS, average_attention, export_end, merge_attention_data,
+                     merge_participant_reports, parse_export_query, session_report_payload)
+
+logger = logging.getLogger(__name__)
+
+# Top-level /stats counters that are summed across workers
+SUMMED_STATS = (
+    'connected_clients', 'total_participants', 'frames_received',
+    'frames_dropped', 'frames_in_flight'
+)
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})?( .*)$')
+
+
+def label_worker(text, index):
+    """Add worker="<index>" to every sample of a Prometheus exposition"""
+    lines = []
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if line.startswith('#') or not match:
+            lines.append(line)
+            continue
+        name, labels, value = match.groups()
+        inner = f'worker="{index}"' + (',' + labels[1:-1] if labels and labels != '{}' else '')
+        lines.append(f'{name}{{{inner}}}{value}')
+    return lines
+
+
+def _record_key(record):
+    # Workers order their exports by the string form of the ids
+    return str(record['session_id']), str(record['participant_id'])
+
+
+class WorkerProcess:
+    __slots__ = ('index', 'socket_path', 'env', 'process', 'restarts', 'started_at', 'session')
+
+    def __init__(self, index, socket_path, env):
+        self.index = index
+        self.socket_path = socket_path
+        self.env = env
+        self.process = None
+        self.restarts = 0
+        self.started_at = None
+        self.session = None
+
+
+class ClusterSupervisor:
+    """Starts, watches and aggregates the worker processes"""
+
+    def __init__(self, workers, http_port, ws_port, store_dir, script=None, http_socket=None,
+                 ports_file=None, startup=None, unix_socket=None):
+        self.workers_count = workers
+        self.http_port = http_port
+        self.ws_port = ws_port
+        self.store_dir = store_dir
+        self.http_socket = http_socket
+        self.unix_socket = unix_socket
+        self.ports_file = ports_file
+        self.startup = startup
+        self.script = script or os.path.abspath(sys.argv[0])
+        self.socket_dir = tempfile.mkdtemp(prefix='face-service-')
+        self.workers = []
+        self.started_at = time.monotonic()
+        self._stopping = False
+        self._watchers = []
+        self._next_batch_worker = 0
+        self.admin_token = env_str('ADMIN_TOKEN')
+        self.profile_max_seconds = env_float('PROFILE_MAX_SECONDS', 60.0)
+
+    def _worker_env(self, index):
+        env = dict(os.environ)
+        env.update({
+            'SERVER_WORKERS': '1',
+            'SERVER_WORKER_INDEX': str(index),
+            'SERVER_WORKER_SOCKET': os.path.join(self.socket_dir, f'worker-{index}.sock'),
+            'WS_PORT': str(self.ws_port),
+            'HTTP_PORT': '0',
+            'ATTENTION_STORE_DIR': os.path.join(self.store_dir, f'worker-{index}')
+        })
+        # Split the cores between workers unless the pool size was pinned
+        if 'DETECTION_WORKERS' not in os.environ:
+            env['DETECTION_WORKERS'] = str(max(1, (os.cpu_count() or 1) // self.workers_count))
+        if self.unix_socket is not None:
+            env['WS_UNIX_SOCKET_FD'] = str(self.unix_socket.fileno())
+        return env
+
+    async def _spawn(self, worker):
+        if os.path.exists(worker.socket_path):
+            os.unlink(worker.socket_path)
+        worker.process = await asyncio.create_subprocess_exec(
+            sys.executable, self.script, env=worker.env,
+            pass_fds=(self.unix_socket.fileno(),) if self.unix_socket is not None else ())
+        worker.started_at = time.monotonic()
+        logger.info(f"👷 Started worker {worker.index} (pid {worker.process.pid})")
+
+    async def _watch(self, worker):
+        backoff = 1.0
+        while not self._stopping:
+            code = await worker.process.wait()
+            if self._stopping:
+                return
+            uptime = time.monotonic() - worker.started_at
+            backoff = 1.0 if uptime > 60 else min(backoff * 2, 30.0)
+            logger.error(f"💥 Worker {worker.index} exited with {code}; restarting in {backoff:.0f}s")
+            await asyncio.sleep(backoff)
+            worker.restarts += 1
+            await self._spawn(worker)
+
+    async def _wait_ready(self, worker, timeout=60.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if worker.process.returncode is not None:
+                raise RuntimeError(f"Worker {worker.index} exited during startup")
+            try:
+                # Ready, not just alive: the worker's detector pool is warm
+                async with worker.session.get('http://worker/ready') as response:
+                    if response.status == 200:
+                        return
+            except (aiohttp.ClientError, OSError):
+                pass
+            await asyncio.sleep(0.1)
+        raise RuntimeError(f"Worker {worker.index} did not become ready in {timeout:.0f}s")
+
+    async def start(self):
+        for index in range(self.workers_count):
+            worker = WorkerProcess(index, os.path.join(self.socket_dir, f'worker-{index}.sock'),
+                                   self._worker_env(index))
+            worker.session = aiohttp.ClientSession(connector=aiohttp.UnixConnector(path=worker.socket_path))
+            self.workers.append(worker)
+            await self._spawn(worker)
+        await asyncio.gather(*(self._wait_ready(worker) for worker in self.workers))
+        self._watchers = [asyncio.create_task(self._watch(worker)) for worker in self.workers]
+
+    async def stop(self):
+        self._stopping = True
+        for task in self._watchers:
+            task.cancel()
+        for worker in self.workers:
+            if worker.process is not None and worker.process.returncode is None:
+                worker.process.send_signal(signal.SIGTERM)
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            try:
+                await asyncio.wait_for(worker.process.wait(), timeout=15)
+            except asyncio.TimeoutError:
+                logger.warning(f"Worker {worker.index} did not stop; killing it")
+                worker.process.kill()
+                await worker.process.wait()
+            await worker.session.close()
+
+    async def _request(self, worker, method, path, params=None, body=None, text=False, headers=None, timeout=30):
+        try:
+            async with worker.session.request(method, f'http://worker{path}', params=params, json=body,
+                                              headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                payload = await (response.read() if text is None else response.text() if text else response.json())
+                return response.status, payload
+        except (aiohttp.ClientError, OSError, asyncio.TimeoutError, ValueError) as e:
+            logger.warning(f"Worker {worker.index} did not answer {path}: {e}")
+            return None, None
+
+    async def fan_out(self, method, path, params=None, body=None, text=False, headers=None, timeout=30):
+        """Send a request to every worker; returns [(worker, status, payload)]
+
+        The payload is parsed JSON, or text with text=True, or bytes with text=None.
+        """
+        replies = await asyncio.gather(*(
+            self._request(worker, method, path, params, body, text, headers, timeout) for worker in self.workers
+        ))
+        return [(worker, status, payload) for worker, (status, payload) in zip(self.workers, replies)]
+
+    # --- Proxied endpoints ---------------------------------------------------
+
+    def _pick_worker(self):
+        """Next running worker, round robin"""
+        for _ in range(len(self.workers)):
+            worker = self.workers[self._next_batch_worker % len(self.workers)]
+            self._next_batch_worker += 1
+            if worker.process is not None and worker.process.returncode is None:
+                return worker
+        return None
+
+    async def ingest_frame_batch(self, request):
+        """Stream a frame batch to one worker and its NDJSON results back
+        
+        A batch is not split: every worker keeps its own tracking state, so
+        a participant's frames must all reach the same one.
+        """
+        worker = self._pick_worker()
+        if worker is None:
+            return web.json_response({"success": False, "error": "No worker available"}, status=503)
+        response = None
+        try:
+            async with worker.session.post('http://worker/frames/batch',
+                                           data=request.content.iter_chunked(READ_CHUNK_BYTES),
+                                           headers={'Content-Type': request.headers.get('Content-Type', '')},
+                                           timeout=aiohttp.ClientTimeout(total=None)) as upstream:
+                response = web.StreamResponse(status=upstream.status, headers={
+                    'Content-Type': upstream.headers.get('Content-Type', 'application/octet-stream'),
+                    'Cache-Control': 'no-cache'
+                })
+                response.enable_chunked_encoding()
+                await response.prepare(request)
+                async for chunk in upstream.content.iter_any():
+                    await response.write(chunk)
+        except (aiohttp.ClientError, OSError, asyncio.TimeoutError) as e:
+            logger.warning(f"Worker {worker.index} frame batch failed: {e}")
+            if response is None:
+                return web.json_response({"success": False, "error": f"Worker {worker.index} unavailable"},
+                                         status=502)
+            # Results already started; the missing end line tells the client
+            return response
+        await response.write_eof()
+        return response
+
+    # --- Admin endpoints --------------------------------------------------------
+
+    def _admin_headers(self, request):
+        # Workers check the token again, so pass it on
+        authorization = request.headers.get('Authorization')
+        return {'Authorization': authorization} if authorization else None
+
+    async def admin_profile(self, request):
+        """Profile every worker at once and merge the results (see profiling.py)"""
+        if not is_admin_request(request, self.admin_token):
+            return web.json_response({"success": False, "error": "Admin access required"}, status=403)
+        try:
+            options = parse_profile_query(request.query, self.profile_max_seconds)
+        except ValueError as e:
+            return web.json_response({"success": False, "error": str(e)}, status=400)
+        # Raw data from each worker, rendered once here
+        params = dict(request.query, format='prof' if options['mode'] == 'cprofile' else 'collapsed')
+        replies = await self.fan_out('POST', '/admin/profile', params=params, text=None,
+                                     headers=self._admin_headers(request), timeout=options['seconds'] + 30)
+        answered = [(worker, payload) for worker, status, payload in replies if status == 200]
+        if not answered:
+            busy = any(status == 409 for _, status, _ in replies)
+            return web.json_response({"success": False,
+                                      "error": "A capture is already running" if busy else "No worker answered"},
+                                     status=409 if busy else 502)
+        if options['mode'] == 'cprofile':
+            stats = merge_pstats(marshal.loads(payload) for _, payload in answered)
+            loop = asyncio.get_running_loop()
+            body, content_type = await loop.run_in_executor(None, render_pstats, stats, options['format'],
+                                                            options['sort'], options['top'])
+        else:
+            stacks = Counter()
+            for worker, payload in answered:
+                for line in payload.decode().splitlines():
+                    stack, count = line.rsplit(' ', 1)
+                    stacks[f"worker-{worker.index};{stack}"] += int(count)
+            body, content_type = render_collapsed(stacks)
+        return web.Response(body=body, headers={
+            'Content-Type': content_type,
+            'X-Profile-Workers': f"{len(answered)}/{len(self.workers)}"
+        })
+
+    async def admin_tracemalloc(self, request):
+        if not is_admin_request(request, self.admin_token):
+            return web.json_response({"success": False, "error": "Admin access required"}, status=403)
+        try:
+            seconds = parse_tracemalloc_query(request.query, self.profile_max_seconds)[0]
+        except ValueError as e:
+            return web.json_response({"success": False, "error": str(e)}, status=400)
+        replies = await self.fan_out('POST', '/admin/tracemalloc', params=request.query,
+                                     headers=self._admin_headers(request), timeout=seconds + 30)
+        return web.json_response({
+            "success": True,
+            "workers": [{'index': worker.index, **payload} if payload is not None else
+                        {'index': worker.index, 'success': False, 'error': 'unreachable'}
+                        for worker, _, payload in replies]
+        })
+
+    # --- Aggregated endpoints -------------------------------------------------
+
+    async def health_check(self, request):
+        alive = sum(1 for w in self.workers if w.process is not None and w.process.returncode is None)
+        return web.Response(
+            text=f"Face Recognition Service Running ✅ ({alive}/{len(self.workers)} workers)",
+            status=200 if alive else 503,
+            headers={'Content-Type': 'text/plain'}
+        )
+
+    async def readiness_check(self, request):
+        replies = await self.fan_out('GET', '/ready')
+        ready = sum(1 for _, status, _ in replies if status == 200)
+        info = self.startup.info() if self.startup is not None else {}
+        info.update({'ready': bool(self.workers) and ready == len(self.workers) and info.get('ready', True),
+                     'workers_ready': ready, 'workers': len(self.workers)})
+        return web.json_response(info, status=200 if info['ready'] else 503)
+
+    async def attention_report(self, request):
+        replies = await self.fan_out('GET', '/attention-report', params=request.query)
+        data = merge_attention_data(
+            payload['data'] for _, status, payload in replies if status == 200 and payload.get('success'))
+        # Workers that do not hold the session answer with every session they
+        # have; like a single service, only fall back to all when none has it
+        session_id = request.query.get('session_id')
+        if session_id and session_id in data:
+            data = {session_id: data[session_id]}
+        return web.json_response({
+            "success": True,
+            "data": data,
+            "summary": {
+                "total_sessions": len(data),
+                "total_participants": sum(len(session) for session in data.values()),
+                "average_attention_score": average_attention(data),
+                "generated_at": datetime.now().isoformat()
+            },
+            "workers_answered": sum(1 for _, status, _ in replies if status == 200),
+            "timestamp": datetime.now().isoformat()
+        })
+
+    async def _export_lines(self, worker, params):
+        """Lines of one worker's NDJSON export, in its (session, participant) order, ending with the trailer"""
+        try:
+            async with worker.session.get('http://worker/attention-report/export', params=params,
+                                          timeout=aiohttp.ClientTimeout(total=None, sock_read=30)) as response:
+                if response.status != 200:
+                    logger.warning(f"Worker {worker.index} export failed with {response.status}")
+                    return
+                async for line in response.content:
+                    yield json.loads(line)
+        except (aiohttp.ClientError, OSError, asyncio.TimeoutError, ValueError) as e:
+            logger.warning(f"Worker {worker.index} export stopped: {e}")
+
+    async def export_attention_report(self, request):
+        """Merge the workers' sorted NDJSON exports into one stream (k-way merge)
+        
+        Every worker pages by the same (session, participant) key, so the
+        first `limit` merged records are always within the first `limit` of
+        each worker and the cursor can be passed through unchanged.
+        """
+        try:
+            _, fields, _, limit = parse_export_query(request.query)
+        except ValueError as e:
+            return web.json_response({"success": False, "error": str(e)}, status=400)
+        params = dict(request.query)
+        params['fields'] = ','.join(dict.fromkeys(fields + MERGE_FIELDS))
+
+        streams = [self._export_lines(worker, params) for worker in self.workers]
+        heads = {}
+        truncated = False
+
+        async def advance(index):
+            nonlocal truncated
+            try:
+                record = await streams[index].__anext__()
+            except StopAsyncIteration:
+                return
+            if record.get('end'):
+                # The worker stopped at `limit`; the merged page may continue past our last key
+                truncated = truncated or record.get('next_cursor') is not None
+            else:
+                heads[index] = record
+
+        for index in range(len(streams)):
+            await advance(index)
+
+        response = web.StreamResponse(headers={
+            'Content-Type': 'application/x-ndjson; charset=utf-8',
+            'Cache-Control': 'no-cache'
+        })
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+
+        count, last_key, more = 0, None, False
+        chunk, size = [], 0
+        try:
+            while heads:
+                key = min(_record_key(record) for record in heads.values())
+                if limit and count >= limit:
+                    more = True
+                    break
+                merged = None
+                for index in [i for i, record in heads.items() if _record_key(record) == key]:
+                    record = heads.pop(index)
+                    merged = record if merged is None else merge_participant_reports(merged, record)
+                    await advance(index)
+                line = json.dumps({"session_id": merged['session_id'], "participant_id": merged['participant_id'],
+                                   **{field: merged[field] for field in fields}}) + '\n'
+                chunk.append(line)
+                size += len(line)
+                count += 1
+                last_key = key
+                if size >= EXPORT_CHUNK_BYTES:
+                    await response.write(''.join(chunk).encode())
+                    chunk, size = [], 0
+        finally:
+            for stream in streams:
+                await stream.aclose()
+        chunk.append(export_end(count, last_key, more or truncated))
+        await response.write(''.join(chunk).encode())
+        await response.write_eof()
+        return response
+
+    async def session_report(self, request):
+        session_id = request.match_info['session_id']
+        replies = await self.fan_out('GET', f"/session/{quote(session_id, safe='')}/report")
+        merged = {}
+        for _, status, payload in replies:
+            if status != 200 or not payload.get('success'):
+                continue
+            for participant in payload['participants']:
+                existing = merged.get(participant['participant_id'])
+                merged[participant['participant_id']] = (
+                    participant if existing is None else merge_participant_reports(existing, participant))
+
+        if not merged:
+            return web.json_response({"success": False, "error": "Session not found"}, status=404)
+
+        participants = list(merged.values())
+        overall = round(sum(p['attention_score'] for p in participants) / len(participants))
+        return web.json_response(session_report_payload(session_id, participants, overall))
+
+    async def participant_timeline(self, request):
+        path = (f"/session/{quote(request.match_info['session_id'], safe='')}"
+                f"/participant/{quote(request.match_info['participant_id'], safe='')}/timeline")
+        replies = await self.fan_out('GET', path, params=request.query)
+        found = [(status, payload) for _, status, payload in replies if status == 200]
+        if not found:
+            # Pass through a 400 for bad parameters, otherwise not found
+            status, payload = next(((s, p) for _, s, p in replies if s == 400),
+                                   (404, {"success": False, "error": "Participant not found"}))
+            return web.json_response(payload, status=status)
+        # A split participant has a timeline on each worker; show the busiest
+        _, best = max(found, key=lambda item: sum(point['frames'] for point in item[1]['timeline']))
+        return web.json_response(best)
+
+    async def reset_attention(self, request):
+        body = await request.json() if request.can_read_body else {}
+        replies = await self.fan_out('POST', '/reset-attention', body=body)
+        ok = [payload for _, status, payload in replies if status == 200 and payload.get('success')]
+        return web.json_response({
+            "success": len(ok) == len(self.workers),
+            "message": ok[0]['message'] if ok else "No worker answered",
+            "workers_reset": len(ok)
+        }, status=200 if ok else 502)
+
+    async def service_stats(self, request):
+        replies = await self.fan_out('GET', '/stats', params={'session_ids': '1'})
+        per_worker = []
+        totals = dict.fromkeys(SUMMED_STATS, 0)
+        sessions = set()
+        for worker, status, payload in replies:
+            entry = {'index': worker.index, 'pid': worker.process.pid if worker.process else None,
+                     'restarts': worker.restarts}
+            if status == 200 and payload.get('success'):
+                stats = payload['stats']
+                # Sessions can span workers, so count distinct ids rather than summing
+                sessions.update(stats.pop('session_ids', ()))
+                for key in SUMMED_STATS:
+                    totals[key] += stats.get(key, 0)
+                entry['stats'] = stats
+            else:
+                entry['error'] = 'unreachable'
+            per_worker.append(entry)
+
+        return web.json_response({
+            "success": True,
+            "stats": {
+                **totals,
+                "active_sessions": len(sessions),
+                "mode": "cluster",
+                "workers": per_worker,
+                "uptime_seconds": round(time.monotonic() - self.started_at),
+                "startup": self.startup.info() if self.startup is not None else None,
+                "server_time": datetime.now().isoformat(),
+                "ports": {
+                    "http": self.http_port,
+                    "websocket": self.ws_port,
+                    "websocket_unix": self.unix_socket.getsockname() if self.unix_socket is not None else None
+                }
+            }
+        })
+
+    async def prometheus_metrics(self, request):
+        replies = await self.fan_out('GET', '/metrics', text=True)
+        lines, seen = [], set()
+        for worker, status, text in replies:
+            if status != 200:
+                continue
+            for line in label_worker(text, worker.index):
+                # HELP/TYPE lines must appear once per metric family
+                if line.startswith('#'):
+                    if line in seen:
+                        continue
+                    seen.add(line)
+                lines.append(line)
+        return web.Response(text='\n'.join(lines) + '\n',
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    def create_app(self):
+        app = web.Application()
+        cors = aiohttp_cors.setup(app, defaults={
+            "*": aiohttp_cors.ResourceOptions(
+                allow_credentials=True,
+                expose_headers="*",
+                allow_headers="*",
+                allow_methods="*"
+            )
+        })
+        app.router.add_get('/', self.health_check)
+        app.router.add_get('/health', self.health_check)
+        app.router.add_get('/ready', self.readiness_check)
+        app.router.add_get('/attention-report', self.attention_report)
+        app.router.add_get('/attention-report/export', self.export_attention_report)
+        app.router.add_get('/session/{session_id}/report', self.session_report)
+        app.router.add_get('/session/{session_id}/participant/{participant_id}/timeline', self.participant_timeline)
+        app.router.add_post('/reset-attention', self.reset_attention)
+        app.router.add_post('/frames/batch', self.ingest_frame_batch)
+        app.router.add_get('/stats', self.service_stats)
+        app.router.add_get('/metrics', self.prometheus_metrics)
+        for route in list(app.router.routes()):
+            cors.add(route)
+        # Admin routes stay same-origin, as on a single service
+        app.router.add_post('/admin/profile', self.admin_profile)
+        app.router.add_post('/admin/tracemalloc', self.admin_tracemalloc)
+        return app
+
+    async def run(self):
+        """Start workers and the aggregating HTTP API, and run until SIGINT/SIGTERM"""
+        # Handle signals before any worker exists so a stop during warm-up
+        # still shuts the workers down instead of orphaning them
+        loop = asyncio.get_running_loop()
+        stop = loop.create_future()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, lambda: stop.done() or stop.set_result(None))
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        # Listen first so /health and /ready answer while the workers warm up
+        runner = web.AppRunner(self.create_app())
+        await runner.setup()
+        if self.http_socket is not None:
+            await web.SockSite(runner, self.http_socket).start()
+        else:
+            await web.TCPSite(runner, '0.0.0.0', self.http_port).start()
+        unix_path = self.unix_socket.getsockname() if self.unix_socket is not None else None
+        announce('SERVICE_PORTS', {'http_port': self.http_port, 'ws_port': self.ws_port,
+                                   'ws_unix_socket': unix_path, 'pid': os.getpid()})
+        starting = asyncio.create_task(self.start())
+        try:
+            await asyncio.wait({starting, stop}, return_when=asyncio.FIRST_COMPLETED)
+            if starting.done():
+                starting.result()
+                print(f"✅ Cluster supervisor: {len(self.workers)} workers sharing ws://localhost:{self.ws_port}, "
+                      f"aggregated API on http://localhost:{self.http_port}")
+                if self.startup is not None:
+                    self.startup.mark('workers')
+                    self.startup.ready()
+                announce('SERVICE_READY', {'http_port': self.http_port, 'ws_port': self.ws_port,
+                                           'ws_unix_socket': unix_path, 'pid': os.getpid(),
+                                           'workers': len(self.workers),
+                                           'cold_start_ms': self.startup.cold_start_ms if self.startup else None},
+                         self.ports_file)
+                await stop
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            pass
+        finally:
+            starting.cancel()
+            print("\n🛑 Stopping workers...")
+            remove_ports_file(self.ports_file)
+            await runner.cleanup()
+            await self.stop()
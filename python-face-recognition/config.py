@@ -0,0 +1,44 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def env_str(name, default=None):
+    """Read a string setting from the environment"""
+    value = os.environ.get(name)
+    if value is None or value.strip() == '':
+        return default
+    return value.strip()
+
+
+def env_int(name, default):
+    """Read an integer setting from the environment, falling back on bad values"""
+    value = env_str(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logger.warning(f"Invalid integer for {name}={value!r}, using {default}")
+        return default
+
+
+def env_float(name, default):
+    """Read a float setting from the environment, falling back on bad values"""
+    value = env_str(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"Invalid number for {name}={value!r}, using {default}")
+        return default
+
+
+def env_bool(name, default=False):
+    """Read a boolean flag from the environment"""
+    value = env_str(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
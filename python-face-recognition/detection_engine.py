@@ -0,0 +1,398 @@
+"""Execution engine for the CPU-heavy part of the frame pipeline.
+
+Decoding and face detection run in a thread or process pool so the asyncio
+loop that serves WebSocket and HTTP clients only does I/O. Worker callables
+live in this module (not server.py) so spawned processes can import them
+without starting a second service.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from config import env_float, env_int, env_str
+from detectors import create_detector
+from frame_decode import DECODE_SCALES, FrameDecodeError, FrameDecoder
+from profiling import profiled_call
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('thread', 'process')
+
+# Per-worker state. Each pool thread (or the main thread of each pool process)
+# gets its own detector instance.
+_worker_state = threading.local()
+
+
+def init_worker(opencv_threads, detector_name=None, decode_settings=None):
+    """Pool initializer: limit OpenCV threading and load a private detector"""
+    cv2.setNumThreads(opencv_threads)
+    _worker_state.detector = create_detector(detector_name)
+    _worker_state.decoder = FrameDecoder(**(decode_settings or {}))
+
+
+def _worker_detector():
+    if not hasattr(_worker_state, 'detector'):
+        _worker_state.detector = create_detector()
+    return _worker_state.detector
+
+
+def _worker_decoder():
+    if not hasattr(_worker_state, 'decoder'):
+        _worker_state.decoder = FrameDecoder()
+    return _worker_state.decoder
+
+
+def _track_roi(detector, image, roi, margin):
+    """Search for a face only around its last known box.
+
+    The search window is the previous box grown by `margin` of its size on
+    each side, and candidate sizes are limited to roughly the previous size,
+    so the detector evaluates a small fraction of the windows a full scan does.
+    """
+    x, y, w, h = roi
+    if w < detector.min_face_size:
+        return []
+    frame_h, frame_w = image.shape[:2]
+    pad_x, pad_y = int(w * margin), int(h * margin)
+    x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+    x1, y1 = min(frame_w, x + w + pad_x), min(frame_h, y + h + pad_y)
+    if x1 - x0 < detector.min_face_size or y1 - y0 < detector.min_face_size:
+        return []
+
+    size = max(w, h)
+    min_size = max(detector.min_face_size, int(size * 0.7))
+    max_size = int(size * 1.4)
+    faces = detector.detect(image[y0:y1, x0:x1], min_size, max_size)
+    return [(fx + x0, fy + y0, fw, fh, conf) for (fx, fy, fw, fh, conf) in faces]
+
+
+def _thumbnail(image, size):
+    """Tiny grayscale summary of a frame for change detection
+
+    INTER_AREA averages each block, which also smooths out sensor noise.
+    """
+    thumb = cv2.resize(image, (size, size), interpolation=cv2.INTER_AREA)
+    if thumb.ndim == 3:
+        thumb = thumb.mean(axis=2).astype(np.uint8)
+    return thumb
+
+
+def _frame_difference(thumb, previous):
+    """Mean absolute difference of two thumbnails in gray levels (0-255)"""
+    if previous is None or previous.shape != thumb.shape:
+        return None
+    return float(np.abs(thumb.astype(np.int16) - previous).mean())
+
+
+def detect_frame(image_data, options=None):
+    """Decode a frame and detect faces. Runs inside a pool worker.
+
+    options may contain 'roi' (x, y, w, h) of the participant's last face, in
+    which case only the area around it is searched, falling back to a full
+    scan on a miss; 'roi_margin' sets how far the search window extends.
+    'format', 'width' and 'height' describe raw (non-JPEG) payloads.
+    'thumbnail_size' asks for a thumbnail of the frame to be returned; with
+    'previous_thumbnail' and 'change_threshold' detection is skipped
+    (scan 'skip', faces None) when the frame differs from the previous
+    thumbnail by less than the threshold, so the caller can reuse its faces.
+    Faces are returned as (x, y, w, h, confidence) tuples in original frame
+    coordinates, whatever resolution detection actually ran at.
+    """
+    options = options or {}
+    detector = _worker_detector()
+    color = detector.color if detector is not None else False
+    min_face = detector.min_face_size if detector is not None else 1
+
+    decode_start = time.perf_counter()
+    try:
+        decoded = _worker_decoder().decode(image_data, options, color, min_face)
+    except FrameDecodeError as e:
+        return {'decoded': False, 'faces': [], 'error': str(e)}
+    decode_ms = (time.perf_counter() - decode_start) * 1000
+
+    if decoded is None:
+        return {'decoded': False, 'faces': []}
+
+    image, scale, width, height = decoded
+    result = {
+        'decoded': True,
+        'faces': [],
+        'scan': 'full',
+        'decode_scale': scale,
+        'decode_ms': decode_ms,
+        'detect_ms': 0.0,
+        'frame_height': int(height),
+        'frame_width': int(width)
+    }
+
+    if detector is None:
+        return result
+    result['detector'] = detector.name
+
+    if options.get('thumbnail_size'):
+        thumb = _thumbnail(image, options['thumbnail_size'])
+        result['thumbnail'] = thumb
+        diff = _frame_difference(thumb, options.get('previous_thumbnail'))
+        if diff is not None:
+            result['frame_diff'] = round(diff, 2)
+            if diff < options.get('change_threshold', 0):
+                result['scan'] = 'skip'
+                result['faces'] = None
+                return result
+
+    try:
+        faces = None
+        roi = options.get('roi')
+        if roi:
+            scaled_roi = [int(v / scale) for v in roi]
+            faces = _track_roi(detector, image, scaled_roi, options.get('roi_margin', 0.5))
+            result['detect_ms'] += detector.last_detect_ms
+            result['scan'] = 'roi' if faces else 'roi_miss'
+        if not faces:
+            faces = detector.detect(image)
+            result['detect_ms'] += detector.last_detect_ms
+        result['faces'] = [
+            (x * scale, y * scale, w * scale, h * scale, conf) for (x, y, w, h, conf) in faces
+        ]
+    except Exception as e:
+        result['detection_error'] = str(e)
+
+    return result
+
+
+def detect_batch(jobs):
+    """Run detect_frame over a batch of (image_data, options) jobs in one dispatch"""
+    results = []
+    for image_data, options in jobs:
+        try:
+            results.append(detect_frame(image_data, options))
+        except Exception as e:
+            # One bad frame must not fail the rest of the batch
+            results.append({'decoded': False, 'faces': [], 'error': str(e)})
+    return results
+
+
+class DetectionEngine:
+    """Thread or process pool that runs frame decoding and detection"""
+
+    def __init__(self, backend=None, workers=None, opencv_threads=None, detector_name=None):
+        self.detector_name = detector_name or env_str('FACE_DETECTOR')
+        self.backend = (backend or env_str('DETECTION_BACKEND', 'thread')).lower()
+        if self.backend not in BACKENDS:
+            logger.warning(f"Unknown DETECTION_BACKEND '{self.backend}', using 'thread'")
+            self.backend = 'thread'
+
+        self.workers = workers or env_int('DETECTION_WORKERS', 0) or (os.cpu_count() or 1)
+        # Parallelism comes from the pool, so each worker defaults to a single
+        # OpenCV thread to avoid oversubscribing the cores.
+        self.opencv_threads = opencv_threads if opencv_threads is not None else env_int('OPENCV_THREADS', 1)
+        self.start_method = env_str('DETECTION_MP_START', 'spawn')
+        self.decode_settings = self._decode_settings()
+        self.executor = None
+        # Set by ServiceProfiler while an admin capture is running
+        self.profile_capture = None
+
+    @staticmethod
+    def _decode_settings():
+        scale = env_str('DECODE_SCALE', 'auto').lower()
+        if scale != 'auto' and (not scale.isdigit() or int(scale) not in DECODE_SCALES):
+            logger.warning(f"Invalid DECODE_SCALE '{scale}', expected auto or one of {DECODE_SCALES}")
+            scale = 'auto'
+        return {
+            'scale': scale,
+            # Smallest face, in original frame pixels, that must stay detectable.
+            # 0 (the default) is the detector's own minimum, so auto never
+            # downscales; raising it (e.g. 60) lets auto decode at 1/2 or less,
+            # which is much cheaper but misses faces smaller than that.
+            'min_face_px': env_int('DECODE_MIN_FACE_PX', 0)
+        }
+
+    def start(self):
+        """Create the worker pool (idempotent)"""
+        if self.executor is not None:
+            return
+
+        if self.backend == 'process':
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=init_worker,
+                initargs=(self.opencv_threads, self.detector_name, self.decode_settings)
+            )
+        else:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix='detect',
+                initializer=init_worker,
+                initargs=(self.opencv_threads, self.detector_name, self.decode_settings)
+            )
+
+        logger.info(f"Detection engine started: {self.workers} {self.backend} worker(s), "
+                    f"{self.opencv_threads} OpenCV thread(s) each")
+
+    async def run(self, func, *args):
+        """Run a worker callable in the pool and await its result"""
+        if self.executor is None:
+            self.start()
+        loop = asyncio.get_running_loop()
+        capture = self.profile_capture
+        if capture is not None and capture.wraps(self.backend):
+            result, data = await loop.run_in_executor(self.executor, profiled_call, capture.mode, capture.interval,
+                                                      func, *args)
+            capture.add_worker_data(data)
+            return result
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def warm_up(self, width=320, height=240):
+        """Push one dummy frame through every worker
+
+        Starting pool threads/processes, loading each worker's detector and
+        the first detection call are all slow; doing them here keeps that
+        cost off the first real frames.
+        """
+        self.start()
+        frame = cv2.imencode('.jpg', np.zeros((height, width, 3), dtype=np.uint8))[1].tobytes()
+        # Concurrent submissions make the pool start every worker
+        await asyncio.gather(*(self.detect(frame) for _ in range(self.workers)))
+
+    def _payload(self, image_data):
+        # Thread workers read the received message in place; memoryviews cannot
+        # be pickled, so process workers get their own copy
+        if self.backend == 'process' and isinstance(image_data, memoryview):
+            return image_data.tobytes()
+        return image_data
+
+    async def detect(self, image_data, options=None):
+        """Decode and detect faces in one frame off the event loop"""
+        return await self.run(detect_frame, self._payload(image_data), options)
+
+    async def detect_batch(self, jobs):
+        """Decode and detect faces for a list of (image_data, options) jobs in one worker call"""
+        if self.backend == 'process':
+            jobs = [(self._payload(image_data), options) for image_data, options in jobs]
+        return await self.run(detect_batch, jobs)
+
+    def info(self):
+        return {
+            'backend': self.backend,
+            'detector': self.detector_name or 'haar',
+            'workers': self.workers,
+            'opencv_threads': self.opencv_threads,
+            'decode': self.decode_settings,
+            'running': self.executor is not None
+        }
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        if self.executor is not None:
+            if sys.version_info >= (3, 9):
+                self.executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+            else:
+                # cancel_futures is 3.9+; older pools finish their queued calls first
+                self.executor.shutdown(wait=wait)
+            self.executor = None
+
+
+class BatchScheduler:
+    """Collects frames from all connections into micro-batches for the engine.
+
+    Frames are dispatched as soon as a pool worker is idle, so at light load
+    nothing waits. While every worker is busy frames queue up, and when
+    workers free up the queue is split evenly across them (at most
+    max_batch_size frames per call), so batching only happens under load
+    and never leaves workers idle. A window_ms above 0 additionally holds
+    frames up to that long for a fuller batch, trading latency for fewer
+    dispatches. Set max_batch_size to 1 to send every frame straight to the
+    engine.
+    """
+
+    def __init__(self, engine, max_batch_size=None, window_ms=None):
+        self.engine = engine
+        self.max_batch_size = max(1, max_batch_size or env_int('BATCH_MAX_SIZE', 8))
+        self.window_ms = window_ms if window_ms is not None else env_float('BATCH_WINDOW_MS', 0.0)
+        self._pending = []
+        self._flush_handle = None
+        self._inflight = set()
+        self.batches_dispatched = 0
+        self.frames_batched = 0
+
+    async def submit(self, image_data, options=None):
+        """Queue one frame for detection and wait for its result"""
+        if self.max_batch_size <= 1:
+            start = time.perf_counter()
+            result = await self.engine.detect(image_data, options)
+            result['batch_wait_ms'] = 0.0
+            result['dispatch_ms'] = (time.perf_counter() - start) * 1000
+            return result
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(((image_data, options), future, time.perf_counter()))
+
+        if self.window_ms <= 0 or len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window_ms / 1000, self._flush)
+
+        return await future
+
+    def _flush(self):
+        """Split the queued frames across the idle workers; the rest wait for a free one"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        idle = self.engine.workers - len(self._inflight)
+        if not self._pending or idle <= 0:
+            return
+
+        calls = min(idle, len(self._pending))
+        size = min(self.max_batch_size, -(-len(self._pending) // calls))
+        for _ in range(calls):
+            if not self._pending:
+                break
+            batch, self._pending = self._pending[:size], self._pending[size:]
+            task = asyncio.create_task(self._run_batch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._batch_done)
+
+    def _batch_done(self, task):
+        self._inflight.discard(task)
+        # A worker is free again: hand it whatever queued up meanwhile
+        self._flush()
+
+    async def _run_batch(self, batch):
+        self.batches_dispatched += 1
+        self.frames_batched += len(batch)
+        dispatched = time.perf_counter()
+        try:
+            results = await self.engine.detect_batch([job for job, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        dispatch_ms = (time.perf_counter() - dispatched) * 1000
+        for (_, future, submitted), result in zip(batch, results):
+            result['batch_wait_ms'] = (dispatched - submitted) * 1000
+            result['dispatch_ms'] = dispatch_ms
+            # The waiting consumer may have been cancelled on disconnect
+            if not future.done():
+                future.set_result(result)
+
+    def info(self):
+        return {
+            'max_batch_size': self.max_batch_size,
+            'window_ms': self.window_ms,
+            'batches_dispatched': self.batches_dispatched,
+            'average_batch_size': round(self.frames_batched / self.batches_dispatched, 2) if self.batches_dispatched else 0,
+            'pending': len(self._pending),
+            'inflight_batches': len(self._inflight)
+        }
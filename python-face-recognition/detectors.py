@@ -0,0 +1,235 @@
+"""Face detector backends.
+
+Every backend implements the same small interface so FaceRecognitionService
+(and its pool workers) can switch detectors with the FACE_DETECTOR env var:
+
+    haar   - OpenCV Haar cascade (default, ships with opencv-python)
+    lbp    - OpenCV LBP cascade, faster but a little less accurate
+    yunet  - cv2.FaceDetectorYN with the YuNet ONNX model
+    dnn    - cv2.dnn ResNet-10 SSD (Caffe) face model
+
+Model files for lbp/yunet/dnn are looked up in the local models/ directory
+next to this file unless overridden by the *_PATH env vars below.
+"""
+import logging
+import math
+import os
+import time
+
+import cv2
+import numpy as np
+
+from config import env_float, env_str
+
+logger = logging.getLogger(__name__)
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+DEFAULT_DETECTOR = 'haar'
+
+DETECTORS = {}
+
+
+def register_detector(name):
+    """Class decorator adding a detector backend to the registry"""
+    def decorator(cls):
+        cls.name = name
+        DETECTORS[name] = cls
+        return cls
+    return decorator
+
+
+def model_path(env_name, filename):
+    return env_str(env_name) or os.path.join(MODELS_DIR, filename)
+
+
+class FaceDetector:
+    """Base class for detector backends.
+
+    detect() takes an image in the format given by `color` (BGR when True,
+    single-channel grayscale otherwise) and returns a list of
+    (x, y, w, h, confidence) tuples with confidence in [0, 1].
+    """
+
+    name = None
+    color = False
+    # Smallest face the backend is configured to find, in input pixels
+    min_face_size = 30
+
+    def __init__(self):
+        self.last_detect_ms = 0.0
+
+    def load(self):
+        """Load model files; return False if the backend is unusable"""
+        raise NotImplementedError
+
+    def _detect(self, image, min_size, max_size):
+        raise NotImplementedError
+
+    def detect(self, image, min_size=None, max_size=None):
+        """Run detection and record how long the call took"""
+        start = time.perf_counter()
+        try:
+            return self._detect(image, min_size or self.min_face_size, max_size)
+        finally:
+            self.last_detect_ms = (time.perf_counter() - start) * 1000
+
+
+class CascadeDetector(FaceDetector):
+    """Shared implementation for Haar and LBP cascades"""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.cascade = None
+
+    def load(self):
+        if not os.path.exists(self.path):
+            logger.error(f"Cascade file not found: {self.path}")
+            return False
+        self.cascade = cv2.CascadeClassifier(self.path)
+        if self.cascade.empty():
+            logger.error(f"Failed to load cascade classifier: {self.path}")
+            self.cascade = None
+            return False
+        return True
+
+    def _detect(self, image, min_size, max_size):
+        # detectMultiScale3 exposes the final stage weight of each detection,
+        # i.e. how far past the last stage threshold it scored. Squash it into
+        # [0, 1] so it is comparable with the DNN backends' scores.
+        rects, _, weights = self.cascade.detectMultiScale3(
+            image,
+            scaleFactor=1.1,
+            minNeighbors=4,
+            minSize=(min_size, min_size),
+            maxSize=(max_size, max_size) if max_size else None,
+            outputRejectLevels=True
+        )
+        return [
+            (int(x), int(y), int(w), int(h), round(1 / (1 + math.exp(-float(weight))), 3))
+            for (x, y, w, h), weight in zip(rects, weights)
+        ]
+
+
+@register_detector('haar')
+class HaarDetector(CascadeDetector):
+    def __init__(self):
+        super().__init__(env_str('HAAR_CASCADE_PATH') or
+                         cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+
+@register_detector('lbp')
+class LbpDetector(CascadeDetector):
+    def __init__(self):
+        super().__init__(model_path('LBP_CASCADE_PATH', 'lbpcascade_frontalface_improved.xml'))
+
+
+class DnnDetector(FaceDetector):
+    """Shared helpers for the CNN backends, which need colour input"""
+
+    color = True
+
+    def __init__(self):
+        super().__init__()
+        self.score_threshold = env_float('DNN_SCORE_THRESHOLD', 0.6)
+
+    @staticmethod
+    def _filter_size(faces, min_size, max_size):
+        return [
+            f for f in faces
+            if max(f[2], f[3]) >= min_size and (not max_size or max(f[2], f[3]) <= max_size)
+        ]
+
+
+@register_detector('yunet')
+class YuNetDetector(DnnDetector):
+    min_face_size = 10
+
+    def __init__(self):
+        super().__init__()
+        self.path = model_path('YUNET_MODEL_PATH', 'face_detection_yunet_2023mar.onnx')
+        self.model = None
+        self.input_size = None
+
+    def load(self):
+        if not hasattr(cv2, 'FaceDetectorYN'):
+            logger.error("cv2.FaceDetectorYN requires OpenCV 4.5.4 or newer")
+            return False
+        if not os.path.exists(self.path):
+            logger.error(f"YuNet model not found: {self.path}")
+            return False
+        self.model = cv2.FaceDetectorYN.create(self.path, '', (320, 320), self.score_threshold, 0.3, 5000)
+        return True
+
+    def _detect(self, image, min_size, max_size):
+        height, width = image.shape[:2]
+        if self.input_size != (width, height):
+            self.model.setInputSize((width, height))
+            self.input_size = (width, height)
+
+        _, detections = self.model.detect(image)
+        if detections is None:
+            return []
+
+        faces = [
+            (int(d[0]), int(d[1]), int(d[2]), int(d[3]), round(float(d[14]), 3))
+            for d in detections
+        ]
+        return self._filter_size(faces, min_size, max_size)
+
+
+@register_detector('dnn')
+class SsdDetector(DnnDetector):
+    input_size = (300, 300)
+    mean = (104.0, 177.0, 123.0)
+
+    def __init__(self):
+        super().__init__()
+        self.model_file = model_path('DNN_MODEL_PATH', 'res10_300x300_ssd_iter_140000.caffemodel')
+        self.config_file = model_path('DNN_CONFIG_PATH', 'deploy.prototxt')
+        self.net = None
+
+    def load(self):
+        for path in (self.model_file, self.config_file):
+            if not os.path.exists(path):
+                logger.error(f"DNN face model file not found: {path}")
+                return False
+        self.net = cv2.dnn.readNet(self.model_file, self.config_file)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        return True
+
+    def _detect(self, image, min_size, max_size):
+        height, width = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(image, 1.0, self.input_size, self.mean)
+        self.net.setInput(blob)
+        detections = self.net.forward()[0, 0]
+
+        faces = []
+        for detection in detections[detections[:, 2] >= self.score_threshold]:
+            x1, y1, x2, y2 = (detection[3:7] * np.array([width, height, width, height])).astype(int)
+            x1, y1 = max(0, x1), max(0, y1)
+            x2, y2 = min(width, x2), min(height, y2)
+            if x2 > x1 and y2 > y1:
+                faces.append((int(x1), int(y1), int(x2 - x1), int(y2 - y1), round(float(detection[2]), 3)))
+        return self._filter_size(faces, min_size, max_size)
+
+
+def create_detector(name=None):
+    """Create and load the named detector, falling back to Haar if it cannot load"""
+    name = (name or env_str('FACE_DETECTOR', DEFAULT_DETECTOR)).lower()
+    cls = DETECTORS.get(name)
+    if cls is None:
+        logger.warning(f"Unknown FACE_DETECTOR '{name}', available: {', '.join(sorted(DETECTORS))}")
+    else:
+        detector = cls()
+        if detector.load():
+            return detector
+
+    if name != DEFAULT_DETECTOR:
+        logger.warning(f"Falling back to '{DEFAULT_DETECTOR}' face detector")
+        detector = DETECTORS[DEFAULT_DETECTOR]()
+        if detector.load():
+            return detector
+
+    return None
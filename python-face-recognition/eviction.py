@@ -0,0 +1,158 @@
+"""Idle participant eviction for attention_data.
+
+Participants are kept in an LRU index ordered by when they last sent a
+frame, so both TTL expiry and the size ceiling only ever look at the
+least recently seen end: eviction costs O(evicted), not O(participants).
+Sessions are dropped once their last participant is evicted.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from config import env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+# Rough fixed cost of a ParticipantState besides its ring arrays
+PARTICIPANT_OVERHEAD_BYTES = 600
+
+
+class AttentionEvictor:
+    """TTL and LRU-ceiling eviction of participants, run by a background sweeper"""
+
+    def __init__(self, ttl_seconds=7200, max_participants=50000, max_bytes=0, sweep_interval=30.0):
+        self.ttl_seconds = ttl_seconds
+        self.max_participants = max_participants
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.on_evict = None
+        self._lru = OrderedDict()
+        self._task = None
+
+        self.evicted_ttl = 0
+        self.evicted_lru = 0
+        self.sessions_evicted = 0
+        self.sweeps = 0
+        self.last_sweep_ms = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            ttl_seconds=env_float('ATTENTION_TTL_SECONDS', 7200),
+            max_participants=env_int('ATTENTION_MAX_PARTICIPANTS', 50000),
+            max_bytes=env_int('ATTENTION_MAX_MB', 0) * 1024 * 1024,
+            sweep_interval=env_float('EVICTION_SWEEP_SECONDS', 30.0)
+        )
+
+    @staticmethod
+    def participant_bytes(participant):
+        """Estimated memory held by one participant record"""
+        return participant.ring_size * 5 + PARTICIPANT_OVERHEAD_BYTES
+
+    def _limit(self, participant):
+        limit = self.max_participants if self.max_participants > 0 else None
+        if self.max_bytes > 0:
+            by_memory = max(1, self.max_bytes // self.participant_bytes(participant))
+            limit = by_memory if limit is None else min(limit, by_memory)
+        return limit
+
+    def touch(self, session_id, participant_id, participant, attention_data):
+        """Mark a participant as just seen, evicting the LRU one if over the ceiling"""
+        key = (session_id, participant_id)
+        if key in self._lru:
+            self._lru.move_to_end(key)
+            return
+
+        self._lru[key] = participant
+        limit = self._limit(participant)
+        while limit is not None and len(self._lru) > limit:
+            oldest_key, oldest = self._lru.popitem(last=False)
+            self._evict(attention_data, oldest_key, oldest, 'lru')
+
+    def rebuild(self, attention_data):
+        """Index every participant (e.g. after recovery), least recently seen first"""
+        entries = [
+            ((session_id, participant_id), participant)
+            for session_id, participants in attention_data.items()
+            for participant_id, participant in participants.items()
+        ]
+        entries.sort(key=lambda entry: entry[1].last_seen_mono or entry[1].start_mono)
+        self._lru = OrderedDict(entries)
+
+    def forget_session(self, session_id):
+        for key in [key for key in self._lru if key[0] == session_id]:
+            del self._lru[key]
+
+    def clear(self):
+        self._lru.clear()
+
+    def _evict(self, attention_data, key, participant, reason):
+        session_id, participant_id = key
+        session = attention_data.get(session_id)
+        if session is None or session.get(participant_id) is not participant:
+            return
+
+        del session[participant_id]
+        if reason == 'ttl':
+            self.evicted_ttl += 1
+        else:
+            self.evicted_lru += 1
+        if not session:
+            del attention_data[session_id]
+            self.sessions_evicted += 1
+
+        if self.on_evict is not None:
+            self.on_evict(session_id, participant_id, participant, reason)
+
+    def sweep(self, attention_data, now=None):
+        """Evict participants idle longer than the TTL; returns how many were evicted"""
+        start = time.perf_counter()
+        now = time.monotonic() if now is None else now
+        evicted = 0
+
+        if self.ttl_seconds > 0:
+            cutoff = now - self.ttl_seconds
+            while self._lru:
+                key, participant = next(iter(self._lru.items()))
+                if (participant.last_seen_mono or participant.start_mono) >= cutoff:
+                    break
+                self._lru.popitem(last=False)
+                self._evict(attention_data, key, participant, 'ttl')
+                evicted += 1
+
+        self.sweeps += 1
+        self.last_sweep_ms = round((time.perf_counter() - start) * 1000, 2)
+        if evicted:
+            logger.info(f"🧹 Evicted {evicted} idle participant(s); {len(self._lru)} tracked")
+        return evicted
+
+    def start(self, get_state):
+        """Run sweep() every sweep_interval seconds; get_state returns attention_data"""
+        self._task = asyncio.create_task(self._run(get_state))
+
+    async def _run(self, get_state):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                self.sweep(get_state())
+            except Exception as e:
+                logger.error(f"❌ Eviction sweep failed: {e}")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def info(self):
+        return {
+            'tracked_participants': len(self._lru),
+            'ttl_seconds': self.ttl_seconds,
+            'max_participants': self.max_participants,
+            'max_mb': round(self.max_bytes / (1024 * 1024), 1),
+            'evicted_ttl': self.evicted_ttl,
+            'evicted_lru': self.evicted_lru,
+            'sessions_evicted': self.sessions_evicted,
+            'sweeps': self.sweeps,
+            'last_sweep_ms': self.last_sweep_ms
+        }
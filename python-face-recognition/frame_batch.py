@@ -0,0 +1,212 @@
+"""Bulk frame ingestion for POST /frames/batch.
+
+Producers that cannot hold a WebSocket open send many frames, for any mix
+of participants, in one request body:
+
+* application/x-frame-stream (or application/octet-stream): records of a
+  u32 big-endian length followed by a v1 frame message (JSON header line,
+  newline, image bytes), exactly what a WebSocket v1 client sends;
+* multipart/form-data or multipart/mixed: one frame per part, either a v1
+  frame message, or the image bytes with the JSON header in the part's
+  X-Frame-Info header.
+
+Frames are analyzed as the body arrives. Different participants run
+concurrently (and so share detector micro-batches); a participant's own
+frames run in request order, as its tracking and attention state need.
+Results stream back as NDJSON in completion order, each tagged with the
+frame's zero-based `index` in the request, and the last line is
+{"end": true, ...} with the totals. A frame takes one of the concurrency
+slots only while it is analyzed, not while it waits for its participant's
+previous frame. At most as many frames as there are slots may wait to
+start; beyond that the request body is not read, so a fast producer is
+slowed by TCP backpressure instead of filling memory.
+"""
+import asyncio
+import json
+import struct
+import time
+from collections import Counter
+
+from aiohttp import ClientPayloadError
+from aiohttp.http_exceptions import HttpProcessingError
+
+from protocol import ProtocolError, parse_v1_frame
+
+FRAME_STREAM_TYPES = ('application/x-frame-stream', 'application/octet-stream')
+RECORD_LENGTH = struct.Struct('>I')
+FRAME_INFO_HEADER = 'X-Frame-Info'
+READ_CHUNK_BYTES = 64 * 1024
+# Malformed multipart, a broken chunked/compressed body or a dropped connection
+BODY_ERRORS = (ValueError, RuntimeError, ConnectionError, ClientPayloadError, HttpProcessingError)
+
+
+class FrameBatchError(ValueError):
+    """Raised when a request body cannot be split into frames; ends the batch"""
+
+
+async def iter_stream_frames(reader, max_frame_bytes):
+    """Yield (None, message) for each length-prefixed record of a frame stream"""
+    while True:
+        try:
+            prefix = await reader.readexactly(RECORD_LENGTH.size)
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                return
+            raise FrameBatchError("Truncated record length")
+        length = RECORD_LENGTH.unpack(prefix)[0]
+        if length > max_frame_bytes:
+            raise FrameBatchError(f"Frame record of {length} bytes exceeds the {max_frame_bytes} byte limit")
+        try:
+            yield None, await reader.readexactly(length)
+        except asyncio.IncompleteReadError:
+            raise FrameBatchError("Truncated frame record")
+
+
+async def iter_multipart_frames(reader, max_frame_bytes):
+    """Yield (X-Frame-Info header or None, body) for each part of a multipart body"""
+    async for part in reader:
+        if not hasattr(part, 'read_chunk'):
+            raise FrameBatchError("Nested multipart bodies are not supported")
+        chunks, size = [], 0
+        while True:
+            chunk = await part.read_chunk(READ_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_frame_bytes:
+                raise FrameBatchError(f"Frame part exceeds the {max_frame_bytes} byte limit")
+            chunks.append(chunk)
+        yield part.headers.get(FRAME_INFO_HEADER), b''.join(chunks)
+
+
+def parse_batch_frame(header, body):
+    """(frame_info, image_data) of one batch entry; raises ProtocolError"""
+    if header is None:
+        return parse_v1_frame(body)
+    try:
+        frame_info = json.loads(header)
+    except ValueError as e:
+        raise ProtocolError(f"Invalid JSON in {FRAME_INFO_HEADER}: {e}")
+    if not isinstance(frame_info, dict):
+        raise ProtocolError(f"Invalid JSON in {FRAME_INFO_HEADER}: expected an object")
+    if not body:
+        raise ProtocolError("No image data received")
+    return frame_info, memoryview(body)
+
+
+class FrameBatch:
+    """One request's frames: concurrent across participants, in order within one
+
+    analyze(frame_info, image_data, received_at) returns a frame's result
+    dict; it carries "error" for failed frames and "type": "overloaded" for
+    shed ones.
+    """
+
+    def __init__(self, analyze, concurrency, max_frames):
+        self.analyze = analyze
+        self.max_frames = max_frames
+        self.counts = Counter()
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._waiting = asyncio.Semaphore(max(1, concurrency))
+        self._lines = asyncio.Queue()
+        self._chains = {}
+        self._tasks = set()
+
+    async def run(self, frames, response):
+        """Consume the frames iterator and write NDJSON result lines to response"""
+        started = time.monotonic()
+        reader = asyncio.create_task(self._read(frames))
+        try:
+            while True:
+                line = await self._lines.get()
+                chunk = []
+                # Write whatever else is ready in the same chunk
+                while line is not None:
+                    chunk.append(line)
+                    if self._lines.empty():
+                        break
+                    line = self._lines.get_nowait()
+                if chunk:
+                    await response.write(''.join(chunk).encode())
+                if line is None:
+                    break
+            try:
+                error = reader.result()
+            except Exception as e:
+                error = f"Batch aborted: {e}"
+        finally:
+            reader.cancel()
+            for task in list(self._tasks):
+                task.cancel()
+        end = {"end": True, "frames": self.counts['frames'], "completed": self.counts['completed'],
+               "errors": self.counts['errors'], "shed": self.counts['shed'],
+               "elapsed_ms": round((time.monotonic() - started) * 1000, 1)}
+        if error:
+            end["error"] = error
+        await response.write((json.dumps(end) + '\n').encode())
+
+    async def _read(self, frames):
+        """Submit every frame, then wait for them; returns the error that ended the body early, if any"""
+        error = None
+        try:
+            try:
+                index = 0
+                async for header, body in frames:
+                    if index >= self.max_frames:
+                        error = f"Batch exceeds {self.max_frames} frames; the rest were not read"
+                        break
+                    self.counts['frames'] += 1
+                    try:
+                        frame_info, image_data = parse_batch_frame(header, body)
+                    except ProtocolError as e:
+                        self._emit(index, {"error": str(e)})
+                    else:
+                        # Blocks, and so stops reading the body, while too many frames wait to start
+                        await self._waiting.acquire()
+                        self._submit(index, frame_info, image_data)
+                    index += 1
+            except FrameBatchError as e:
+                error = str(e)
+            except BODY_ERRORS as e:
+                error = f"Request body error: {e or type(e).__name__}"
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+        finally:
+            self._lines.put_nowait(None)
+        return error
+
+    def _submit(self, index, frame_info, image_data):
+        key = (frame_info.get('session_id', 'default'), frame_info.get('participant_id', 'unknown'))
+        task = asyncio.create_task(self._run_frame(index, key, self._chains.get(key), frame_info, image_data))
+        self._chains[key] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_frame(self, index, key, previous, frame_info, image_data):
+        received_at = time.monotonic()
+        try:
+            try:
+                if previous is not None:
+                    # Only for ordering; the previous frame reports its own outcome
+                    await asyncio.wait([previous])
+                await self._slots.acquire()
+            finally:
+                self._waiting.release()
+            try:
+                result = await self.analyze(frame_info, image_data, received_at)
+            finally:
+                self._slots.release()
+        except Exception as e:
+            result = {"error": f"Frame analysis error: {e}"}
+        if self._chains.get(key) is asyncio.current_task():
+            del self._chains[key]
+        self._emit(index, result)
+
+    def _emit(self, index, result):
+        if result.get('type') == 'overloaded':
+            self.counts['shed'] += 1
+        elif 'error' in result:
+            self.counts['errors'] += 1
+        else:
+            self.counts['completed'] += 1
+        self._lines.put_nowait(json.dumps({"index": index, **result}) + '\n')
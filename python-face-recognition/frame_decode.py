@@ -0,0 +1,199 @@
+"""Frame decode stage.
+
+Decodes incoming frames straight into the format the detector needs, at the
+smallest resolution that still resolves the smallest face we care about:
+
+* JPEG/PNG frames are decoded with IMREAD_GRAYSCALE or IMREAD_REDUCED_*_2/4/8,
+  so libjpeg does the downscaling (and skips colour conversion) during decode.
+* Raw 'gray' and 'yuv420'/'nv12' frames, negotiated in the frame header with
+  their width and height, skip image decoding entirely; the Y plane of a YUV
+  frame already is the grayscale image.
+* 'bgr' frames are decoded video frames handed over by the offline batch
+  reader; the format is internal and not offered on the wire.
+
+Boxes found on a reduced image are scaled back to original frame coordinates
+by the caller using the returned scale factor.
+
+Payloads may be memoryviews of the received WebSocket message; they are
+wrapped with np.frombuffer, never copied. Raw frames are converted and
+downscaled into per-decoder scratch buffers keyed by shape, so steady-state
+raw decoding allocates nothing. JPEG/PNG output is still allocated by
+cv2.imdecode, whose Python binding has no destination argument.
+"""
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+FRAME_FORMATS = ('jpeg', 'png', 'gray', 'yuv420', 'nv12')
+# Decodable without imdecode; 'bgr' is batch-only, so it is not in FRAME_FORMATS
+RAW_FORMATS = ('gray', 'yuv420', 'nv12', 'bgr')
+DECODE_SCALES = (1, 2, 4, 8)
+
+# Scratch buffers kept per decoder; frame shapes rarely change mid-session
+MAX_SCRATCH_BUFFERS = 8
+
+_GRAY_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8
+}
+_COLOR_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+_YUV_TO_BGR = {
+    'yuv420': cv2.COLOR_YUV2BGR_I420,
+    'nv12': cv2.COLOR_YUV2BGR_NV12
+}
+
+# JPEG start-of-frame markers carry the image size (C4, C8 and CC are not SOFs)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+class FrameDecodeError(ValueError):
+    """Raised for frames whose declared format or size does not match the payload"""
+
+
+def image_dimensions(data):
+    """Read (width, height) from a JPEG or PNG header without decoding; None if unknown"""
+    data = memoryview(data)
+    if len(data) >= 24 and bytes(data[:8]) == _PNG_SIGNATURE:
+        return int.from_bytes(data[16:20], 'big'), int.from_bytes(data[20:24], 'big')
+
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            i += 1
+            continue
+        if marker in _SOF_MARKERS:
+            height = int.from_bytes(data[i + 5:i + 7], 'big')
+            width = int.from_bytes(data[i + 7:i + 9], 'big')
+            return width, height
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            # Standalone markers have no length field
+            i += 2
+            continue
+        i += 2 + int.from_bytes(data[i + 2:i + 4], 'big')
+    return None
+
+
+class FrameDecoder:
+    """Decodes frames for one worker according to the configured scale policy.
+
+    scale is 'auto' or one of 1/2/4/8. In auto mode the largest reduction is
+    picked such that a face of min_face_px original pixels is still at least
+    the detector's minimum face size after scaling, and the short side of the
+    reduced image stays at or above min_side. min_face_px 0 means the
+    detector's own minimum, which keeps frames at full resolution.
+
+    A decoder belongs to one worker: images it returns may live in its
+    scratch buffers and are only valid until its next decode() call.
+    """
+
+    def __init__(self, scale='auto', min_face_px=0, min_side=120):
+        self.scale = scale
+        self.min_face_px = min_face_px
+        self.min_side = min_side
+        self._scratch = OrderedDict()
+
+    def scratch(self, purpose, shape):
+        """Reusable uint8 buffer for one purpose and shape, least recently used evicted"""
+        key = (purpose, shape)
+        buffer = self._scratch.get(key)
+        if buffer is None:
+            buffer = self._scratch[key] = np.empty(shape, dtype=np.uint8)
+            if len(self._scratch) > MAX_SCRATCH_BUFFERS:
+                self._scratch.popitem(last=False)
+        else:
+            self._scratch.move_to_end(key)
+        return buffer
+
+    def choose_scale(self, width, height, detector_min_face):
+        if self.scale != 'auto':
+            return int(self.scale)
+        if not width or not height:
+            return 1
+
+        min_face_px = self.min_face_px or detector_min_face
+        for factor in (8, 4, 2):
+            if (min_face_px / factor >= detector_min_face
+                    and min(width, height) / factor >= self.min_side):
+                return factor
+        return 1
+
+    def decode(self, image_data, options, color, detector_min_face):
+        """Decode a frame; returns (image, scale, width, height) or None if undecodable
+
+        width and height are the original frame dimensions; multiply boxes
+        found on `image` by `scale` to map them back.
+        """
+        frame_format = (options.get('format') or 'jpeg').lower()
+        if frame_format in RAW_FORMATS:
+            return self._decode_raw(image_data, frame_format, options, color, detector_min_face)
+        if frame_format not in FRAME_FORMATS:
+            raise FrameDecodeError(f"Unsupported frame format '{frame_format}'")
+
+        dimensions = image_dimensions(image_data)
+        width, height = dimensions if dimensions else (0, 0)
+        scale = self.choose_scale(width, height, detector_min_face)
+        flags = _COLOR_FLAGS[scale] if color else _GRAY_FLAGS[scale]
+
+        image = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), flags)
+        if image is None:
+            return None
+
+        if not dimensions:
+            width, height = image.shape[1] * scale, image.shape[0] * scale
+        return image, scale, width, height
+
+    def _decode_raw(self, image_data, frame_format, options, color, detector_min_face):
+        try:
+            width, height = int(options['width']), int(options['height'])
+        except (KeyError, TypeError, ValueError):
+            raise FrameDecodeError(f"'{frame_format}' frames need integer width and height in the header")
+
+        if frame_format in _YUV_TO_BGR and (width % 2 or height % 2):
+            # 4:2:0 chroma is subsampled 2x2, so the planes only line up for even sizes
+            raise FrameDecodeError(f"'{frame_format}' frames need even width and height, got {width}x{height}")
+
+        plane = width * height
+        expected = {'gray': plane, 'bgr': plane * 3}.get(frame_format, plane * 3 // 2)
+        if width <= 0 or height <= 0 or len(image_data) < expected:
+            raise FrameDecodeError(
+                f"'{frame_format}' frame of {width}x{height} needs {expected} bytes, got {len(image_data)}")
+
+        buffer = np.frombuffer(image_data, dtype=np.uint8, count=expected)
+        if frame_format == 'bgr':
+            image = buffer.reshape(height, width, 3)
+            if not color:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=self.scratch('gray', (height, width)))
+        elif frame_format == 'gray':
+            image = buffer.reshape(height, width)
+            if color:
+                image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR,
+                                     dst=self.scratch('bgr', (height, width, 3)))
+        elif color:
+            image = cv2.cvtColor(buffer.reshape(height * 3 // 2, width), _YUV_TO_BGR[frame_format],
+                                 dst=self.scratch('bgr', (height, width, 3)))
+        else:
+            # The Y plane of a planar or semi-planar YUV frame is the grayscale image
+            image = buffer[:plane].reshape(height, width)
+
+        scale = self.choose_scale(width, height, detector_min_face)
+        if scale > 1:
+            shape = (height // scale, width // scale) + image.shape[2:]
+            image = cv2.resize(image, (width // scale, height // scale),
+                               dst=self.scratch('scaled', shape), interpolation=cv2.INTER_AREA)
+        return image, scale, width, height
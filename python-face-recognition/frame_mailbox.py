@@ -0,0 +1,82 @@
+"""Latest-frame-wins mailbox between a connection's receive loop and its detector.
+
+Each participant has at most one pending frame: a newer frame replaces the
+one still waiting, and when capacity participants are already waiting the
+oldest pending frame is evicted. Every replaced or evicted frame counts as a
+drop, tallied per key (dropped_by_key), in total (total_dropped) and since
+the key's last result, which take_drop_count() hands back so the reply can
+report dropped_frames.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class FrameMailbox:
+    """Bounded per-connection mailbox that keeps only the newest frame per participant.
+
+    The WebSocket receive loop puts frames in as fast as they arrive; a single
+    consumer task takes them out as fast as detection allows. A frame that is
+    still waiting when a newer one for the same participant arrives is dropped,
+    so queueing delay never grows beyond one detection round.
+    """
+
+    def __init__(self, capacity=4):
+        self.capacity = max(1, capacity)
+        self._pending = OrderedDict()
+        self._ready = asyncio.Event()
+        self._closed = False
+        self._dropped_since_result = {}
+        self.dropped_by_key = {}
+        self.total_dropped = 0
+
+    def put(self, key, frame_info, image_data, received_at=None):
+        """Queue a frame, returning the number of frames it made obsolete (0 or 1)
+
+        received_at (time.monotonic()) defaults to now and is handed back by
+        get() so the consumer can measure end-to-end latency.
+        """
+        if self._closed:
+            return 0
+
+        dropped = 0
+        if key in self._pending:
+            # Replace in place so the participant keeps its turn
+            self._record_drop(key)
+            dropped = 1
+        elif len(self._pending) >= self.capacity:
+            oldest_key, _ = self._pending.popitem(last=False)
+            self._record_drop(oldest_key)
+            dropped = 1
+
+        self._pending[key] = (frame_info, image_data, received_at or time.monotonic())
+        self._ready.set()
+        return dropped
+
+    def _record_drop(self, key):
+        self._dropped_since_result[key] = self._dropped_since_result.get(key, 0) + 1
+        self.dropped_by_key[key] = self.dropped_by_key.get(key, 0) + 1
+        self.total_dropped += 1
+
+    async def get(self):
+        """Wait for the next frame; returns (key, frame_info, image_data, queued_at) or None once closed"""
+        while not self._pending:
+            if self._closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+
+        key, (frame_info, image_data, queued_at) = self._pending.popitem(last=False)
+        return key, frame_info, image_data, queued_at
+
+    def take_drop_count(self, key):
+        """Return and reset the number of frames dropped for a key since its last result"""
+        return self._dropped_since_result.pop(key, 0)
+
+    def close(self):
+        self._closed = True
+        self._pending.clear()
+        self._ready.set()
+
+    def __len__(self):
+        return len(self._pending)
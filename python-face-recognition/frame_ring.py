@@ -0,0 +1,177 @@
+"""Shared-memory frame ring for producers on the same host.
+
+A co-located producer creates a multiprocessing.shared_memory block laid
+out as a ring of fixed-size slots and writes each frame message into the
+next slot: exactly the bytes it would otherwise send as a binary WebSocket
+message (v1 or v2, encoded or raw). Over its WebSocket connection, which
+must be the local Unix socket, it then sends only small text messages:
+
+    {"type": "ring_attach", "name": "<shared memory name>"}     once
+    {"type": "ring_frame", "seq": 41}                            per frame
+
+so a frame crosses no socket and is not masked/unmasked by the WebSocket
+layer; the service copies it out of the ring once and handles it like a
+received message. Results come back over the WebSocket as usual.
+
+Layout (little-endian), 64-byte aligned:
+
+    header    magic b'FRNG' | version u16 | reserved u16 | slots u32 | slot_bytes u32, padded to 64
+    slot i    at 64 + i * slot_bytes: seq u64 | length u32 | reserved u32 | message
+
+Frame seq starts at 1 and goes to slot seq % slots. The producer zeroes a
+slot's seq before rewriting it and stores the frame's seq after the
+message. The reader checks the seq before and after copying, so a slot
+that was reused before its doorbell was handled counts as a dropped frame
+rather than being misread. Size the ring so that does not happen in
+normal operation: the doorbell is what orders the writes for the reader.
+"""
+import json
+import struct
+from multiprocessing import resource_tracker, shared_memory
+
+RING_MAGIC = b'FRNG'
+RING_VERSION = 1
+RING_HEADER = struct.Struct('<4sHHII')
+HEADER_BYTES = 64
+SLOT_SEQ = struct.Struct('<Q')
+SLOT_LENGTH = struct.Struct('<I')
+SLOT_HEADER_BYTES = 16
+
+DEFAULT_SLOTS = 8
+# Room for a 1280x720 raw BGR frame plus its header
+DEFAULT_SLOT_BYTES = 2816 * 1024
+
+
+class FrameRingError(ValueError):
+    """Raised for rings that cannot be attached and doorbells that do not fit the ring"""
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        # Older Pythons also track blocks they only attached to and would
+        # unlink the producer's ring when this process exits
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class FrameRing:
+    """One connection's view of a producer's ring; unattached until ring_attach"""
+
+    def __init__(self, max_message_bytes):
+        self.max_message_bytes = max_message_bytes
+        self.name = None
+        self.slots = 0
+        self.slot_bytes = 0
+        self.frames_read = 0
+        self.bytes_read = 0
+        self.stale = 0
+        self._shm = None
+
+    @property
+    def attached(self):
+        return self._shm is not None
+
+    def attach(self, name):
+        """Map the named ring and check its header; raises FrameRingError"""
+        if not isinstance(name, str) or not name or '/' in name:
+            raise FrameRingError("Ring name must be a shared memory block name")
+        self.close()
+        try:
+            shm = _attach(name)
+        except (OSError, ValueError) as e:
+            raise FrameRingError(f"Cannot open ring {name!r}: {e}")
+        try:
+            magic, version, _, slots, slot_bytes = RING_HEADER.unpack_from(shm.buf)
+            if magic != RING_MAGIC or version != RING_VERSION:
+                raise FrameRingError(f"{name!r} is not a version {RING_VERSION} frame ring")
+            if slots < 1 or slot_bytes <= SLOT_HEADER_BYTES or HEADER_BYTES + slots * slot_bytes > shm.size:
+                raise FrameRingError(f"Ring {name!r} has an invalid layout")
+        except (FrameRingError, struct.error) as e:
+            shm.close()
+            raise FrameRingError(str(e))
+        self._shm, self.name, self.slots, self.slot_bytes = shm, name, slots, slot_bytes
+
+    def read(self, seq):
+        """Copy out frame `seq`; None if its slot has been reused since"""
+        if not self.attached:
+            raise FrameRingError("No ring attached; send ring_attach first")
+        if not isinstance(seq, int) or seq < 1:
+            raise FrameRingError("Ring frame seq must be a positive integer")
+        buf = self._shm.buf
+        offset = HEADER_BYTES + (seq % self.slots) * self.slot_bytes
+        if SLOT_SEQ.unpack_from(buf, offset)[0] != seq:
+            self.stale += 1
+            return None
+        length = SLOT_LENGTH.unpack_from(buf, offset + SLOT_SEQ.size)[0]
+        if length > min(self.slot_bytes - SLOT_HEADER_BYTES, self.max_message_bytes):
+            raise FrameRingError(f"Ring frame {seq} is {length} bytes, more than its slot or the message limit")
+        start = offset + SLOT_HEADER_BYTES
+        message = bytes(buf[start:start + length])
+        if SLOT_SEQ.unpack_from(buf, offset)[0] != seq:
+            # Rewritten while we copied
+            self.stale += 1
+            return None
+        self.frames_read += 1
+        self.bytes_read += length
+        return message
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm = None
+
+
+class FrameRingWriter:
+    """Producer side of a frame ring, for co-located Python producers
+
+        ring = FrameRingWriter()
+        await ws.send(ring.attach_message())
+        await ws.send(ring.frame_message(ring.write(message)))
+    """
+
+    def __init__(self, slots=DEFAULT_SLOTS, slot_bytes=DEFAULT_SLOT_BYTES, name=None):
+        slot_bytes = -(-slot_bytes // 64) * 64
+        self.slots = max(1, slots)
+        self.slot_bytes = slot_bytes
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=HEADER_BYTES + self.slots * slot_bytes)
+        RING_HEADER.pack_into(self._shm.buf, 0, RING_MAGIC, RING_VERSION, 0, self.slots, slot_bytes)
+        self._next_seq = 1
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def capacity(self):
+        """Largest message a slot holds"""
+        return self.slot_bytes - SLOT_HEADER_BYTES
+
+    def write(self, message):
+        """Copy a frame message into the next slot and return its seq"""
+        if len(message) > self.capacity:
+            raise FrameRingError(f"Frame message of {len(message)} bytes exceeds the {self.capacity} byte slot")
+        seq = self._next_seq
+        self._next_seq += 1
+        buf = self._shm.buf
+        offset = HEADER_BYTES + (seq % self.slots) * self.slot_bytes
+        SLOT_SEQ.pack_into(buf, offset, 0)
+        start = offset + SLOT_HEADER_BYTES
+        buf[start:start + len(message)] = message
+        SLOT_LENGTH.pack_into(buf, offset + SLOT_SEQ.size, len(message))
+        SLOT_SEQ.pack_into(buf, offset, seq)
+        return seq
+
+    def attach_message(self):
+        return json.dumps({'type': 'ring_attach', 'name': self.name})
+
+    @staticmethod
+    def frame_message(seq):
+        return json.dumps({'type': 'ring_frame', 'seq': seq})
+
+    def close(self, unlink=True):
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
@@ -0,0 +1,169 @@
+"""Hot-path latency metrics.
+
+LatencyHistogram is a fixed-size log-bucketed histogram in the spirit of
+HdrHistogram: buckets grow by a constant ratio (~2% relative error) from
+1 microsecond to ~17 minutes, so recording is one log() and an array
+increment and percentiles never need the raw samples.
+"""
+import asyncio
+import math
+import time
+
+_MIN_US = 1.0
+_RATIO = 1.02
+_LOG_RATIO = math.log(_RATIO)
+_BUCKETS = int(math.log(1e9) / _LOG_RATIO) + 1  # Up to 1000 seconds
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram with percentile queries"""
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * _BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        micros = seconds * 1e6
+        index = int(math.log(micros / _MIN_US) / _LOG_RATIO) if micros > _MIN_US else 0
+        self.counts[min(index, _BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """Approximate q-quantile (0..1) in seconds"""
+        if not self.count:
+            return 0.0
+        target = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index, bucket in enumerate(self.counts):
+            seen += bucket
+            if seen >= target:
+                # Upper edge of the bucket, capped by the real maximum
+                return min(_MIN_US * _RATIO ** (index + 1) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        """Milliseconds summary for JSON endpoints"""
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count * 1000, 3) if self.count else 0,
+            'p50_ms': round(self.percentile(0.5) * 1000, 3),
+            'p95_ms': round(self.percentile(0.95) * 1000, 3),
+            'p99_ms': round(self.percentile(0.99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3)
+        }
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class ServiceMetrics:
+    """Stage latencies, per-session frame counters and event loop lag"""
+
+    SESSION_FIELDS = ('frames', 'dropped', 'errors')
+
+    def __init__(self):
+        self.stages = {}
+        self.sessions = {}
+        # Frames of sessions with no attention state, which would otherwise
+        # each leave behind a counter that no eviction or reset removes
+        self.unattributed = dict.fromkeys(self.SESSION_FIELDS, 0)
+        self.loop_lag = LatencyHistogram()
+        self._lag_task = None
+
+    def observe(self, stage, seconds):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def observe_ms(self, stage, milliseconds):
+        self.observe(stage, milliseconds / 1000)
+
+    def count(self, session_id, field, amount=1):
+        """Add to a session's counter; session_id None counts it as unattributed"""
+        if session_id is None:
+            self.unattributed[field] += amount
+            return
+        counters = self.sessions.get(session_id)
+        if counters is None:
+            counters = self.sessions[session_id] = dict.fromkeys(self.SESSION_FIELDS, 0)
+        counters[field] += amount
+
+    def forget_session(self, session_id):
+        self.sessions.pop(session_id, None)
+
+    def forget_sessions(self, live_sessions):
+        """Drop counters of sessions that were reset or evicted"""
+        for session_id in [sid for sid in self.sessions if sid not in live_sessions]:
+            del self.sessions[session_id]
+
+    def start_loop_monitor(self, interval=0.25):
+        self._lag_task = asyncio.create_task(self._sample_loop_lag(interval))
+
+    async def _sample_loop_lag(self, interval):
+        # A sleep that overshoots means something held the loop that long
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lag.record(max(0.0, time.perf_counter() - start - interval))
+
+    def stop(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+
+    def summary(self):
+        return {
+            'stages': {stage: histogram.summary() for stage, histogram in sorted(self.stages.items())},
+            'event_loop_lag': self.loop_lag.summary()
+        }
+
+    def render_prometheus(self, gauges, counters=None):
+        """Prometheus text exposition (version 0.0.4)"""
+        lines = [
+            '# HELP face_service_stage_latency_seconds Latency of each frame pipeline stage',
+            '# TYPE face_service_stage_latency_seconds summary'
+        ]
+        for stage, histogram in sorted(self.stages.items()):
+            for q in QUANTILES:
+                lines.append(f'face_service_stage_latency_seconds{{stage="{_label(stage)}",quantile="{q}"}} '
+                             f'{histogram.percentile(q):.6f}')
+            lines.append(f'face_service_stage_latency_seconds_sum{{stage="{_label(stage)}"}} {histogram.total:.6f}')
+            lines.append(f'face_service_stage_latency_seconds_count{{stage="{_label(stage)}"}} {histogram.count}')
+
+        lines += [
+            '# HELP face_service_event_loop_lag_seconds Event loop scheduling delay',
+            '# TYPE face_service_event_loop_lag_seconds summary'
+        ]
+        for q in QUANTILES:
+            lines.append(f'face_service_event_loop_lag_seconds{{quantile="{q}"}} {self.loop_lag.percentile(q):.6f}')
+        lines.append(f'face_service_event_loop_lag_seconds_sum {self.loop_lag.total:.6f}')
+        lines.append(f'face_service_event_loop_lag_seconds_count {self.loop_lag.count}')
+
+        for field, help_text in (('frames', 'Frames analyzed'),
+                                 ('dropped', 'Frames dropped before analysis'),
+                                 ('errors', 'Frames that failed analysis')):
+            name = f'face_service_session_{field}_total'
+            lines += [f'# HELP {name} {help_text}, per session', f'# TYPE {name} counter']
+            for session_id, session_counters in self.sessions.items():
+                lines.append(f'{name}{{session="{_label(session_id)}"}} {session_counters[field]}')
+            name = f'face_service_unattributed_{field}_total'
+            lines += [f'# HELP {name} {help_text}, for sessions with no attention state',
+                      f'# TYPE {name} counter', f'{name} {self.unattributed[field]}']
+
+        for name, value in (counters or {}).items():
+            lines += [f'# TYPE face_service_{name} counter', f'face_service_{name} {value}']
+        for name, value in gauges.items():
+            lines += [f'# TYPE face_service_{name} gauge', f'face_service_{name} {value}']
+
+        return '\n'.join(lines) + '\n'
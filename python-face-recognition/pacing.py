@@ -0,0 +1,160 @@
+"""Server-driven frame pacing for capture clients.
+
+The advisor turns current load into one recommendation shared by every
+client: how often to send a frame and at what JPEG quality and size.
+
+Capacity is estimated as workers / per-frame worker time (an EWMA of
+decode + detect), demand as the number of streams that sent a frame
+recently. The interval that keeps the pool at target_utilization is then
+stretched further while frames back up behind the workers or get dropped,
+smoothed, and rounded so clients only see it move in step_ms steps.
+Quality and resolution drop in tiers once the interval has had to grow
+well past the client's default.
+"""
+import asyncio
+import logging
+import time
+
+from config import env_float, env_int
+
+logger = logging.getLogger(__name__)
+
+# (interval up to this multiple of the default, JPEG quality, max width, max height)
+QUALITY_TIERS = (
+    (1.0, 0.8, 640, 480),
+    (2.0, 0.7, 480, 360),
+    (None, 0.6, 320, 240)
+)
+
+
+class FrameRateAdvisor:
+    """Recommends client frame interval and JPEG quality from detector load"""
+
+    def __init__(self, workers, default_interval_ms=500, min_interval_ms=250, max_interval_ms=3000,
+                 target_utilization=0.7, update_interval=1.0, stream_timeout=5.0, step_ms=50):
+        self.workers = max(1, workers)
+        self.default_interval_ms = default_interval_ms
+        self.min_interval_ms = min_interval_ms
+        self.max_interval_ms = max(min_interval_ms, max_interval_ms)
+        self.target_utilization = target_utilization
+        self.update_interval = update_interval
+        self.stream_timeout = stream_timeout
+        self.step_ms = max(1, step_ms)
+
+        self._streams = {}
+        self._service_ms = None
+        self._smoothed_ms = float(default_interval_ms)
+        self._last_received = 0
+        self._last_dropped = 0
+        self._last_update = time.monotonic()
+        self._task = None
+
+        self.version = 0
+        self.recommendation = self._build(default_interval_ms)
+        self.load = {'streams': 0, 'service_ms': None, 'backlog': 0, 'drop_ratio': 0.0, 'utilization': 0.0}
+
+    @classmethod
+    def from_env(cls, workers):
+        return cls(
+            workers,
+            default_interval_ms=env_int('PACING_DEFAULT_INTERVAL_MS', 500),
+            min_interval_ms=env_int('PACING_MIN_INTERVAL_MS', 250),
+            max_interval_ms=env_int('PACING_MAX_INTERVAL_MS', 3000),
+            target_utilization=env_float('PACING_TARGET_UTILIZATION', 0.7),
+            update_interval=env_float('PACING_UPDATE_SECONDS', 1.0)
+        )
+
+    def observe_frame(self, key, service_ms=None, now=None):
+        """Note a frame from stream `key` and, if detection ran, its worker time"""
+        self._streams[key] = time.monotonic() if now is None else now
+        if service_ms is not None:
+            # EWMA so the estimate follows load changes within a few seconds
+            self._service_ms = service_ms if self._service_ms is None else 0.9 * self._service_ms + 0.1 * service_ms
+
+    def _build(self, interval_ms):
+        factor = interval_ms / self.default_interval_ms
+        for limit, quality, width, height in QUALITY_TIERS:
+            if limit is None or factor <= limit:
+                return {
+                    'frame_interval_ms': interval_ms,
+                    'jpeg_quality': quality,
+                    'max_width': width,
+                    'max_height': height
+                }
+
+    def update(self, frames_in_flight=0, frames_received=0, frames_dropped=0, now=None):
+        """Recompute the recommendation; returns True if it changed"""
+        now = time.monotonic() if now is None else now
+        cutoff = now - self.stream_timeout
+        for key in [key for key, seen in self._streams.items() if seen < cutoff]:
+            del self._streams[key]
+
+        received = frames_received - self._last_received
+        dropped = frames_dropped - self._last_dropped
+        elapsed = max(1e-3, now - self._last_update)
+        self._last_received, self._last_dropped, self._last_update = frames_received, frames_dropped, now
+        drop_ratio = dropped / received if received > 0 else 0.0
+        backlog = max(0, frames_in_flight - self.workers)
+        streams = len(self._streams)
+
+        if streams == 0 or self._service_ms is None:
+            target = float(self.default_interval_ms)
+            utilization = 0.0
+        else:
+            # Interval at which `streams` clients keep the pool at the target utilization
+            capacity_fps = self.workers * 1000 / self._service_ms
+            target = streams * 1000 / (capacity_fps * self.target_utilization)
+            target *= 1 + backlog / self.workers + drop_ratio
+            utilization = (received - dropped) / elapsed / capacity_fps
+
+        target = min(self.max_interval_ms, max(self.min_interval_ms, target))
+        # Back off quickly, recover gradually
+        alpha = 0.6 if target > self._smoothed_ms else 0.25
+        self._smoothed_ms += alpha * (target - self._smoothed_ms)
+        interval_ms = int(round(self._smoothed_ms / self.step_ms) * self.step_ms)
+        interval_ms = min(self.max_interval_ms, max(self.min_interval_ms, interval_ms))
+
+        self.load = {
+            'streams': streams,
+            'service_ms': round(self._service_ms, 2) if self._service_ms is not None else None,
+            'backlog': backlog,
+            'drop_ratio': round(drop_ratio, 3),
+            'utilization': round(utilization, 3)
+        }
+        if interval_ms == self.recommendation['frame_interval_ms']:
+            return False
+        self.recommendation = self._build(interval_ms)
+        self.version += 1
+        return True
+
+    def start(self, get_load):
+        """Call update() every update_interval seconds; get_load returns its keyword arguments"""
+        self._task = asyncio.create_task(self._run(get_load))
+
+    async def _run(self, get_load):
+        while True:
+            await asyncio.sleep(self.update_interval)
+            try:
+                if self.update(**get_load()):
+                    logger.info(f"🎚️ Recommending {self.recommendation['frame_interval_ms']} ms frame interval "
+                                f"({self.load['streams']} streams, {self.load['service_ms']} ms/frame)")
+            except Exception as e:
+                logger.error(f"❌ Frame pacing update failed: {e}")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def control_message(self):
+        return {'type': 'pacing', 'version': self.version, **self.recommendation}
+
+    def info(self):
+        return {
+            'recommendation': self.recommendation,
+            'version': self.version,
+            'load': self.load,
+            'min_interval_ms': self.min_interval_ms,
+            'max_interval_ms': self.max_interval_ms,
+            'target_utilization': self.target_utilization
+        }
@@ -0,0 +1,294 @@
+"""Per-participant attention state.
+
+Each participant is a __slots__ record with monotonic timestamps and a
+NumPy ring buffer holding one entry per analyzed frame (time offset in ms
+and whether a face was seen). The ring starts small and doubles as frames
+arrive, up to its configured size, so participants who only send a few
+frames stay cheap. Sliding-window attention scores are maintained
+incrementally, so updating and reading them is O(1) amortized per frame
+regardless of how long the session runs.
+"""
+import logging
+import math
+import time
+from datetime import datetime
+
+import numpy as np
+
+from reports import REPORT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOWS = (30, 300)
+CLIENT_FPS = 2
+INITIAL_RING_SLOTS = 16
+
+
+def ring_size_for(windows, fps=CLIENT_FPS):
+    """Ring slots that hold the longest window at `fps` frames per second"""
+    return max(1, math.ceil(max(windows) * fps))
+
+
+DEFAULT_RING_SIZE = ring_size_for(DEFAULT_WINDOWS)  # 5 minutes at the client's 2 frames/second
+
+
+def window_label(seconds):
+    """Format a window length as a short label, e.g. 30 -> '30s', 300 -> '5m'"""
+    if seconds % 3600 == 0:
+        return f"{seconds // 3600}h"
+    if seconds % 60 == 0:
+        return f"{seconds // 60}m"
+    return f"{seconds}s"
+
+
+def parse_windows(value):
+    """Parse ATTENTION_WINDOWS ("30,300") into sliding window lengths in seconds"""
+    if not value:
+        return DEFAULT_WINDOWS
+    try:
+        windows = tuple(sorted({int(part) for part in value.split(',') if part.strip()}))
+        if windows and all(w > 0 for w in windows):
+            return windows
+    except ValueError:
+        pass
+    logger.warning(f"Invalid ATTENTION_WINDOWS '{value}', using {DEFAULT_WINDOWS}")
+    return DEFAULT_WINDOWS
+
+
+class SlidingWindow:
+    """Running frame and detection counts over the last `seconds` of the ring"""
+
+    __slots__ = ('seconds', 'label', 'start', 'frames', 'detected')
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.label = window_label(seconds)
+        self.start = 0  # Absolute frame index of the oldest frame in the window
+        self.frames = 0
+        self.detected = 0
+
+    def score(self):
+        return round(self.detected / self.frames * 100, 2) if self.frames else 0
+
+
+class ParticipantState:
+    """Compact attention record for one participant in one session"""
+
+    __slots__ = (
+        'name', 'total_frames', 'face_detected_frames', 'attention_score',
+        'start_mono', 'start_wall', 'last_seen_mono',
+        'last_face', 'frames_since_full_scan', 'last_faces', 'thumbnail', 'unchanged_frames', 'store_id',
+        '_ring_size', '_times', '_detected', '_windows'
+    )
+
+    def __init__(self, name, ring_size=DEFAULT_RING_SIZE, windows=DEFAULT_WINDOWS, now=None):
+        self.name = name
+        self.total_frames = 0
+        self.face_detected_frames = 0
+        self.attention_score = 0
+        self.start_mono = time.monotonic() if now is None else now
+        self.start_wall = time.time() - (time.monotonic() - self.start_mono)
+        self.last_seen_mono = None
+        # Face tracking hints for the detector
+        self.last_face = None
+        self.frames_since_full_scan = 0
+        # Change detection: thumbnail of the last frame detection ran on, its
+        # faces, and how many frames since then reused them
+        self.last_faces = None
+        self.thumbnail = None
+        self.unchanged_frames = 0
+        # Id of this participant in the durable attention store, if any
+        self.store_id = None
+        # Ring buffer: milliseconds since start_mono and detection flag per
+        # frame; grown by _grow until it reaches ring_size slots
+        self._ring_size = ring_size
+        self._times = np.zeros(min(ring_size, INITIAL_RING_SLOTS), dtype=np.uint32)
+        self._detected = np.zeros(len(self._times), dtype=np.uint8)
+        self._windows = tuple(SlidingWindow(seconds) for seconds in windows)
+
+    @property
+    def ring_size(self):
+        return self._ring_size
+
+    def _grow(self, slots):
+        # Only called before the ring first wraps, so frame i is still in slot i
+        slots = min(self._ring_size, max(slots, 2 * len(self._times)))
+        if slots > len(self._times):
+            times = np.zeros(slots, dtype=np.uint32)
+            detected = np.zeros(slots, dtype=np.uint8)
+            times[:len(self._times)] = self._times
+            detected[:len(self._detected)] = self._detected
+            self._times, self._detected = times, detected
+        return len(self._times)
+
+    def record_frame(self, face_detected, now=None):
+        """Add one analyzed frame and update lifetime and windowed scores"""
+        now = time.monotonic() if now is None else now
+        ring_size = len(self._times)
+        index = self.total_frames
+        if index >= ring_size and ring_size < self._ring_size:
+            ring_size = self._grow(index + 1)
+        slot = index % ring_size
+        offset_ms = int((now - self.start_mono) * 1000)
+
+        # The slot being overwritten may still be the oldest frame of a window
+        # longer than the ring covers; drop it from that window first.
+        if index >= ring_size:
+            evicted = index - ring_size
+            for window in self._windows:
+                if window.start == evicted:
+                    window.start += 1
+                    window.frames -= 1
+                    window.detected -= int(self._detected[slot])
+
+        self._times[slot] = offset_ms
+        self._detected[slot] = 1 if face_detected else 0
+        self.total_frames += 1
+        if face_detected:
+            self.face_detected_frames += 1
+        self.attention_score = round(self.face_detected_frames / self.total_frames * 100, 2)
+        self.last_seen_mono = now
+
+        for window in self._windows:
+            window.frames += 1
+            window.detected += 1 if face_detected else 0
+            self._expire(window, offset_ms)
+
+    def _expire(self, window, now_ms):
+        cutoff = now_ms - window.seconds * 1000
+        ring_size = len(self._times)
+        while window.frames and int(self._times[window.start % ring_size]) < cutoff:
+            window.detected -= int(self._detected[window.start % ring_size])
+            window.frames -= 1
+            window.start += 1
+
+    def window_scores(self, now=None):
+        """Attention percentage over each sliding window, keyed by label"""
+        if now is not None:
+            now_ms = int((now - self.start_mono) * 1000)
+            for window in self._windows:
+                self._expire(window, now_ms)
+        return {window.label: window.score() for window in self._windows}
+
+    def history(self):
+        """Chronological (times_ms, detected) arrays of the frames still in the ring"""
+        count = min(self.total_frames, len(self._times))
+        order = (np.arange(count) + (self.total_frames - count)) % len(self._times)
+        return self._times[order], self._detected[order]
+
+    def load_history(self, times_ms, detected):
+        """Bulk-load chronological frames ending at total_frames and rebuild the windows
+
+        Used when restoring from the attention store, where replaying frames
+        one by one through record_frame would be far too slow.
+        """
+        ring_size = self._grow(min(self.total_frames, self._ring_size))
+        times_ms, detected = times_ms[-ring_size:], detected[-ring_size:]
+        count = len(times_ms)
+        first = self.total_frames - count
+        slots = (np.arange(count) + first) % ring_size
+        self._times[slots] = times_ms
+        self._detected[slots] = detected
+
+        last_ms = int(times_ms[-1]) if count else 0
+        for window in self._windows:
+            i = int(np.searchsorted(times_ms, last_ms - window.seconds * 1000, side='left'))
+            window.start = first + i
+            window.frames = count - i
+            window.detected = int(detected[i:].sum())
+
+    @classmethod
+    def restore(cls, name, start_wall, total_frames, face_detected_frames, last_seen_ms,
+                times, detected, windows, window_counts):
+        """Rebuild a record from persisted state without re-running its frames
+
+        times/detected are the ring arrays in slot order (they may be row views
+        into a larger block) and window_counts holds (frames, detected) for
+        each window in `windows`.
+        """
+        participant = cls.__new__(cls)
+        participant.name = name
+        participant.total_frames = total_frames
+        participant.face_detected_frames = face_detected_frames
+        participant.attention_score = round(face_detected_frames / total_frames * 100, 2) if total_frames else 0
+        # Monotonic clocks do not survive restarts; re-anchor on wall-clock time
+        participant.start_mono = time.monotonic() - (time.time() - start_wall)
+        participant.start_wall = start_wall
+        participant.last_seen_mono = participant.start_mono + last_seen_ms / 1000 if total_frames else None
+        participant.last_face = None
+        participant.frames_since_full_scan = 0
+        participant.last_faces = None
+        participant.thumbnail = None
+        participant.unchanged_frames = 0
+        participant.store_id = None
+        participant._ring_size = len(times)
+        participant._times = times
+        participant._detected = detected
+        participant._windows = tuple(SlidingWindow(seconds) for seconds in windows)
+        for window, (frames, hits) in zip(participant._windows, window_counts):
+            window.start = total_frames - frames
+            window.frames = frames
+            window.detected = hits
+        return participant
+
+    def _wall_time(self, mono):
+        return datetime.fromtimestamp(self.start_wall + (mono - self.start_mono))
+
+    @property
+    def session_start(self):
+        return datetime.fromtimestamp(self.start_wall).isoformat()
+
+    @property
+    def last_seen(self):
+        return self._wall_time(self.last_seen_mono).isoformat() if self.last_seen_mono is not None else None
+
+    def session_duration(self, now=None):
+        return (time.monotonic() if now is None else now) - self.start_mono
+
+    def to_dict(self, now=None, fields=REPORT_FIELDS):
+        """Report representation (same fields the report endpoints always returned)
+
+        Sliding windows are evaluated at `now` (default: the current time);
+        `fields` selects a subset of REPORT_FIELDS.
+        """
+        return {
+            field: self.window_scores(time.monotonic() if now is None else now)
+            if field == 'recent_attention' else getattr(self, field)
+            for field in fields
+        }
+
+    def timeline(self, points=60, seconds=None):
+        """Downsample the ring buffer into at most `points` equal time buckets
+
+        Returns a list of {'timestamp', 'frames', 'attention_score'} dicts,
+        oldest first, covering the last `seconds` (default: whole ring).
+        """
+        count = min(self.total_frames, len(self._times))
+        if count == 0 or points <= 0:
+            return []
+
+        times, detected = self.history()
+        times = times.astype(np.int64)
+
+        end_ms = int(times[-1])
+        start_ms = int(times[0])
+        if seconds:
+            start_ms = max(start_ms, end_ms - int(seconds * 1000))
+            keep = times >= start_ms
+            times, detected = times[keep], detected[keep]
+
+        span = max(1, end_ms - start_ms + 1)
+        bucket_ms = -(-span // points)
+        buckets = (times - start_ms) // bucket_ms
+        frames = np.bincount(buckets, minlength=points)[:points]
+        hits = np.bincount(buckets, weights=detected, minlength=points)[:points]
+
+        timeline = []
+        for i in np.nonzero(frames)[0]:
+            bucket_start = self.start_mono + (start_ms + int(i) * bucket_ms) / 1000
+            timeline.append({
+                'timestamp': self._wall_time(bucket_start).isoformat(),
+                'frames': int(frames[i]),
+                'attention_score': round(float(hits[i]) / int(frames[i]) * 100, 2)
+            })
+        return timeline
@@ -0,0 +1,353 @@
+"""On-demand profiling of the live service, for the admin HTTP routes.
+
+POST /admin/profile?seconds=10&mode=sample captures for `seconds` and
+returns the result:
+
+* mode=sample (default) samples every thread's Python stack each
+  interval_ms and returns collapsed stacks ("thread;outer;...;inner count"
+  lines) for flamegraph.pl, speedscope or inferno. Threads parked in the
+  event loop's select() or an idle pool worker are left out unless idle=1.
+* mode=cprofile runs cProfile and returns pstats text sorted by `sort`
+  (top `top` rows), or with format=prof the marshalled stats that
+  pstats.Stats, snakeviz and gprof2dot load.
+
+Detection work is covered as well: with a process pool, and with a thread
+pool before Python 3.12 (where a cProfile profiler only sees its own
+thread), every pool call made during the capture runs under its own
+profiler in the worker and its data is merged into the result.
+
+POST /admin/tracemalloc?seconds=10&top=25 reports the top allocation
+sites, and what grew during the window, of the service process (not of
+process-pool workers). Tracing is started for the window unless it was
+already on (PYTHONTRACEMALLOC or a previous call with keep=1).
+
+Only one capture runs at a time. With ADMIN_TOKEN set the routes need
+"Authorization: Bearer <token>"; without it they only answer loopback and
+Unix socket clients.
+"""
+import asyncio
+import cProfile
+import hmac
+import io
+import logging
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ('sample', 'cprofile')
+PROFILE_FORMATS = {'sample': ('collapsed',), 'cprofile': ('pstats', 'prof')}
+SORT_KEYS = ('cumulative', 'tottime', 'ncalls', 'name')
+ALLOCATION_GROUPS = ('lineno', 'filename', 'traceback')
+# Before 3.12 a cProfile profiler only sees the thread that enabled it; from
+# 3.12 it sees every thread, and only one may be active per process
+PER_THREAD_CPROFILE = sys.version_info < (3, 12)
+# Innermost frames of threads that are waiting for work rather than doing it
+IDLE_FRAMES = {('selectors.py', 'select'), ('thread.py', '_worker'), ('threading.py', 'wait'),
+               ('queue.py', 'get'), ('process.py', '_process_worker')}
+
+
+class ProfileBusy(RuntimeError):
+    """Raised when a capture is requested while another one is running"""
+
+
+def is_admin_request(request, token):
+    """Whether an aiohttp request may use the admin routes"""
+    if token:
+        supplied = request.headers.get('Authorization', '')
+        return supplied.startswith('Bearer ') and hmac.compare_digest(supplied[7:].encode(), token.encode())
+    if isinstance(request.transport.get_extra_info('sockname') if request.transport else None, str):
+        return True  # Unix socket
+    return request.remote in ('127.0.0.1', '::1')
+
+
+def parse_profile_query(query, max_seconds):
+    """Capture options from query parameters; raises ValueError
+
+    Returns a dict with mode, seconds, interval_ms, format, sort, top and idle.
+    """
+    mode = query.get('mode', 'sample')
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"mode must be one of {', '.join(PROFILE_MODES)}")
+    fmt = query.get('format', PROFILE_FORMATS[mode][0])
+    if fmt not in PROFILE_FORMATS[mode]:
+        raise ValueError(f"format for mode {mode} must be one of {', '.join(PROFILE_FORMATS[mode])}")
+    sort = query.get('sort', 'cumulative')
+    if sort not in SORT_KEYS:
+        raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)}")
+    try:
+        seconds = float(query.get('seconds', 10))
+        interval_ms = float(query.get('interval_ms', 5))
+        top = int(query.get('top', 50))
+    except ValueError:
+        raise ValueError('seconds, interval_ms and top must be numbers') from None
+    if not 0 < seconds <= max_seconds:
+        raise ValueError(f"seconds must be between 0 and {max_seconds:g}")
+    if not 1 <= interval_ms <= 1000:
+        raise ValueError('interval_ms must be between 1 and 1000')
+    return {'mode': mode, 'seconds': seconds, 'interval_ms': interval_ms, 'format': fmt, 'sort': sort,
+            'top': max(1, top), 'idle': query.get('idle', '0').lower() in ('1', 'true', 'yes')}
+
+
+def parse_tracemalloc_query(query, max_seconds):
+    """(seconds, top, group_by, frames, keep) from query parameters; raises ValueError"""
+    group_by = query.get('group', 'lineno')
+    if group_by not in ALLOCATION_GROUPS:
+        raise ValueError(f"group must be one of {', '.join(ALLOCATION_GROUPS)}")
+    try:
+        seconds = float(query.get('seconds', 10))
+        top = int(query.get('top', 25))
+        frames = int(query.get('frames', 10 if group_by == 'traceback' else 1))
+    except ValueError:
+        raise ValueError('seconds, top and frames must be numbers') from None
+    if not 0 <= seconds <= max_seconds:
+        raise ValueError(f"seconds must be between 0 and {max_seconds:g}")
+    return seconds, max(1, top), group_by, max(1, frames), query.get('keep', '0').lower() in ('1', 'true', 'yes')
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame):
+    """('outer;...;inner' for a frame and its callers, whether the thread is only waiting for work)"""
+    code = frame.f_code
+    idle = (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return ';'.join(labels), idle
+
+
+class StackSampler:
+    """Background thread that counts the collapsed Python stacks of other threads"""
+
+    def __init__(self, interval, thread_id=None, label=None, include_idle=False):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.label = label
+        self.include_idle = include_idle
+        self.stacks = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (self.thread_id is not None and ident != self.thread_id):
+                    continue
+                stack, idle = collapse_stack(frame)
+                self.samples += 1
+                if idle and not self.include_idle:
+                    self.idle_samples += 1
+                    continue
+                self.stacks[f"{self.label or names.get(ident, ident)};{stack}"] += 1
+
+
+def profiled_call(mode, interval, func, *args):
+    """Run func(*args) in a pool worker under a profiler; returns (result, profile data)
+
+    cprofile data is a pstats dict; sample data a Counter of collapsed stacks.
+    """
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        result = profiler.runcall(func, *args)
+        profiler.create_stats()
+        return result, profiler.stats
+    sampler = StackSampler(interval, thread_id=threading.get_ident(),
+                           label=f"{threading.current_thread().name} (pid {os.getpid()})").start()
+    try:
+        result = func(*args)
+    finally:
+        sampler.stop()
+    return result, sampler.stacks
+
+
+class _RawStats:
+    """pstats.Stats source for a plain stats dict, e.g. one sent back by a pool process"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def merge_pstats(stats_dicts):
+    stats = pstats.Stats()
+    for raw in stats_dicts:
+        if raw:
+            stats.add(_RawStats(raw))
+    return stats
+
+
+def render_pstats(stats, fmt, sort, top):
+    """(body, content type) for merged pstats.Stats"""
+    if fmt == 'prof':
+        return marshal.dumps(stats.stats), 'application/octet-stream'
+    stream = io.StringIO()
+    stats.stream = stream
+    stats.strip_dirs().sort_stats(sort).print_stats(top)
+    return stream.getvalue().encode(), 'text/plain; charset=utf-8'
+
+
+def render_collapsed(stacks):
+    """(body, content type) for collapsed stack counts, one 'stack count' line each"""
+    body = ''.join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+    return body.encode(), 'text/plain; charset=utf-8'
+
+
+class ProfileCapture:
+    """One running capture; the detection engine routes pool calls through it"""
+
+    def __init__(self, mode, interval, include_idle=False):
+        self.mode = mode
+        self.interval = interval
+        self.include_idle = include_idle
+        self.worker_calls = 0
+        self.worker_stats = []
+        self.stacks = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self._profiler = None
+        self._sampler = None
+
+    def wraps(self, backend):
+        """Whether pool calls need their own profiler to show up in this capture"""
+        if backend == 'process':
+            return True
+        return self.mode == 'cprofile' and PER_THREAD_CPROFILE
+
+    def add_worker_data(self, data):
+        self.worker_calls += 1
+        if self.mode == 'cprofile':
+            self.worker_stats.append(data)
+        else:
+            self.stacks.update(data)
+
+    def start(self):
+        if self.mode == 'cprofile':
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._sampler = StackSampler(self.interval, include_idle=self.include_idle).start()
+
+    def stop(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.create_stats()
+        if self._sampler is not None:
+            self._sampler.stop()
+            self.stacks.update(self._sampler.stacks)
+            self.samples = self._sampler.samples
+            self.idle_samples = self._sampler.idle_samples
+
+    def render(self, fmt, sort, top):
+        if self.mode == 'cprofile':
+            return render_pstats(merge_pstats([self._profiler.stats, *self.worker_stats]), fmt, sort, top)
+        return render_collapsed(self.stacks)
+
+
+class ServiceProfiler:
+    """Runs one capture at a time against the live process and its detection pool"""
+
+    def __init__(self, engine, max_seconds=60.0):
+        self.engine = engine
+        self.max_seconds = max_seconds
+        self.captures = 0
+        self.last = None
+        self._busy = False
+
+    async def profile(self, mode, seconds, interval_ms=5, include_idle=False):
+        """Capture for `seconds` and return the stopped ProfileCapture; raises ProfileBusy"""
+        capture = ProfileCapture(mode, interval_ms / 1000, include_idle)
+        with self._exclusive(f'{mode} profile'):
+            capture.start()
+            self.engine.profile_capture = capture
+            started = time.monotonic()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                self.engine.profile_capture = None
+                capture.stop()
+                self.last = {'kind': mode, 'seconds': round(time.monotonic() - started, 1),
+                             'worker_calls': capture.worker_calls, 'samples': capture.samples,
+                             'finished_at': time.time()}
+        return capture
+
+    async def trace_allocations(self, seconds, top=25, group_by='lineno', frames=1, keep=False):
+        """Top allocation sites now and their growth over `seconds`; raises ProfileBusy"""
+        with self._exclusive('tracemalloc'):
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start(frames)
+            try:
+                ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+                loop = asyncio.get_running_loop()
+                before = (await loop.run_in_executor(None, tracemalloc.take_snapshot)).filter_traces(ignore)
+                await asyncio.sleep(seconds)
+                after = (await loop.run_in_executor(None, tracemalloc.take_snapshot)).filter_traces(ignore)
+                current, peak = tracemalloc.get_traced_memory()
+            finally:
+                if started_tracing and not keep:
+                    tracemalloc.stop()
+            growth = [stat for stat in after.compare_to(before, group_by) if stat.size_diff][:top]
+            self.last = {'kind': 'tracemalloc', 'seconds': seconds, 'finished_at': time.time()}
+            return {
+                'seconds': seconds,
+                'group_by': group_by,
+                'tracing_started_for_capture': started_tracing,
+                'traced_mb': round(current / 1048576, 2),
+                'peak_traced_mb': round(peak / 1048576, 2),
+                'top': [_allocation(stat, group_by) for stat in after.statistics(group_by)[:top]],
+                'growth': [_allocation(stat, group_by) for stat in growth]
+            }
+
+    @contextmanager
+    def _exclusive(self, kind):
+        if self._busy:
+            raise ProfileBusy("Another capture is already running")
+        self._busy = True
+        self.captures += 1
+        logger.info(f"🔬 Starting {kind} capture")
+        try:
+            yield
+        finally:
+            self._busy = False
+
+    def info(self):
+        return {'busy': self._busy, 'captures': self.captures, 'max_seconds': self.max_seconds,
+                'tracemalloc_tracing': tracemalloc.is_tracing(), 'last': self.last}
+
+
+def _allocation(stat, group_by):
+    # Tracebacks run oldest call first; list the allocating line first
+    frames = list(stat.traceback)[::-1] if group_by == 'traceback' else [stat.traceback[-1]]
+    entry = {'location': ' <- '.join(f"{frame.filename}:{frame.lineno}" for frame in frames),
+             'size_kb': round(stat.size / 1024, 1), 'count': stat.count}
+    if hasattr(stat, 'size_diff'):
+        entry.update({'size_diff_kb': round(stat.size_diff / 1024, 1), 'count_diff': stat.count_diff})
+    return entry
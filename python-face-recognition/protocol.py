@@ -0,0 +1,189 @@
+"""WebSocket frame protocols.
+
+v1 (default): every binary message is a JSON header line followed by the
+image bytes, and every result is a JSON object.
+
+v2 (negotiated): the client sends a text handshake once per participant,
+
+    {"type": "hello", "protocol": 2, "session_id": ..., "participant_id": ..., "name": ...}
+
+and gets back a channel number in a "hello_ack". Frames then carry a fixed
+12-byte little-endian header in front of the image bytes:
+
+    version u8 | format u8 | channel u16 | seq u32 | width u16 | height u16
+
+Both versions can be mixed on one connection: a v1 header starts with '{'
+and a v2 frame with its version byte (2).
+
+format is 0 for an encoded image (JPEG/PNG, sniffed by the decoder) or
+1 + its index in FRAME_FORMATS; width/height are only read for raw formats.
+
+Results come back as binary records that start with the same
+version/status/channel/seq prefix. A status of STATUS_OK is followed by
+the fixed result fields, one u16 per sliding window (attention in
+hundredths of a percent, in the order listed in the hello_ack) and
+`faces` face boxes. STATUS_OVERLOADED is followed by a u32 retry-after in
+milliseconds and the UTF-8 shedding reason; any other status by a UTF-8
+error message.
+"""
+import json
+import struct
+
+from frame_decode import FRAME_FORMATS
+
+PROTOCOL_V1 = 1
+PROTOCOL_V2 = 2
+PROTOCOLS = (PROTOCOL_V1, PROTOCOL_V2)
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+STATUS_OVERLOADED = 2
+
+ATTENTION_LEVELS = ('low', 'medium', 'high')
+MAX_CHANNELS = 0xFFFF
+
+FRAME_HEADER = struct.Struct('<BBHIHH')
+RESULT_PREFIX = struct.Struct('<BBHI')
+# Prefix, then faces, attention level, dropped frames, attention (1/100 %),
+# total frames, face frames, session seconds, detect ms
+RESULT_HEADER = struct.Struct('<BBHIBBHHIIIf')
+FACE = struct.Struct('<HHHHf')
+RETRY_AFTER = struct.Struct('<I')
+
+
+class ProtocolError(ValueError):
+    """Raised for frame messages that do not follow their protocol's layout"""
+
+
+def parse_v1_frame(message):
+    """Split a v1 message into (frame_info, image bytes view); raises ProtocolError"""
+    header_end = message.find(b'\n')
+    if header_end == -1:
+        raise ProtocolError("Invalid message format - no header separator")
+    # A view, not a copy: the image bytes stay in the received message
+    image_data = memoryview(message)[header_end + 1:]
+    if not image_data:
+        raise ProtocolError("No image data received")
+    try:
+        frame_info = json.loads(message[:header_end])
+    except ValueError as e:
+        raise ProtocolError(f"Invalid JSON in header: {e}")
+    if not isinstance(frame_info, dict):
+        raise ProtocolError("Invalid JSON in header: expected an object")
+    return frame_info, image_data
+
+
+def format_code(name):
+    """Header format byte for a FRAME_FORMATS name (0 = encoded, sniffed)"""
+    return FRAME_FORMATS.index(name) + 1 if name else 0
+
+
+class ChannelTable:
+    """Per-connection session/participant bindings made by v2 handshakes"""
+
+    __slots__ = ('_channels', '_by_key')
+
+    def __init__(self):
+        self._channels = []
+        self._by_key = {}
+
+    def bind(self, session_id, participant_id, name, role=None):
+        """Bind a participant to a channel number, reusing it on a repeated hello"""
+        key = (session_id, participant_id)
+        channel = self._by_key.get(key)
+        if channel is None:
+            if len(self._channels) >= MAX_CHANNELS:
+                raise ProtocolError("Too many participants bound to this connection")
+            channel = len(self._channels)
+            self._channels.append(None)
+            self._by_key[key] = channel
+        self._channels[channel] = {
+            'session_id': session_id,
+            'participant_id': participant_id,
+            'name': name,
+            'role': role,
+            'channel': channel
+        }
+        return channel
+
+    def parse_frame(self, message):
+        """Split a v2 binary message into (frame_info, image_data)"""
+        if len(message) <= FRAME_HEADER.size:
+            raise ProtocolError("Frame shorter than the v2 header")
+        version, fmt, channel, seq, width, height = FRAME_HEADER.unpack_from(message)
+        if version != PROTOCOL_V2:
+            raise ProtocolError(f"Unsupported frame version {version}")
+        if channel >= len(self._channels):
+            raise ProtocolError(f"Unknown channel {channel}; send a hello first")
+        if fmt > len(FRAME_FORMATS):
+            raise ProtocolError(f"Unknown frame format {fmt}")
+
+        frame_info = dict(self._channels[channel])
+        frame_info['seq'] = seq
+        if fmt:
+            frame_info['format'] = FRAME_FORMATS[fmt - 1]
+            frame_info['width'] = width
+            frame_info['height'] = height
+        return frame_info, memoryview(message)[FRAME_HEADER.size:]
+
+
+def encode_result(frame_info, participant, detection, window_scores, session_seconds, dropped=0):
+    """Pack one analyzed frame into a v2 result record"""
+    faces = detection['faces'][:255]
+    score = participant.attention_score
+    level = 2 if score >= 80 else 1 if score >= 60 else 0
+    parts = [RESULT_HEADER.pack(
+        PROTOCOL_V2, STATUS_OK, frame_info['channel'], frame_info['seq'],
+        len(faces), level, min(dropped, 0xFFFF), int(score * 100),
+        participant.total_frames, participant.face_detected_frames,
+        int(session_seconds), detection.get('detect_ms', 0.0)
+    )]
+    parts.append(struct.pack(f'<{len(window_scores)}H', *(int(s * 100) for s in window_scores)))
+    for x, y, w, h, confidence in faces:
+        parts.append(FACE.pack(x, y, w, h, confidence))
+    return b''.join(parts)
+
+
+def encode_error(frame_info, message):
+    """Pack an error for a v2 frame; frame_info may be None if it never parsed"""
+    channel = frame_info.get('channel', 0) if frame_info else 0
+    seq = frame_info.get('seq', 0) if frame_info else 0
+    return RESULT_PREFIX.pack(PROTOCOL_V2, STATUS_ERROR, channel, seq) + message.encode('utf-8')
+
+
+def encode_overloaded(frame_info, retry_after_ms, reason):
+    """Pack a load-shedding response for a v2 frame"""
+    return (RESULT_PREFIX.pack(PROTOCOL_V2, STATUS_OVERLOADED, frame_info['channel'], frame_info['seq'])
+            + RETRY_AFTER.pack(retry_after_ms) + reason.encode('utf-8'))
+
+
+def decode_result(data, windows):
+    """Unpack a v2 result record into a dict (client side / tests)"""
+    version, status, channel, seq = RESULT_PREFIX.unpack_from(data)
+    if status == STATUS_OVERLOADED:
+        retry_after_ms, = RETRY_AFTER.unpack_from(data, RESULT_PREFIX.size)
+        reason = bytes(data[RESULT_PREFIX.size + RETRY_AFTER.size:]).decode('utf-8')
+        return {'channel': channel, 'seq': seq, 'overloaded': True, 'reason': reason, 'retry_after_ms': retry_after_ms}
+    if status != STATUS_OK:
+        return {'channel': channel, 'seq': seq, 'error': bytes(data[RESULT_PREFIX.size:]).decode('utf-8')}
+
+    fields = RESULT_HEADER.unpack_from(data)
+    faces, level, dropped, score, total, detected, seconds, detect_ms = fields[4:]
+    offset = RESULT_HEADER.size
+    scores = struct.unpack_from(f'<{len(windows)}H', data, offset)
+    offset += 2 * len(windows)
+    boxes = [FACE.unpack_from(data, offset + i * FACE.size) for i in range(faces)]
+    return {
+        'channel': channel,
+        'seq': seq,
+        'faces_detected': faces,
+        'faces': [{'x': x, 'y': y, 'width': w, 'height': h, 'confidence': c} for x, y, w, h, c in boxes],
+        'attention_level': ATTENTION_LEVELS[level],
+        'attention_score': score / 100,
+        'recent_attention': {label: s / 100 for label, s in zip(windows, scores)},
+        'dropped_frames': dropped,
+        'total_frames': total,
+        'face_detected_frames': detected,
+        'session_duration_seconds': seconds,
+        'detect_ms': round(detect_ms, 2)
+    }
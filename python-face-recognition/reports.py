@@ -0,0 +1,337 @@
+"""Report helpers shared by the single-process endpoints and the cluster supervisor."""
+import base64
+import hashlib
+import json
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+# Fields of one participant's report entry, in the order the endpoints return them
+REPORT_FIELDS = (
+    'name', 'total_frames', 'face_detected_frames', 'attention_score',
+    'recent_attention', 'last_seen', 'session_start'
+)
+# Fields merge_participant_reports needs to combine a participant's entries
+MERGE_FIELDS = ('total_frames', 'face_detected_frames', 'last_seen', 'session_start')
+
+# Bytes of NDJSON buffered before each write to an export stream
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+
+def attention_grade(score):
+    """Letter grade, label and display colour for an overall attention score"""
+    if score >= 90:
+        return {"grade": "A", "label": "Excellent", "color": "#4CAF50"}
+    if score >= 80:
+        return {"grade": "B", "label": "Good", "color": "#8BC34A"}
+    if score >= 70:
+        return {"grade": "C", "label": "Average", "color": "#FF9800"}
+    if score >= 60:
+        return {"grade": "D", "label": "Below Average", "color": "#FF5722"}
+    return {"grade": "F", "label": "Poor", "color": "#F44336"}
+
+
+def session_report_payload(session_id, participants, overall_attention):
+    """/session/{id}/report body for a list of participant report entries"""
+    return {
+        "success": True,
+        "session_id": session_id,
+        "overall_attention_score": overall_attention,
+        "grade": attention_grade(overall_attention),
+        "participants": participants,
+        "participant_count": len(participants),
+        "generated_at": datetime.now().isoformat()
+    }
+
+
+def _latest(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
+
+
+def merge_participant_reports(a, b):
+    """Combine two report entries (ParticipantState.to_dict()) for the same participant
+
+    A participant whose connections landed on different worker processes
+    has a record on each; frame counts add up, the session starts at the
+    earliest record and the sliding windows come from the most recent one.
+    """
+    total = a['total_frames'] + b['total_frames']
+    detected = a['face_detected_frames'] + b['face_detected_frames']
+    newest = a if (a.get('last_seen') or '') >= (b.get('last_seen') or '') else b
+    merged = dict(newest)
+    merged.update({
+        'total_frames': total,
+        'face_detected_frames': detected,
+        'attention_score': round(detected / total * 100, 2) if total else 0,
+        'last_seen': _latest(a.get('last_seen'), b.get('last_seen')),
+        'session_start': min(a['session_start'], b['session_start'])
+    })
+    return merged
+
+
+def merge_attention_data(parts):
+    """Merge several {session_id: {participant_id: report}} mappings into one"""
+    merged = {}
+    for data in parts:
+        for session_id, participants in data.items():
+            session = merged.setdefault(session_id, {})
+            for participant_id, report in participants.items():
+                existing = session.get(participant_id)
+                session[participant_id] = report if existing is None else merge_participant_reports(existing, report)
+    return merged
+
+
+def average_attention(attention_data):
+    """Mean attention score of participants with a non-zero score, rounded"""
+    scores = [
+        report['attention_score']
+        for participants in attention_data.values()
+        for report in participants.values()
+        if report['attention_score'] > 0
+    ]
+    return round(sum(scores) / len(scores)) if scores else 0
+
+
+def encode_cursor(session_id, participant_id):
+    """Opaque pagination cursor pointing just after (session_id, participant_id)"""
+    raw = json.dumps([session_id, participant_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for a malformed cursor"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError('invalid cursor') from e
+    if not (isinstance(key, list) and len(key) == 2 and all(isinstance(part, str) for part in key)):
+        raise ValueError('invalid cursor')
+    return tuple(key)
+
+
+def parse_export_query(query):
+    """(session_id, fields, after, limit) from export query parameters; raises ValueError
+
+    fields defaults to every report field, after is the decoded cursor (or
+    None) and a limit of 0 means no limit.
+    """
+    session_id = query.get('session_id') or None
+    fields = REPORT_FIELDS
+    if query.get('fields'):
+        fields = tuple(field.strip() for field in query['fields'].split(',') if field.strip())
+        unknown = [field for field in fields if field not in REPORT_FIELDS]
+        if unknown:
+            raise ValueError(f"unknown fields: {', '.join(unknown)} (expected {', '.join(REPORT_FIELDS)})")
+    after = decode_cursor(query['cursor']) if query.get('cursor') else None
+    try:
+        limit = int(query.get('limit', 0))
+    except ValueError:
+        raise ValueError('limit must be an integer') from None
+    if limit < 0:
+        raise ValueError('limit must not be negative')
+    return session_id, fields, after, limit
+
+
+def iter_participants(attention_data, session_id=None, after=None):
+    """Yield (session_id, participant_id, participant) ordered by session then participant id
+
+    The order is stable, so `after` (a key from a previous page) resumes
+    exactly where that page stopped even if participants came or went in
+    between. Only keys are sorted up front, one session at a time, and
+    entries removed while the caller is suspended are skipped.
+    """
+    session_ids = sorted(attention_data, key=str) if session_id is None else [session_id]
+    keys = [str(sid) for sid in session_ids]
+    start = bisect_left(keys, after[0]) if after else 0
+    for sid, key in zip(session_ids[start:], keys[start:]):
+        session = attention_data.get(sid)
+        if session is None:
+            continue
+        participant_ids = sorted(session, key=str)
+        if after and key == after[0]:
+            participant_ids = participant_ids[bisect_right([str(pid) for pid in participant_ids], after[1]):]
+        for pid in participant_ids:
+            participant = session.get(pid)
+            if participant is not None:
+                yield sid, pid, participant
+
+
+def export_end(count, last_key, more):
+    """Trailer line of an NDJSON export: record count and the cursor for the next page"""
+    return json.dumps({
+        'end': True,
+        'count': count,
+        'next_cursor': encode_cursor(*last_key) if more and last_key else None
+    }) + '\n'
+
+
+class SessionAggregate:
+    """Running totals for one session, updated as frames are recorded"""
+
+    __slots__ = ('version', 'participants', 'score_sum', 'nonzero_sum', 'nonzero_count')
+
+    def __init__(self):
+        self.version = 0
+        self.participants = 0
+        self.score_sum = 0.0
+        self.nonzero_sum = 0.0
+        self.nonzero_count = 0
+
+    def add_score(self, score, sign=1):
+        self.score_sum += sign * score
+        if score > 0:
+            self.nonzero_sum += sign * score
+            self.nonzero_count += sign
+
+    def overall_score(self):
+        return round(self.score_sum / self.participants) if self.participants else 0
+
+
+class ReportAggregates:
+    """Incrementally maintained report totals and cached report bodies.
+
+    Every change to attention data goes through record()/remove_participant()/
+    forget_session()/rebuild(), which keep per-session and global totals and
+    bump version counters. Rendered report bodies are cached under those
+    versions, so serving an unchanged report (or answering its ETag with a
+    304) costs O(1) however many sessions exist.
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self.version = 0
+        self.participants = 0
+        self.nonzero_sum = 0.0
+        self.nonzero_count = 0
+        # Distinguishes versions from different process lifetimes in ETags
+        self.epoch = format(int(time.time() * 1000) & 0xFFFFFFFF, 'x')
+        self._cache = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Called with (session_id, participant_id, removed) after every change;
+        # participant_id None means the session ended, session_id None a rebuild
+        self.on_change = None
+
+    def _session(self, session_id):
+        aggregate = self.sessions.get(session_id)
+        if aggregate is None:
+            aggregate = self.sessions[session_id] = SessionAggregate()
+        return aggregate
+
+    def _changed(self, aggregate):
+        # Session versions come from the global counter so a session that is
+        # reset and then recreated never reuses an earlier ETag
+        self.version += 1
+        aggregate.version = self.version
+
+    def record(self, session_id, participant_id, old_score, new_score, new_participant=False):
+        """A participant's score moved from old_score to new_score (after a frame)"""
+        aggregate = self._session(session_id)
+        if new_participant:
+            aggregate.participants += 1
+            self.participants += 1
+        else:
+            aggregate.add_score(old_score, -1)
+            self._add_global(old_score, -1)
+        aggregate.add_score(new_score)
+        self._add_global(new_score)
+        self._changed(aggregate)
+        if self.on_change is not None:
+            self.on_change(session_id, participant_id)
+
+    def _add_global(self, score, sign=1):
+        if score > 0:
+            self.nonzero_sum += sign * score
+            self.nonzero_count += sign
+
+    def remove_participant(self, session_id, participant_id, score):
+        aggregate = self.sessions.get(session_id)
+        if aggregate is None:
+            return
+        aggregate.participants -= 1
+        self.participants -= 1
+        aggregate.add_score(score, -1)
+        self._add_global(score, -1)
+        if aggregate.participants <= 0:
+            self.forget_session(session_id)
+            return
+        self._changed(aggregate)
+        if self.on_change is not None:
+            self.on_change(session_id, participant_id, True)
+
+    def forget_session(self, session_id):
+        aggregate = self.sessions.pop(session_id, None)
+        if aggregate is None:
+            return
+        self.participants -= aggregate.participants
+        self.nonzero_sum -= aggregate.nonzero_sum
+        self.nonzero_count -= aggregate.nonzero_count
+        self.version += 1
+        self._cache = {key: entry for key, entry in self._cache.items() if key[1] != session_id}
+        if self.on_change is not None:
+            self.on_change(session_id)
+
+    def rebuild(self, attention_data):
+        """Recompute every total from scratch (startup recovery, full reset)"""
+        self.sessions.clear()
+        self.participants = 0
+        self.nonzero_sum = 0.0
+        self.nonzero_count = 0
+        self._cache.clear()
+        for session_id, participants in attention_data.items():
+            aggregate = self._session(session_id)
+            for participant in participants.values():
+                aggregate.participants += 1
+                aggregate.add_score(participant.attention_score)
+            self.participants += aggregate.participants
+            self.nonzero_sum += aggregate.nonzero_sum
+            self.nonzero_count += aggregate.nonzero_count
+        self.version += 1
+        if self.on_change is not None:
+            self.on_change(None)
+
+    def average_attention(self, session_id=None):
+        if session_id is not None:
+            aggregate = self.sessions.get(session_id)
+            if aggregate is None or not aggregate.nonzero_count:
+                return 0
+            return round(aggregate.nonzero_sum / aggregate.nonzero_count)
+        return round(self.nonzero_sum / self.nonzero_count) if self.nonzero_count > 0 else 0
+
+    def session_version(self, session_id):
+        aggregate = self.sessions.get(session_id)
+        return aggregate.version if aggregate is not None else None
+
+    def etag(self, kind, session_id=None):
+        version = self.version if session_id is None else self.session_version(session_id)
+        if session_id is None:
+            return f'"{kind}-{self.epoch}-{version}"'
+        # Session ids are client-supplied; keep them (and any quotes) out of the header
+        session_hash = hashlib.blake2b(session_id.encode(), digest_size=8).hexdigest()
+        return f'"{kind}-{self.epoch}-{session_hash}-{version}"'
+
+    def cached(self, kind, session_id, version, render):
+        """Body for (kind, session_id) at `version`, rendering it only if it changed"""
+        key = (kind, session_id)
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] == version:
+            self.cache_hits += 1
+            return entry[1]
+        self.cache_misses += 1
+        body = render()
+        self._cache[key] = (version, body)
+        return body
+
+    def info(self):
+        return {
+            'version': self.version,
+            'sessions': len(self.sessions),
+            'participants': self.participants,
+            'cached_bodies': len(self._cache),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses
+        }
@@ -1,9 +1,6 @@
 import asyncio
 import websockets
 import json
-import base64
-import cv2
-import numpy as np
 from datetime import datetime
 import logging
 from aiohttp import web
@@ -11,12 +8,38 @@ import aiohttp_cors
 import sys
 import traceback
 import socket
+import signal
 import os
+import time
 import dotenv
 
+from config import env_bool, env_float, env_int, env_str
+from admission import ROLE_ATTENDEE, AdmissionController
+from attention_store import AttentionStore
+from detection_engine import BatchScheduler, DetectionEngine
+from detectors import create_detector
+from eviction import AttentionEvictor
+from frame_decode import FRAME_FORMATS
+from frame_batch import FRAME_STREAM_TYPES, FrameBatch, iter_multipart_frames, iter_stream_frames
+from frame_ring import FrameRing, FrameRingError
+from frame_mailbox import FrameMailbox
+from metrics import ServiceMetrics
+from pacing import FrameRateAdvisor
+from profiling import ProfileBusy, ServiceProfiler, is_admin_request, parse_profile_query, parse_tracemalloc_query
+from startup import (DEFAULT_HTTP_PORT, StartupTimer, announce, bind_listener, bind_unix_listener, port_setting,
+                     remove_ports_file, remove_unix_socket)
+from participants import ParticipantState, parse_windows, ring_size_for, window_label
+from reports import (EXPORT_CHUNK_BYTES, ReportAggregates, export_end,
+                     iter_participants, parse_export_query, session_report_payload)
+from subscriptions import ReportSubscriptions
+from protocol import (FRAME_HEADER, PROTOCOL_V2, PROTOCOLS, RESULT_HEADER, STATUS_OK,
+                      ChannelTable, ProtocolError, encode_error, encode_overloaded, encode_result, parse_v1_frame)
+
 # Load environment variables from .env file
 dotenv.load_dotenv()
 
+DEFAULT_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'attention')
+
 
 # Fix Windows encoding issues
 if sys.platform.startswith('win'):
@@ -29,57 +52,73 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# 🔧 FIX 1: IMPROVED PORT CHECKING WITH BETTER SOCKET HANDLING
-def is_port_available(port, host='0.0.0.0'):
-    """Check if a port is available with improved socket handling"""
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # Allow port reuse
-            s.settimeout(2)
-            result = s.connect_ex((host, port))
-            return result != 0
-    except Exception as e:
-        logger.warning(f"Error checking port {port}: {e}")
-        return False
-
-# 🔧 FIX 2: ENHANCED PORT FINDING WITH WIDER RANGE
-def find_available_port(start_port, max_attempts=50):
-    """Find an available port with expanded search range"""
-    logger.info(f"Searching for available port starting from {start_port}")
-    
-    for i in range(max_attempts):
-        port = start_port + i
-        if is_port_available(port):
-            logger.info(f"Found available port: {port}")
-            return port
-        else:
-            logger.debug(f"Port {port} is busy")
-    
-    raise Exception(f"No available port found in range {start_port}-{start_port + max_attempts}")
-
 class FaceRecognitionService:
     def __init__(self):
         self.connected_clients = set()
+        self.trusted_clients = set()
         self.attention_data = {}
-        self.face_cascade = None
+        self.detector = None
         self.http_port = None
         self.ws_port = None
+        self.ws_unix_socket = None
         self.http_runner = None
         self.ws_server = None
+        self.ws_unix_server = None
+        self.engine = DetectionEngine()
+        self.scheduler = BatchScheduler(self.engine)
+        self.tracking_enabled = env_bool('FACE_TRACKING', True)
+        self.full_scan_interval = max(1, env_int('TRACKING_FULL_SCAN_INTERVAL', 10))
+        self.tracking_margin = env_float('TRACKING_MARGIN', 0.5)
+        self.scan_counts = {'full': 0, 'roi': 0, 'roi_miss': 0, 'skip': 0}
+        self.change_detection = env_bool('CHANGE_DETECTION', True)
+        self.change_threshold = env_float('CHANGE_THRESHOLD', 2.0)
+        self.change_refresh_frames = max(1, env_int('CHANGE_REFRESH_FRAMES', 10))
+        self.thumbnail_size = max(4, env_int('CHANGE_THUMBNAIL_SIZE', 16))
+        self.change_counts = {'checked': 0, 'skipped': 0, 'forced_refresh': 0}
+        self.attention_windows = parse_windows(env_str('ATTENTION_WINDOWS'))
+        # Enough slots for the longest window at the client's frame rate; rings
+        # only grow this large for participants who send that many frames
+        self.ring_size = max(1, env_int('ATTENTION_RING_SIZE', ring_size_for(self.attention_windows)))
+        self.store = AttentionStore.from_env(DEFAULT_STORE_DIR)
+        self.evictor = AttentionEvictor.from_env()
+        self.evictor.on_evict = self.on_participant_evicted
+        self.reports = ReportAggregates()
+        self.subscriptions = ReportSubscriptions.from_env(self.reports)
+        self.reports.on_change = self.subscriptions.on_change
+        self.mailbox_capacity = env_int('FRAME_MAILBOX_SIZE', 4)
+        # POST /frames/batch: frames per request, and frames of one request analyzed at once
+        self.batch_max_frames = env_int('FRAME_BATCH_MAX_FRAMES', 5000)
+        self.batch_concurrency = env_int('FRAME_BATCH_CONCURRENCY', 0)
+        self.max_message_bytes = env_int('WS_MAX_MESSAGE_MB', 4) * 1024 * 1024
+        # Shared-memory frame rings, offered to Unix socket clients only
+        self.frame_ring_enabled = env_bool('FRAME_RING', True)
+        self.local_counts = {'connections': 0, 'rings_attached': 0, 'ring_frames': 0, 'ring_bytes': 0,
+                             'ring_stale': 0}
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.metrics = ServiceMetrics()
+        self.pacing = FrameRateAdvisor.from_env(self.engine.workers)
+        self.frames_in_flight = 0
+        self.admission = AdmissionController.from_env(self.engine.workers)
+        # Admin routes need this bearer token; without one they answer local clients only
+        self.admin_token = env_str('ADMIN_TOKEN')
+        self.profiler = ServiceProfiler(self.engine, env_float('PROFILE_MAX_SECONDS', 60.0))
+        self.started_at = time.monotonic()
         self.initialize_opencv()
         
     def initialize_opencv(self):
         """Initialize OpenCV face detection"""
         try:
-            # Try to load face cascade
-            cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-            self.face_cascade = cv2.CascadeClassifier(cascade_path)
+            # Load the configured detector once here so missing model files show
+            # up at startup; pool workers load their own instances
+            self.detector = create_detector(self.engine.detector_name)
             
-            if self.face_cascade.empty():
-                logger.error("Failed to load face cascade classifier")
+            if self.detector is None:
+                logger.error("Failed to load face detector")
                 return False
             
-            logger.info("OpenCV face detection initialized successfully")
+            self.engine.detector_name = self.detector.name
+            logger.info(f"OpenCV face detection initialized successfully ({self.detector.name} detector)")
             return True
         except Exception as e:
             logger.error(f"Error initializing OpenCV: {e}")
@@ -88,20 +127,54 @@ class FaceRecognitionService:
     # 🔧 FIX 3: IMPROVED CONNECTION HANDLING WITH BETTER ERROR RECOVERY
     async def process_frame(self, websocket, path):
         """Handle WebSocket connections for face recognition"""
-        client_ip = websocket.remote_address[0] if websocket.remote_address else "unknown"
-        client_id = f"{client_ip}:{websocket.remote_address[1] if websocket.remote_address else 'unknown'}"
+        # Unix socket connections come from this host and have no peer address
+        local = isinstance(websocket.local_address, str)
+        if local:
+            client_id = f"unix:{id(websocket):x}"
+        else:
+            client_ip = websocket.remote_address[0] if websocket.remote_address else "unknown"
+            client_id = f"{client_ip}:{websocket.remote_address[1] if websocket.remote_address else 'unknown'}"
+        
+        retry_after = self.admission.admit_connection(len(self.connected_clients),
+                                                      self.pacing.recommendation['frame_interval_ms'])
+        if retry_after is not None:
+            logger.warning(f"🚫 Refusing {client_id}: {len(self.connected_clients)} clients connected")
+            try:
+                await websocket.send(json.dumps({
+                    "type": "overloaded",
+                    "error": "Service overloaded, retry later",
+                    "reason": "max_clients",
+                    "retry_after_ms": retry_after
+                }))
+                # 1013 = Try Again Later
+                await websocket.close(code=1013, reason="Service overloaded")
+            except websockets.exceptions.ConnectionClosed:
+                pass
+            return
         
         self.connected_clients.add(websocket)
+        # Only the relay (Unix socket or RELAY_TOKEN) may mark its frames as coming from a host
+        if self.admission.trusted(websocket.request_headers.get('Authorization'), local):
+            self.trusted_clients.add(websocket)
         logger.info(f"✅ New client connected: {client_id}. Total clients: {len(self.connected_clients)}")
         
+        # Frames go through a latest-frame-wins mailbox so a slow detector
+        # drops stale frames instead of letting them pile up
+        mailbox = FrameMailbox(self.mailbox_capacity)
+        channels = ChannelTable()
+        ring = FrameRing(self.max_message_bytes) if local and self.frame_ring_enabled else None
+        if local:
+            self.local_counts['connections'] += 1
+        consumer = asyncio.create_task(self.consume_frames(websocket, mailbox, client_id))
+        
         try:
             async for message in websocket:
                 try:
                     # Handle both binary and text messages
                     if isinstance(message, bytes):
-                        await self.process_binary_message(websocket, message)
+                        await self.process_binary_message(websocket, message, mailbox, channels)
                     else:
-                        await self.process_text_message(websocket, message)
+                        await self.process_text_message(websocket, message, channels, mailbox, ring)
                         
                 except Exception as e:
                     logger.error(f"❌ Error processing message from {client_id}: {e}")
@@ -120,50 +193,287 @@ class FaceRecognitionService:
         except Exception as e:
             logger.error(f"❌ WebSocket error with {client_id}: {e}")
         finally:
+            mailbox.close()
+            consumer.cancel()
+            if ring is not None:
+                ring.close()
+            self.subscriptions.drop(websocket)
             self.connected_clients.discard(websocket)
+            self.trusted_clients.discard(websocket)
             logger.info(f"🧹 Cleaned up connection for {client_id}. Remaining: {len(self.connected_clients)}")
     
-    async def process_binary_message(self, websocket, message):
+    async def consume_frames(self, websocket, mailbox, client_id):
+        """Analyze the newest queued frame for each participant and send results"""
+        # Clients start from the recommendation carried in each v1 result and
+        # in the v2 hello_ack; afterwards only changes are pushed
+        pacing_version = self.pacing.version
+        while True:
+            item = await mailbox.get()
+            if item is None:
+                return
+            
+            key, frame_info, image_data, received_at = item
+            try:
+                # Tell the client whenever the recommended frame rate changes
+                if pacing_version != self.pacing.version:
+                    pacing_version = self.pacing.version
+                    await websocket.send(json.dumps(self.pacing.control_message()))
+
+                queue_wait = time.monotonic() - received_at
+                self.metrics.observe('queue_wait', queue_wait)
+                if 'channel' in frame_info:
+                    dropped = mailbox.take_drop_count(key)
+                    record = await self.analyze_frame_compact(frame_info, image_data, dropped)
+                    self.count_frame(key[0], record[1] != STATUS_OK, dropped)
+                    await self.send_result(websocket, record, received_at)
+                    continue
+                
+                result = await self.analyze_frame(frame_info, image_data)
+                result['dropped_frames'] = mailbox.take_drop_count(key)
+                result['total_dropped_frames'] = mailbox.dropped_by_key.get(key, 0)
+                result['queue_wait_ms'] = round(queue_wait * 1000, 1)
+                if 'frame_id' in frame_info:
+                    # Echo the client's frame id so it can match results to frames
+                    result['frame_id'] = frame_info['frame_id']
+                self.count_frame(key[0], 'error' in result, result['dropped_frames'])
+                await self.send_result(websocket, result, received_at)
+            except websockets.exceptions.ConnectionClosed:
+                return
+            except Exception as e:
+                logger.error(f"❌ Error analyzing frame from {client_id}: {e}")
+                try:
+                    await websocket.send(json.dumps({
+                        "error": f"Processing error: {str(e)}",
+                        "timestamp": datetime.now().isoformat()
+                    }))
+                except Exception:
+                    return
+    
+    def shed_frame(self, frame_info, trusted=False):
+        """Admission check for one frame: None to process it, else (reason, retry_after_ms)"""
+        return self.admission.admit_frame(
+            frame_info.get('session_id', 'default'),
+            self.admission.role(frame_info, trusted),
+            self.frames_in_flight,
+            self.pacing.recommendation['frame_interval_ms'])
+    
+    @staticmethod
+    def overloaded_message(frame_info, reason, retry_after):
+        """v1 reply for a shed frame"""
+        return {
+            "type": "overloaded",
+            "error": "Service overloaded, retry later",
+            "reason": reason,
+            "retry_after_ms": retry_after,
+            "session_id": frame_info.get('session_id', 'default'),
+            "participant_id": frame_info.get('participant_id', 'unknown'),
+            **({"frame_id": frame_info['frame_id']} if 'frame_id' in frame_info else {})
+        }
+    
+    async def analyze_batch_frame(self, frame_info, image_data, received_at, trusted=False):
+        """One frame of a POST /frames/batch request, counted and admitted like a WebSocket frame"""
+        self.frames_received += 1
+        shed = self.shed_frame(frame_info, trusted)
+        if shed is not None:
+            return self.overloaded_message(frame_info, *shed)
+        result = await self.analyze_frame(frame_info, image_data)
+        if 'frame_id' in frame_info:
+            result['frame_id'] = frame_info['frame_id']
+        self.count_frame(frame_info.get('session_id', 'default'), 'error' in result)
+        self.metrics.observe('end_to_end', time.monotonic() - received_at)
+        return result
+    
+    def count_frame(self, session_id, error, dropped=0):
+        """Update the per-session frame, drop and error counters for one result
+
+        Frames whose session has no attention state (undecodable or failed
+        first frames, rejected or made-up session ids) are counted as
+        unattributed, so per-session counters only exist for live sessions
+        and are dropped with them on eviction or reset.
+        """
+        if session_id not in self.attention_data:
+            session_id = None
+        self.metrics.count(session_id, 'errors' if error else 'frames')
+        if dropped:
+            self.metrics.count(session_id, 'dropped', dropped)
+    
+    async def send_result(self, websocket, result, received_at):
+        """Serialize and send a frame result, timing both and the whole frame
+        
+        v2 results arrive already packed (their encoding is timed as 'serialize'
+        by analyze_frame_compact); v1 results are JSON-encoded here.
+        """
+        start = time.perf_counter()
+        if isinstance(result, bytes):
+            payload = result
+        else:
+            payload = json.dumps(result)
+            self.metrics.observe('serialize', time.perf_counter() - start)
+        sent = time.perf_counter()
+        await websocket.send(payload)
+        self.metrics.observe('send', time.perf_counter() - sent)
+        self.metrics.observe('end_to_end', time.monotonic() - received_at)
+    
+    async def process_binary_message(self, websocket, message, mailbox=None, channels=None):
         """Process binary message (header + image data)"""
+        received_at = time.monotonic()
+        # v1 headers are JSON and start with '{'; v2 frames start with their version byte
+        if channels is not None and message[:1] == b'\x02':
+            await self.process_compact_frame(websocket, message, mailbox, channels, received_at)
+            return
         try:
-            # Find the newline separator
-            header_end = message.find(b'\n')
-            if header_end == -1:
-                await websocket.send(json.dumps({"error": "Invalid message format - no header separator"}))
+            try:
+                frame_info, image_data = parse_v1_frame(message)
+            except ProtocolError as e:
+                await websocket.send(json.dumps({"error": str(e)}))
                 return
-                
-            header = message[:header_end].decode('utf-8')
-            image_data = message[header_end + 1:]
             
-            if not image_data:
-                await websocket.send(json.dumps({"error": "No image data received"}))
+            self.frames_received += 1
+            self.metrics.observe('header_parse', time.monotonic() - received_at)
+            
+            shed = self.shed_frame(frame_info, websocket in self.trusted_clients)
+            if shed is not None:
+                await websocket.send(json.dumps(self.overloaded_message(frame_info, *shed)))
                 return
             
-            # Parse header JSON
-            try:
-                frame_info = json.loads(header)
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON decode error: {e}")
-                await websocket.send(json.dumps({"error": f"Invalid JSON in header: {str(e)}"}))
+            # Hand the frame to the connection's mailbox; the consumer task sends the result
+            if mailbox is not None:
+                key = (frame_info.get('session_id', 'default'), frame_info.get('participant_id', 'unknown'))
+                self.frames_dropped += mailbox.put(key, frame_info, image_data, received_at)
                 return
             
             # Process the frame
             result = await self.analyze_frame(frame_info, image_data)
+            self.count_frame(frame_info.get('session_id', 'default'), 'error' in result)
             
             # Send result back
-            await websocket.send(json.dumps(result))
+            await self.send_result(websocket, result, received_at)
             
         except Exception as e:
             logger.error(f"❌ Binary message processing error: {e}")
             await websocket.send(json.dumps({"error": f"Binary processing error: {str(e)}"}))
     
-    async def process_text_message(self, websocket, message):
+    async def process_compact_frame(self, websocket, message, mailbox, channels, received_at):
+        """Process a v2 frame: fixed struct header bound to a channel by a hello"""
+        try:
+            frame_info, image_data = channels.parse_frame(message)
+        except ProtocolError as e:
+            await websocket.send(encode_error(None, str(e)))
+            return
+        
+        self.frames_received += 1
+        self.metrics.observe('header_parse', time.monotonic() - received_at)
+        
+        shed = self.shed_frame(frame_info, websocket in self.trusted_clients)
+        if shed is not None:
+            reason, retry_after = shed
+            await websocket.send(encode_overloaded(frame_info, retry_after, reason))
+            return
+        
+        key = (frame_info['session_id'], frame_info['participant_id'])
+        if mailbox is not None:
+            self.frames_dropped += mailbox.put(key, frame_info, image_data, received_at)
+            return
+        
+        record = await self.analyze_frame_compact(frame_info, image_data)
+        self.count_frame(key[0], record[1] != STATUS_OK)
+        await self.send_result(websocket, record, received_at)
+    
+    async def process_hello(self, websocket, data, channels):
+        """Negotiate the frame protocol and bind a participant to a v2 channel"""
+        protocol = data.get('protocol', PROTOCOL_V2)
+        if protocol not in PROTOCOLS:
+            await websocket.send(json.dumps({
+                "type": "hello_error",
+                "error": f"Unsupported protocol {protocol}",
+                "protocols": list(PROTOCOLS)
+            }))
+            return
+        
+        ack = {'type': 'hello_ack', 'protocol': protocol}
+        if protocol == PROTOCOL_V2:
+            if channels is None or not data.get('session_id') or not data.get('participant_id'):
+                await websocket.send(json.dumps({
+                    "type": "hello_error",
+                    "error": "Protocol 2 needs session_id and participant_id"
+                }))
+                return
+            try:
+                ack['channel'] = channels.bind(str(data['session_id']), str(data['participant_id']),
+                                               data.get('name', 'Unknown'), data.get('role'))
+            except ProtocolError as e:
+                await websocket.send(json.dumps({"type": "hello_error", "error": str(e)}))
+                return
+            ack.update({
+                'frame_header': FRAME_HEADER.format,
+                'result_header': RESULT_HEADER.format,
+                'frame_formats': list(FRAME_FORMATS),
+                'windows': [window_label(seconds) for seconds in self.attention_windows],
+                'pacing': self.pacing.recommendation
+            })
+        await websocket.send(json.dumps(ack))
+    
+    async def process_ring_attach(self, websocket, data, ring):
+        """Map a co-located producer's shared-memory frame ring for this connection"""
+        try:
+            if ring is None:
+                raise FrameRingError("Frame rings are only available on the local Unix socket")
+            ring.attach(data.get('name'))
+        except FrameRingError as e:
+            await websocket.send(json.dumps({"type": "ring_error", "error": str(e)}))
+            return
+        self.local_counts['rings_attached'] += 1
+        logger.info(f"🧵 Attached frame ring {ring.name} ({ring.slots} slots of {ring.slot_bytes} bytes)")
+        await websocket.send(json.dumps({
+            "type": "ring_attached",
+            "name": ring.name,
+            "slots": ring.slots,
+            "slot_bytes": ring.slot_bytes
+        }))
+    
+    async def process_ring_frame(self, websocket, data, mailbox, channels, ring):
+        """Handle the doorbell for a frame written into the connection's ring"""
+        try:
+            if ring is None:
+                raise FrameRingError("Frame rings are only available on the local Unix socket")
+            message = ring.read(data.get('seq'))
+        except FrameRingError as e:
+            await websocket.send(json.dumps({"type": "ring_error", "seq": data.get('seq'), "error": str(e)}))
+            return
+        if message is None:
+            # The producer reused the slot before we got to it
+            self.frames_dropped += 1
+            self.local_counts['ring_stale'] += 1
+            return
+        self.local_counts['ring_frames'] += 1
+        self.local_counts['ring_bytes'] += len(message)
+        # From here on a ring frame is exactly a received binary message
+        await self.process_binary_message(websocket, message, mailbox, channels)
+    
+    async def process_text_message(self, websocket, message, channels=None, mailbox=None, ring=None):
         """Process text message (for commands or JSON data)"""
         try:
             data = json.loads(message)
             
-            # Handle different message types
-            if data.get('type') == 'ping':
+            # Handle different message types; ring doorbells come once per frame
+            if data.get('type') == 'ring_frame':
+                await self.process_ring_frame(websocket, data, mailbox, channels, ring)
+            elif data.get('type') == 'ring_attach':
+                await self.process_ring_attach(websocket, data, ring)
+            elif data.get('type') == 'hello':
+                await self.process_hello(websocket, data, channels)
+            elif data.get('type') == 'pacing':
+                await websocket.send(json.dumps(self.pacing.control_message()))
+            elif data.get('type') == 'subscribe':
+                try:
+                    await self.subscriptions.subscribe(
+                        websocket, data.get('session_ids', data.get('session_id')), data.get('interval_ms'))
+                except ValueError as e:
+                    await websocket.send(json.dumps({"type": "subscribe_error", "error": str(e)}))
+            elif data.get('type') == 'unsubscribe':
+                self.subscriptions.unsubscribe(websocket, data.get('session_ids'))
+                await websocket.send(json.dumps({'type': 'unsubscribed', 'session_ids': data.get('session_ids')}))
+            elif data.get('type') == 'ping':
                 await websocket.send(json.dumps({
                     'type': 'pong',
                     'timestamp': datetime.now().isoformat()
@@ -173,6 +483,8 @@ class FaceRecognitionService:
                     'type': 'status_response',
                     'connected_clients': len(self.connected_clients),
                     'sessions': len(self.attention_data),
+                    'frame_formats': list(FRAME_FORMATS),
+                    'protocols': list(PROTOCOLS),
                     'timestamp': datetime.now().isoformat()
                 }))
             else:
@@ -187,116 +499,247 @@ class FaceRecognitionService:
             logger.error(f"❌ Text message processing error: {e}")
             await websocket.send(json.dumps({"error": f"Text processing error: {str(e)}"}))
     
+    def change_detection_info(self):
+        """Change detection settings, hit rate and the detector time it saved"""
+        checked = self.change_counts['checked']
+        skipped = self.change_counts['skipped']
+        detect = self.metrics.stages.get('detect')
+        mean_detect_ms = detect.total / detect.count * 1000 if detect and detect.count else 0.0
+        return {
+            'enabled': self.change_detection,
+            'threshold': self.change_threshold,
+            'refresh_frames': self.change_refresh_frames,
+            'thumbnail_size': self.thumbnail_size,
+            **self.change_counts,
+            'hit_rate': round(skipped / checked, 3) if checked else 0.0,
+            'detect_ms_saved': round(skipped * mean_detect_ms, 1)
+        }
+    
+    def on_participant_evicted(self, session_id, participant_id, participant, reason):
+        """Keep the durable store, report aggregates and metrics in step with evictions"""
+        self.reports.remove_participant(session_id, participant_id, participant.attention_score)
+        if session_id not in self.attention_data:
+            self.metrics.forget_session(session_id)
+        if self.store is not None:
+            self.store.remove_participant(participant)
+    
+    def session_data_json(self, session_id):
+        """Serialized {participant_id: report} for one session, cached per session version
+        
+        Sliding windows are taken as of each participant's last frame so the
+        cached body only changes when a frame arrives.
+        """
+        def render():
+            session = self.attention_data[session_id]
+            return json.dumps({
+                pid: participant.to_dict(participant.last_seen_mono)
+                for pid, participant in session.items()
+            })
+        return self.reports.cached('data', session_id, self.reports.session_version(session_id), render)
+    
+    def attention_report_body(self, session_id=None):
+        """Body of /attention-report (all sessions, or one); unchanged sessions are not re-serialized"""
+        version = self.reports.version if session_id is None else self.reports.session_version(session_id)
+        
+        def render():
+            session_ids = list(self.attention_data) if session_id is None else [session_id]
+            data = ','.join(f'{json.dumps(sid)}: {self.session_data_json(sid)}' for sid in session_ids)
+            summary = json.dumps({
+                "total_sessions": len(session_ids),
+                "total_participants": (self.reports.participants if session_id is None
+                                       else self.reports.sessions[session_id].participants),
+                "average_attention_score": self.reports.average_attention(session_id),
+                "generated_at": datetime.now().isoformat()
+            })
+            timestamp = json.dumps(datetime.now().isoformat())
+            return f'{{"success": true, "data": {{{data}}}, "summary": {summary}, "timestamp": {timestamp}}}'.encode()
+        return self.reports.cached('report', session_id, version, render)
+    
+    def session_report_body(self, session_id):
+        """Body of /session/{id}/report, cached per session version"""
+        def render():
+            session = self.attention_data[session_id]
+            return json.dumps(session_report_payload(session_id, [
+                {"participant_id": pid, **participant.to_dict(participant.last_seen_mono)}
+                for pid, participant in session.items()
+            ], self.reports.sessions[session_id].overall_score())).encode()
+        return self.reports.cached('session', session_id, self.reports.session_version(session_id), render)
+    
+    def detection_options(self, participant_data, frame_info):
+        """Build per-frame detector options, searching near the last face when tracking"""
+        options = {}
+        # Raw payload formats are negotiated in the frame header
+        if frame_info.get('format'):
+            options['format'] = frame_info['format']
+            options['width'] = frame_info.get('width')
+            options['height'] = frame_info.get('height')
+        
+        if self.change_detection:
+            options['thumbnail_size'] = self.thumbnail_size
+        
+        if participant_data is None:
+            return options
+        if self.change_detection and participant_data.thumbnail is not None:
+            # Let the worker skip detection if the frame barely changed, but
+            # re-detect every change_refresh_frames frames regardless
+            if participant_data.unchanged_frames < self.change_refresh_frames:
+                options['previous_thumbnail'] = participant_data.thumbnail
+                options['change_threshold'] = self.change_threshold
+            else:
+                self.change_counts['forced_refresh'] += 1
+        if (self.tracking_enabled and participant_data.last_face
+                and participant_data.frames_since_full_scan < self.full_scan_interval):
+            options['roi'] = participant_data.last_face
+            options['roi_margin'] = self.tracking_margin
+        return options
+    
+    def update_tracking(self, participant_data, detection):
+        """Remember the participant's face box for the next frame's ROI search"""
+        scan = detection.get('scan', 'full')
+        self.scan_counts[scan] = self.scan_counts.get(scan, 0) + 1
+        
+        if 'frame_diff' in detection:
+            self.change_counts['checked'] += 1
+        if scan == 'skip':
+            # Unchanged frame: reuse the faces found on the reference frame
+            self.change_counts['skipped'] += 1
+            participant_data.unchanged_frames += 1
+            detection['faces'] = participant_data.last_faces or []
+            return
+        participant_data.thumbnail = detection.get('thumbnail')
+        participant_data.last_faces = detection['faces']
+        participant_data.unchanged_frames = 0
+        
+        if scan == 'roi':
+            participant_data.frames_since_full_scan += 1
+        else:
+            participant_data.frames_since_full_scan = 0
+        
+        if detection['faces']:
+            # Track the largest face, which is the participant in front of the webcam
+            participant_data.last_face = max(detection['faces'], key=lambda f: f[2] * f[3])[:4]
+        else:
+            participant_data.last_face = None
+    
+    async def detect_and_record(self, frame_info, image_data):
+        """Detect faces in a frame and record it against its participant
+        
+        Returns (participant_data, detection, now); participant_data is None
+        when the frame could not be decoded.
+        """
+        participant_id = frame_info.get('participant_id', 'unknown')
+        session_id = frame_info.get('session_id', 'default')
+        participant_name = frame_info.get('name', 'Unknown')
+        
+        # Decode and detect in the worker pool so the event loop stays responsive
+        known_participant = self.attention_data.get(session_id, {}).get(participant_id)
+        self.frames_in_flight += 1
+        try:
+            detection = await self.scheduler.submit(image_data, self.detection_options(known_participant, frame_info))
+        finally:
+            self.frames_in_flight -= 1
+        self.pacing.observe_frame(
+            (session_id, participant_id),
+            detection.get('decode_ms', 0.0) + detection.get('detect_ms', 0.0) if detection['decoded'] else None)
+        analyze_start = time.perf_counter()
+        for stage in ('batch_wait', 'dispatch', 'decode', 'detect'):
+            if f'{stage}_ms' in detection and not (stage == 'detect' and detection.get('scan') == 'skip'):
+                self.metrics.observe_ms(stage, detection[f'{stage}_ms'])
+        
+        if not detection['decoded']:
+            return None, detection, None
+        
+        # Initialize session data
+        if session_id not in self.attention_data:
+            self.attention_data[session_id] = {}
+            logger.info(f"📊 Created new session: {session_id[:8]}...")
+        
+        new_participant = participant_id not in self.attention_data[session_id]
+        if new_participant:
+            self.attention_data[session_id][participant_id] = ParticipantState(
+                participant_name, self.ring_size, self.attention_windows)
+            if self.store is not None:
+                self.store.add_participant(session_id, participant_id, self.attention_data[session_id][participant_id])
+            logger.info(f"👤 Added participant: {participant_name} to session {session_id[:8]}...")
+        
+        participant_data = self.attention_data[session_id][participant_id]
+        self.update_tracking(participant_data, detection)
+        
+        if 'detection_error' in detection:
+            logger.error(f"Face detection error: {detection['detection_error']}")
+        
+        # Update lifetime and sliding-window attention scores
+        face_detected = len(detection['faces']) > 0
+        now = time.monotonic()
+        previous_score = participant_data.attention_score
+        participant_data.record_frame(face_detected, now)
+        self.reports.record(session_id, participant_id, previous_score, participant_data.attention_score, new_participant)
+        if self.store is not None:
+            self.store.record_frame(participant_data, face_detected, now)
+        self.evictor.touch(session_id, participant_id, participant_data, self.attention_data)
+        self.metrics.observe('analyze', time.perf_counter() - analyze_start)
+        
+        # Log progress occasionally
+        if participant_data.total_frames % 50 == 0:
+            logger.info(f"📈 {participant_name} ({session_id[:8]}...): "
+                      f"{participant_data.total_frames} frames, "
+                      f"{participant_data.attention_score:.1f}% attention")
+        
+        return participant_data, detection, now
+    
     async def analyze_frame(self, frame_info, image_data):
         """Analyze face and attention in the frame"""
         try:
-            # Decode image
-            img_array = np.frombuffer(image_data, dtype=np.uint8)
-            frame = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+            participant_data, detection, now = await self.detect_and_record(frame_info, image_data)
             
-            if frame is None:
+            if participant_data is None:
                 return {
-                    "error": "Could not decode image - invalid image data", 
+                    "error": detection.get('error', "Could not decode image - invalid image data"), 
                     "timestamp": datetime.now().isoformat()
                 }
             
-            # Get frame info
-            participant_id = frame_info.get('participant_id', 'unknown')
-            session_id = frame_info.get('session_id', 'default')
-            participant_name = frame_info.get('name', 'Unknown')
-            
-            # Initialize session data
-            if session_id not in self.attention_data:
-                self.attention_data[session_id] = {}
-                logger.info(f"📊 Created new session: {session_id[:8]}...")
-            
-            if participant_id not in self.attention_data[session_id]:
-                self.attention_data[session_id][participant_id] = {
-                    'name': participant_name,
-                    'total_frames': 0,
-                    'face_detected_frames': 0,
-                    'attention_score': 0,
-                    'last_seen': None,
-                    'session_start': datetime.now().isoformat()
-                }
-                logger.info(f"👤 Added participant: {participant_name} to session {session_id[:8]}...")
-            
-            participant_data = self.attention_data[session_id][participant_id]
-            participant_data['total_frames'] += 1
-            participant_data['last_seen'] = datetime.now().isoformat()
-            
-            # Detect faces
             faces = []
-            face_count = 0
-            
-            if self.face_cascade is not None:
-                try:
-                    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                    detected_faces = self.face_cascade.detectMultiScale(
-                        gray, 
-                        scaleFactor=1.1, 
-                        minNeighbors=4,
-                        minSize=(30, 30)
-                    )
-                    
-                    face_count = len(detected_faces)
-                    
-                    if face_count > 0:
-                        participant_data['face_detected_frames'] += 1
-                        
-                        for (x, y, w, h) in detected_faces:
-                            faces.append({
-                                'x': int(x),
-                                'y': int(y), 
-                                'width': int(w),
-                                'height': int(h),
-                                'confidence': 0.85  # Haar cascades don't provide confidence
-                            })
-                except Exception as face_error:
-                    logger.error(f"Face detection error: {face_error}")
+            face_count = len(detection['faces'])
             
-            # Calculate attention score
-            if participant_data['total_frames'] > 0:
-                attention_score = (participant_data['face_detected_frames'] / participant_data['total_frames']) * 100
-                participant_data['attention_score'] = round(attention_score, 2)
+            for (x, y, w, h, confidence) in detection['faces']:
+                faces.append({
+                    'x': x,
+                    'y': y, 
+                    'width': w,
+                    'height': h,
+                    'confidence': confidence
+                })
             
             # Determine attention level
             attention_level = "low"
-            if participant_data['attention_score'] >= 80:
+            if participant_data.attention_score >= 80:
                 attention_level = "high"
-            elif participant_data['attention_score'] >= 60:
+            elif participant_data.attention_score >= 60:
                 attention_level = "medium"
             
-            # Calculate session duration
-            try:
-                session_start = datetime.fromisoformat(participant_data['session_start'])
-                session_duration = (datetime.now() - session_start).total_seconds()
-            except:
-                session_duration = 0
+            session_duration = participant_data.session_duration(now)
             
-            result = {
+            return {
                 'timestamp': datetime.now().isoformat(),
-                'session_id': session_id,
-                'participant_id': participant_id,
-                'participant_name': participant_name,
+                'session_id': frame_info.get('session_id', 'default'),
+                'participant_id': frame_info.get('participant_id', 'unknown'),
+                'participant_name': frame_info.get('name', 'Unknown'),
                 'faces_detected': face_count,
                 'faces': faces,
-                'attention_score': participant_data['attention_score'],
+                'detector': detection.get('detector'),
+                'detect_ms': round(detection.get('detect_ms', 0.0), 2),
+                'decode_scale': detection.get('decode_scale', 1),
+                'frame_unchanged': detection.get('scan') == 'skip',
+                'pacing': self.pacing.recommendation,
+                'attention_score': participant_data.attention_score,
+                'recent_attention': participant_data.window_scores(),
                 'attention_level': attention_level,
-                'total_frames': participant_data['total_frames'],
-                'face_detected_frames': participant_data['face_detected_frames'],
+                'total_frames': participant_data.total_frames,
+                'face_detected_frames': participant_data.face_detected_frames,
                 'session_duration_seconds': round(session_duration),
                 'frame_processed': True
             }
             
-            # Log progress occasionally
-            if participant_data['total_frames'] % 50 == 0:
-                logger.info(f"📈 {participant_name} ({session_id[:8]}...): "
-                          f"{participant_data['total_frames']} frames, "
-                          f"{participant_data['attention_score']:.1f}% attention")
-            
-            return result
-            
         except Exception as e:
             logger.error(f"❌ Error in analyze_frame: {e}")
             traceback.print_exc()
@@ -306,6 +749,24 @@ class FaceRecognitionService:
                 "session_id": frame_info.get('session_id', 'unknown'),
                 "participant_id": frame_info.get('participant_id', 'unknown')
             }
+    
+    async def analyze_frame_compact(self, frame_info, image_data, dropped=0):
+        """Analyze a v2 frame and return its packed binary result record"""
+        try:
+            participant_data, detection, now = await self.detect_and_record(frame_info, image_data)
+            if participant_data is None:
+                return encode_error(frame_info, detection.get('error', "Could not decode image - invalid image data"))
+            start = time.perf_counter()
+            record = encode_result(
+                frame_info, participant_data, detection,
+                participant_data.window_scores().values(),
+                participant_data.session_duration(now), dropped)
+            self.metrics.observe('serialize', time.perf_counter() - start)
+            return record
+        except Exception as e:
+            logger.error(f"❌ Error in analyze_frame_compact: {e}")
+            traceback.print_exc()
+            return encode_error(frame_info, f"Frame analysis error: {str(e)}")
 
 # HTTP endpoints for reports and control
 async def health_check(request):
@@ -316,41 +777,36 @@ async def health_check(request):
         headers={'Content-Type': 'text/plain'}
     )
 
+async def readiness_check(request):
+    """Readiness probe: 503 until the service is warm and accepting frames"""
+    return web.json_response(startup.info(), status=200 if startup.is_ready else 503)
+
+def not_modified(request, etag):
+    """True if the client's If-None-Match already names this ETag"""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+
+def cached_json_response(request, etag, render_body):
+    """Serve a cached report body with its ETag, or 304 if the client has it"""
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if not_modified(request, etag):
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=render_body(), content_type='application/json', headers=headers)
+
 async def attention_report(request):
     """Get attention report"""
     try:
         # Get session_id from query parameters if provided
         session_id = request.query.get('session_id')
+        if not (session_id and session_id in service.attention_data):
+            session_id = None
         
-        report_data = service.attention_data
-        
-        if session_id and session_id in report_data:
-            report_data = {session_id: report_data[session_id]}
-        
-        # Calculate summary statistics
-        total_sessions = len(report_data)
-        total_participants = sum(len(session.keys()) for session in report_data.values())
-        
-        # Calculate average attention across all participants
-        all_scores = []
-        for session in report_data.values():
-            for participant in session.values():
-                if participant['attention_score'] > 0:
-                    all_scores.append(participant['attention_score'])
-        
-        average_attention = round(sum(all_scores) / len(all_scores)) if all_scores else 0
-        
-        return web.json_response({
-            "success": True,
-            "data": report_data,
-            "summary": {
-                "total_sessions": total_sessions,
-                "total_participants": total_participants,
-                "average_attention_score": average_attention,
-                "generated_at": datetime.now().isoformat()
-            },
-            "timestamp": datetime.now().isoformat()
-        })
+        etag = service.reports.etag('report', session_id)
+        return cached_json_response(request, etag, lambda: service.attention_report_body(session_id))
     except Exception as e:
         logger.error(f"❌ Error generating report: {e}")
         return web.json_response({
@@ -358,6 +814,83 @@ async def attention_report(request):
             "error": str(e)
         }, status=500)
 
+async def export_attention_report(request):
+    """Stream participant reports as NDJSON, one line per participant
+    
+    Query: session_id, fields (comma-separated subset of the report fields),
+    limit and cursor (next_cursor from the previous page). Lines are written
+    as they are produced, so memory use does not grow with the export and
+    the first participants arrive immediately; the last line is
+    {"end": true, "count": n, "next_cursor": ...}.
+    """
+    try:
+        session_id, fields, after, limit = parse_export_query(request.query)
+    except ValueError as e:
+        return web.json_response({
+            "success": False,
+            "error": str(e)
+        }, status=400)
+    
+    response = web.StreamResponse(headers={
+        'Content-Type': 'application/x-ndjson; charset=utf-8',
+        'Cache-Control': 'no-cache'
+    })
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+    
+    count, last_key, more = 0, None, False
+    chunk, size = [], 0
+    for sid, pid, participant in iter_participants(service.attention_data, session_id, after):
+        if limit and count >= limit:
+            more = True
+            break
+        line = json.dumps({"session_id": sid, "participant_id": pid, **participant.to_dict(fields=fields)}) + '\n'
+        chunk.append(line)
+        size += len(line)
+        count += 1
+        last_key = (str(sid), str(pid))
+        if size >= EXPORT_CHUNK_BYTES:
+            # write() waits for the client to drain, which also yields to frame processing
+            await response.write(''.join(chunk).encode())
+            chunk, size = [], 0
+    chunk.append(export_end(count, last_key, more))
+    await response.write(''.join(chunk).encode())
+    await response.write_eof()
+    return response
+
+async def ingest_frame_batch(request):
+    """Analyze many frames from one request body and stream NDJSON results (see frame_batch.py)"""
+    if request.content_type.startswith('multipart/'):
+        frames = iter_multipart_frames(await request.multipart(), service.max_message_bytes)
+    elif request.content_type in FRAME_STREAM_TYPES:
+        frames = iter_stream_frames(request.content, service.max_message_bytes)
+    else:
+        return web.json_response({
+            "success": False,
+            "error": f"Unsupported Content-Type '{request.content_type}', expected multipart or "
+                     f"{FRAME_STREAM_TYPES[0]}"
+        }, status=415)
+    
+    # By default stay within the attendee in-flight budget, so a batch is not shed by its own frames
+    concurrency = service.batch_concurrency or service.admission.in_flight_limit(ROLE_ATTENDEE)
+    local = isinstance(request.transport.get_extra_info('sockname') if request.transport else None, str)
+    trusted = service.admission.trusted(request.headers.get('Authorization'), local)
+    
+    async def analyze(frame_info, image_data, received_at):
+        return await service.analyze_batch_frame(frame_info, image_data, received_at, trusted)
+    
+    batch = FrameBatch(analyze, concurrency, service.batch_max_frames)
+    response = web.StreamResponse(headers={
+        'Content-Type': 'application/x-ndjson; charset=utf-8',
+        'Cache-Control': 'no-cache'
+    })
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+    await batch.run(frames, response)
+    await response.write_eof()
+    logger.info(f"📦 Frame batch from {request.remote}: {dict(batch.counts)}")
+    return response
+
 async def session_report(request):
     """Get detailed report for a specific session"""
     try:
@@ -369,50 +902,49 @@ async def session_report(request):
                 "error": "Session not found"
             }, status=404)
         
-        session_data = service.attention_data[session_id]
-        
-        # Calculate detailed metrics
-        participants = []
-        total_attention = 0
-        
-        for participant_id, data in session_data.items():
-            participants.append({
-                "participant_id": participant_id,
-                "name": data['name'],
-                "total_frames": data['total_frames'],
-                "face_detected_frames": data['face_detected_frames'],
-                "attention_score": data['attention_score'],
-                "last_seen": data['last_seen'],
-                "session_start": data['session_start']
-            })
-            total_attention += data['attention_score']
-        
-        overall_attention = round(total_attention / len(participants)) if participants else 0
-        
-        # Generate grade based on attention score
-        if overall_attention >= 90:
-            grade = {"grade": "A", "label": "Excellent", "color": "#4CAF50"}
-        elif overall_attention >= 80:
-            grade = {"grade": "B", "label": "Good", "color": "#8BC34A"}
-        elif overall_attention >= 70:
-            grade = {"grade": "C", "label": "Average", "color": "#FF9800"}
-        elif overall_attention >= 60:
-            grade = {"grade": "D", "label": "Below Average", "color": "#FF5722"}
-        else:
-            grade = {"grade": "F", "label": "Poor", "color": "#F44336"}
+        etag = service.reports.etag('session', session_id)
+        return cached_json_response(request, etag, lambda: service.session_report_body(session_id))
+        
+    except Exception as e:
+        logger.error(f"❌ Error generating session report: {e}")
+        return web.json_response({
+            "success": False,
+            "error": str(e)
+        }, status=500)
+
+async def participant_timeline(request):
+    """Get a downsampled attention timeline for one participant"""
+    try:
+        session_id = request.match_info.get('session_id')
+        participant_id = request.match_info.get('participant_id')
+        participant = service.attention_data.get(session_id, {}).get(participant_id)
+        
+        if participant is None:
+            return web.json_response({
+                "success": False,
+                "error": "Participant not found"
+            }, status=404)
+        
+        try:
+            points = min(1000, max(1, int(request.query.get('points', 60))))
+            seconds = float(request.query['seconds']) if 'seconds' in request.query else None
+        except ValueError:
+            return web.json_response({
+                "success": False,
+                "error": "points and seconds must be numbers"
+            }, status=400)
         
         return web.json_response({
             "success": True,
             "session_id": session_id,
-            "overall_attention_score": overall_attention,
-            "grade": grade,
-            "participants": participants,
-            "participant_count": len(participants),
+            "participant_id": participant_id,
+            "name": participant.name,
+            "recent_attention": participant.window_scores(time.monotonic()),
+            "timeline": participant.timeline(points, seconds),
             "generated_at": datetime.now().isoformat()
         })
-        
     except Exception as e:
-        logger.error(f"❌ Error generating session report: {e}")
+        logger.error(f"❌ Error generating participant timeline: {e}")
         return web.json_response({
             "success": False,
             "error": str(e)
@@ -428,11 +960,21 @@ async def reset_attention(request):
         if session_id:
             if session_id in service.attention_data:
                 del service.attention_data[session_id]
+                service.evictor.forget_session(session_id)
+                service.reports.forget_session(session_id)
+                service.metrics.forget_session(session_id)
+                if service.store is not None:
+                    service.store.reset(session_id)
                 message = f"Attention data reset for session {session_id}"
             else:
                 message = f"Session {session_id} not found"
         else:
             service.attention_data.clear()
+            service.evictor.clear()
+            service.reports.rebuild(service.attention_data)
+            service.metrics.forget_sessions(service.attention_data)
+            if service.store is not None:
+                service.store.reset()
             message = "All attention data reset successfully"
         
         logger.info(message)
@@ -447,17 +989,86 @@ async def reset_attention(request):
             "error": str(e)
         }, status=500)
 
+def admin_forbidden():
+    return web.json_response({"success": False, "error": "Admin access required"}, status=403)
+
+async def admin_profile(request):
+    """Profile the live service for ?seconds=N; collapsed stacks or pstats (see profiling.py)"""
+    if not is_admin_request(request, service.admin_token):
+        return admin_forbidden()
+    try:
+        options = parse_profile_query(request.query, service.profiler.max_seconds)
+    except ValueError as e:
+        return web.json_response({"success": False, "error": str(e)}, status=400)
+    try:
+        capture = await service.profiler.profile(options['mode'], options['seconds'], options['interval_ms'],
+                                                 options['idle'])
+    except ProfileBusy as e:
+        return web.json_response({"success": False, "error": str(e)}, status=409)
+    loop = asyncio.get_running_loop()
+    body, content_type = await loop.run_in_executor(None, capture.render, options['format'], options['sort'],
+                                                    options['top'])
+    logger.info(f"🔬 {options['mode']} capture done: {capture.samples} samples, "
+                f"{capture.worker_calls} profiled pool calls")
+    return web.Response(body=body, headers={
+        'Content-Type': content_type,
+        'X-Profile-Samples': str(capture.samples),
+        'X-Profile-Worker-Calls': str(capture.worker_calls)
+    })
+
+async def admin_tracemalloc(request):
+    """Top allocation sites of the service process and their growth over ?seconds=N"""
+    if not is_admin_request(request, service.admin_token):
+        return admin_forbidden()
+    try:
+        seconds, top, group_by, frames, keep = parse_tracemalloc_query(request.query, service.profiler.max_seconds)
+    except ValueError as e:
+        return web.json_response({"success": False, "error": str(e)}, status=400)
+    try:
+        result = await service.profiler.trace_allocations(seconds, top, group_by, frames, keep)
+    except ProfileBusy as e:
+        return web.json_response({"success": False, "error": str(e)}, status=409)
+    return web.json_response({"success": True, **result})
+
 async def service_stats(request):
-    """Get service statistics"""
+    """Get service statistics; ?session_ids=1 also lists the active session ids"""
     try:
+        # The cluster supervisor unions these across workers
+        session_ids = {"session_ids": list(service.attention_data)} if request.query.get('session_ids') else {}
         return web.json_response({
             "success": True,
             "stats": {
                 "connected_clients": len(service.connected_clients),
                 "active_sessions": len(service.attention_data),
-                "total_participants": sum(len(session.keys()) for session in service.attention_data.values()),
-                "opencv_initialized": service.face_cascade is not None,
-                "uptime_seconds": 0,  # You can track this if needed
+                **session_ids,
+                "total_participants": service.reports.participants,
+                "opencv_initialized": service.detector is not None,
+                "detection_engine": service.engine.info(),
+                "attention_store": service.store.info() if service.store is not None else None,
+                "eviction": service.evictor.info(),
+                "reports": service.reports.info(),
+                "subscriptions": service.subscriptions.info(),
+                "batching": service.scheduler.info(),
+                "tracking": {
+                    "enabled": service.tracking_enabled,
+                    "full_scan_interval": service.full_scan_interval,
+                    "scans": service.scan_counts
+                },
+                "change_detection": service.change_detection_info(),
+                "local_transport": {
+                    "unix_socket": service.ws_unix_socket,
+                    "frame_ring": service.frame_ring_enabled,
+                    **service.local_counts
+                },
+                "pacing": service.pacing.info(),
+                "admission": service.admission.info(),
+                "profiling": service.profiler.info(),
+                "frames_in_flight": service.frames_in_flight,
+                "frames_received": service.frames_received,
+                "frames_dropped": service.frames_dropped,
+                "latency": service.metrics.summary(),
+                "uptime_seconds": round(time.monotonic() - service.started_at),
+                "startup": startup.info(),
                 "server_time": datetime.now().isoformat(),
                 "ports": {
                     "http": service.http_port,
@@ -471,39 +1082,115 @@ async def service_stats(request):
             "error": str(e)
         }, status=500)
 
+async def prometheus_metrics(request):
+    """Prometheus scrape endpoint with stage latency percentiles and counters"""
+    text = service.metrics.render_prometheus(
+        gauges={
+            "connected_clients": len(service.connected_clients),
+            "active_sessions": len(service.attention_data),
+            "participants": sum(len(session) for session in service.attention_data.values()),
+            "uptime_seconds": round(time.monotonic() - service.started_at, 1),
+            "cold_start_seconds": (startup.cold_start_ms or 0) / 1000,
+            "frames_in_flight": service.frames_in_flight,
+            "recommended_frame_interval_ms": service.pacing.recommendation['frame_interval_ms']
+        },
+        counters={
+            "frames_received_total": service.frames_received,
+            "frames_dropped_total": service.frames_dropped,
+            "frames_unchanged_total": service.change_counts['skipped'],
+            "frames_shed_total": service.admission.frames_shed(),
+            "ring_frames_total": service.local_counts['ring_frames'],
+            "ring_frames_stale_total": service.local_counts['ring_stale'],
+            "connections_rejected_total": service.admission.connections_rejected
+        }
+    )
+    return web.Response(text=text, headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+# Offline batch analysis of recordings (python server.py batch --help) needs no live service
+if __name__ == "__main__" and sys.argv[1:2] == ['batch']:
+    from batch import main as batch_main
+    sys.exit(batch_main(sys.argv[2:]))
+
 # Global service instance
+startup = StartupTimer()
+startup.mark('imports', 'service_init')
 service = FaceRecognitionService()
+startup.mark('service_init', 'binding')
 
 # 🔧 FIX 4: ENHANCED MAIN FUNCTION WITH BETTER PORT MANAGEMENT
 async def main():
     """Main function to start both HTTP and WebSocket servers"""
     try:
-        # Get ports from environment variables or find available ones
-        try:
-            service.http_port = int(os.environ.get('HTTP_PORT', '0'))
-            if service.http_port == 0:
-                service.http_port = find_available_port(8000)
-        except:
-            service.http_port = find_available_port(8000)
-            
-        try:
-            service.ws_port = int(os.environ.get('WS_PORT', '0'))
-            if service.ws_port == 0:
-                service.ws_port = find_available_port(service.http_port + 1)
-        except:
-            service.ws_port = find_available_port(service.http_port + 1)
+        # Bind each port once: a set port exactly, 0 kernel-assigned, unset
+        # the first free one from 8000 (HTTP) and the HTTP port + 1 (WebSocket)
+        cluster_workers = env_int('SERVER_WORKERS', 1)
+        worker_socket = env_str('SERVER_WORKER_SOCKET')
+        if cluster_workers > 1 and not worker_socket and not hasattr(socket, 'SO_REUSEPORT'):
+            logger.warning("SO_REUSEPORT is not available on this platform; running a single process")
+            cluster_workers = 1
+        ports_file = env_str('SERVER_PORTS_FILE')
+        
+        http_socket = None
+        if not worker_socket:
+            http_socket = bind_listener(port_setting(os.environ.get('HTTP_PORT')), DEFAULT_HTTP_PORT)
+            service.http_port = http_socket.getsockname()[1]
+        # Cluster workers all bind the WebSocket port with SO_REUSEPORT; the
+        # supervisor keeps a bound, non-listening socket to reserve the number
+        ws_socket = bind_listener(port_setting(os.environ.get('WS_PORT')), (service.http_port or DEFAULT_HTTP_PORT) + 1,
+                                  reuse_port=bool(worker_socket) or cluster_workers > 1)
+        service.ws_port = ws_socket.getsockname()[1]
+        clustered = cluster_workers > 1 and not worker_socket
+        
+        # Co-located clients (the Node server) can skip TCP: WS_UNIX_SOCKET adds
+        # a Unix socket listener, which cluster workers inherit as a descriptor
+        unix_socket = None
+        unix_socket_fd = env_int('WS_UNIX_SOCKET_FD', -1)
+        if unix_socket_fd >= 0:
+            unix_socket = socket.socket(fileno=unix_socket_fd)
+        elif env_str('WS_UNIX_SOCKET'):
+            if sys.platform.startswith('win'):
+                logger.warning("WS_UNIX_SOCKET is not supported on Windows; serving TCP only")
+            else:
+                unix_socket = bind_unix_listener(env_str('WS_UNIX_SOCKET'))
+        if unix_socket is not None:
+            service.ws_unix_socket = unix_socket.getsockname()
+        # Only the process that bound the socket file removes it, and only if
+        # nobody has replaced the file since
+        unix_socket_inode = None
+        if unix_socket is not None and unix_socket_fd < 0:
+            unix_socket_inode = os.stat(service.ws_unix_socket).st_ino
+        startup.mark('binding', 'workers' if clustered else 'http')
+        
+        # Supervisor mode: run SERVER_WORKERS copies of this service behind one port
+        if clustered:
+            from cluster import ClusterSupervisor
+            try:
+                await ClusterSupervisor(cluster_workers, service.http_port, service.ws_port,
+                                        env_str('ATTENTION_STORE_DIR', DEFAULT_STORE_DIR),
+                                        http_socket=http_socket, ports_file=ports_file, startup=startup,
+                                        unix_socket=unix_socket).run()
+            finally:
+                ws_socket.close()
+                if unix_socket is not None:
+                    remove_unix_socket(service.ws_unix_socket, unix_socket_inode)
+                    unix_socket.close()
+            return
         
         print("=" * 60)
         print("🚀 Starting Enhanced Face Recognition Service...")
         print("=" * 60)
-        print(f"🎯 Face Detection: {'✅ Enabled' if service.face_cascade is not None else '❌ Disabled'}")
-        print(f"📊 Attention Monitoring: {'✅ Enabled' if service.face_cascade is not None else '❌ Disabled'}")
+        print(f"🎯 Face Detection: {'✅ Enabled' if service.detector is not None else '❌ Disabled'}")
+        print(f"📊 Attention Monitoring: {'✅ Enabled' if service.detector is not None else '❌ Disabled'}")
         print(f"🔌 WebSocket Server: ws://localhost:{service.ws_port}")
+        if service.ws_unix_socket:
+            print(f"🧵 Local WebSocket: {service.ws_unix_socket} (frame rings {'on' if service.frame_ring_enabled else 'off'})")
         print(f"🌐 HTTP Server: http://localhost:{service.http_port}")
+        print(f"🧠 Face Detector: {service.detector.name if service.detector is not None else 'none'}")
+        print(f"⚙️  Detection Workers: {service.engine.workers} ({service.engine.backend} pool)")
         print("=" * 60)
         
         # Check OpenCV initialization
-        if service.face_cascade is None:
+        if service.detector is None:
             print("⚠️  WARNING: OpenCV face detection not initialized properly")
             print("   💡 Make sure opencv-python is installed: pip install opencv-python")
             print("   🔄 Continuing without face detection...")
@@ -524,62 +1211,142 @@ async def main():
         # Add routes
         app.router.add_get('/', health_check)
         app.router.add_get('/health', health_check)
+        app.router.add_get('/ready', readiness_check)
         app.router.add_get('/attention-report', attention_report)
+        app.router.add_get('/attention-report/export', export_attention_report)
+        app.router.add_post('/frames/batch', ingest_frame_batch)
         app.router.add_get('/session/{session_id}/report', session_report)
+        app.router.add_get('/session/{session_id}/participant/{participant_id}/timeline', participant_timeline)
         app.router.add_post('/reset-attention', reset_attention)
         app.router.add_get('/stats', service_stats)
+        app.router.add_get('/metrics', prometheus_metrics)
         
         # Add CORS to all routes
         for route in list(app.router.routes()):
             cors.add(route)
+        # Admin routes are added after CORS so browsers cannot call them cross-origin
+        app.router.add_post('/admin/profile', admin_profile)
+        app.router.add_post('/admin/tracemalloc', admin_tracemalloc)
         
         # Start HTTP server with better error handling
         try:
             service.http_runner = web.AppRunner(app)
             await service.http_runner.setup()
-            site = web.TCPSite(service.http_runner, '0.0.0.0', service.http_port)
+            if worker_socket:
+                # Cluster worker: the supervisor serves the public API and queries us here
+                site = web.UnixSite(service.http_runner, worker_socket)
+            else:
+                site = web.SockSite(service.http_runner, http_socket)
             await site.start()
-            print(f"✅ HTTP API server started on port {service.http_port}")
+            print(f"✅ HTTP API server started on {worker_socket or f'port {service.http_port}'}")
         except Exception as http_error:
             logger.error(f"❌ Failed to start HTTP server: {http_error}")
             raise
+        # /health answers from here on; /ready once the detector is warm. Cluster
+        # workers stay quiet: the supervisor announces the public ports
+        if not worker_socket:
+            announce('SERVICE_PORTS', {'http_port': service.http_port, 'ws_port': service.ws_port,
+                                       'ws_unix_socket': service.ws_unix_socket, 'pid': os.getpid()})
+        startup.mark('http', 'recovery')
+        
+        # Restore attention data persisted by a previous run. Reading and replaying
+        # the files happens off the event loop so /health keeps answering meanwhile
+        if service.store is not None:
+            service.attention_data = await asyncio.get_running_loop().run_in_executor(
+                None, service.store.recover, service.ring_size, service.attention_windows)
+            await service.store.start(lambda: service.attention_data)
+        
+        # Evict idle participants in the background so memory stays bounded
+        service.evictor.rebuild(service.attention_data)
+        service.reports.rebuild(service.attention_data)
+        service.evictor.start(lambda: service.attention_data)
+        service.subscriptions.start(lambda: service.attention_data)
+        
+        startup.mark('recovery', 'warmup')
+        
+        # Start detection workers, and run a dummy frame through each, before accepting frames
+        if env_bool('SERVER_WARMUP', True):
+            await service.engine.warm_up()
+        else:
+            service.engine.start()
+        startup.mark('warmup', 'websocket')
+        service.metrics.start_loop_monitor(env_float('LOOP_LAG_SAMPLE_SECONDS', 0.25))
+        service.pacing.start(lambda: {
+            'frames_in_flight': service.frames_in_flight,
+            'frames_received': service.frames_received,
+            # Shed frames are a load signal too: slow clients down before shedding more
+            'frames_dropped': service.frames_dropped + service.admission.frames_shed()
+        })
         
         # Start WebSocket server with better error handling
         try:
             print(f"🔌 Starting WebSocket server on port {service.ws_port}...")
-            service.ws_server = await websockets.serve(
-                service.process_frame,
-                "0.0.0.0",
-                service.ws_port,
+            ws_options = dict(
                 ping_interval=20,
                 ping_timeout=10,
-                max_size=10 * 1024 * 1024,  # 10MB max message size
+                max_size=service.max_message_bytes,
+                max_queue=env_int('WS_MAX_QUEUE', 16),
                 compression=None  # Disable compression for better performance
             )
+            service.ws_server = await websockets.serve(
+                service.process_frame,
+                sock=ws_socket,  # Cluster workers share the port via SO_REUSEPORT
+                **ws_options
+            )
             print(f"✅ WebSocket server started on port {service.ws_port}")
+            if unix_socket is not None:
+                service.ws_unix_server = await websockets.unix_serve(service.process_frame, sock=unix_socket,
+                                                                     **ws_options)
+                print(f"✅ Local WebSocket server started on {service.ws_unix_socket}")
         except Exception as ws_error:
             logger.error(f"❌ Failed to start WebSocket server: {ws_error}")
             raise
         
-        print("🎉 Service started successfully!")
+        startup.mark('websocket')
+        startup.ready()
+        if not worker_socket:
+            announce('SERVICE_READY', {'http_port': service.http_port, 'ws_port': service.ws_port,
+                                       'ws_unix_socket': service.ws_unix_socket, 'pid': os.getpid(),
+                                       'cold_start_ms': startup.cold_start_ms}, ports_file)
+        print(f"🎉 Service started successfully! (cold start {startup.cold_start_ms:.0f} ms)")
         print("📡 Ready to process face recognition requests...")
         print("🔗 Available endpoints:")
         print(f"   GET  http://localhost:{service.http_port}/ - Health check")
+        print(f"   GET  http://localhost:{service.http_port}/ready - Readiness (warm and accepting frames)")
         print(f"   GET  http://localhost:{service.http_port}/attention-report - Get all reports")
         print(f"   GET  http://localhost:{service.http_port}/session/{{id}}/report - Get session report")
+        print(f"   GET  http://localhost:{service.http_port}/session/{{id}}/participant/{{pid}}/timeline - Attention timeline")
+        print(f"   POST http://localhost:{service.http_port}/frames/batch - Analyze many frames in one request")
         print(f"   POST http://localhost:{service.http_port}/reset-attention - Reset data")
         print(f"   GET  http://localhost:{service.http_port}/stats - Service statistics")
+        print(f"   GET  http://localhost:{service.http_port}/metrics - Prometheus metrics")
+        print(f"   POST http://localhost:{service.http_port}/admin/profile?seconds=10 - Profile the live service (admin)")
+        print(f"   POST http://localhost:{service.http_port}/admin/tracemalloc?seconds=10 - Top allocators (admin)")
         print(f"   WS   ws://localhost:{service.ws_port} - Face recognition WebSocket")
+        if service.ws_unix_socket:
+            print(f"   WS   unix:{service.ws_unix_socket} - Local WebSocket, with shared-memory frame rings")
         print("=" * 60)
         print("🎯 Waiting for connections...")
         
-        # Keep both servers running
+        # Keep both servers running until interrupted or terminated by the supervisor
+        loop = asyncio.get_running_loop()
+        stop = loop.create_future()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, lambda: stop.done() or stop.set_result(None))
+            except (NotImplementedError, RuntimeError):
+                pass  # Not supported on Windows; Ctrl+C still raises KeyboardInterrupt
         try:
-            await asyncio.Future()  # Run forever
-        except KeyboardInterrupt:
-            print("\n🛑 Shutting down gracefully...")
+            await stop
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            pass
+        print("\n🛑 Shutting down gracefully...")
             
         # Cleanup
+        if service.ws_unix_server:
+            remove_unix_socket(service.ws_unix_socket, unix_socket_inode)
+            service.ws_unix_server.close()
+            await service.ws_unix_server.wait_closed()
         if service.ws_server:
             service.ws_server.close()
             await service.ws_server.wait_closed()
@@ -587,6 +1354,16 @@ async def main():
         if service.http_runner:
             await service.http_runner.cleanup()
             
+        service.engine.shutdown()
+        service.evictor.stop()
+        service.subscriptions.stop()
+        service.metrics.stop()
+        service.pacing.stop()
+        
+        if service.store is not None:
+            await service.store.close(service.attention_data)
+        remove_ports_file(None if worker_socket else ports_file)
+            
     except Exception as e:
         logger.error(f"❌ Failed to start services: {e}")
         traceback.print_exc()
@@ -599,36 +1376,6 @@ if __name__ == "__main__":
             print("❌ Python 3.7 or higher is required")
             sys.exit(1)
         
-        # Check OpenCV installation
-        try:
-            import cv2
-            print(f"✅ OpenCV version: {cv2.__version__}")
-        except ImportError:
-            print("❌ OpenCV not found. Install with: pip install opencv-python")
-            print("   🔄 Continuing without OpenCV (face detection will be disabled)")
-        
-        # Check other dependencies
-        missing_deps = []
-        try:
-            import websockets
-        except ImportError:
-            missing_deps.append("websockets")
-            
-        try:
-            import aiohttp
-        except ImportError:
-            missing_deps.append("aiohttp")
-            
-        try:
-            import aiohttp_cors  
-        except ImportError:
-            missing_deps.append("aiohttp-cors")
-            
-        if missing_deps:
-            print(f"❌ Missing dependencies: {', '.join(missing_deps)}")
-            print(f"   📦 Install with: pip install {' '.join(missing_deps)}")
-            sys.exit(1)
-        
         print("🐍 Starting Python Face Recognition Service...")
         asyncio.run(main())
         
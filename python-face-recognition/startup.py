@@ -0,0 +1,163 @@
+"""Startup helpers: binding listeners once, announcing ports and timing the cold start.
+
+Listening sockets are bound directly instead of probing ports first: a
+port of 0 lets the kernel choose, an unset port searches upward from the
+default with one bind() per candidate (no connect timeouts), and the bound
+socket is handed to aiohttp/websockets so nothing can take the port in
+between.
+
+Once the service is listening it prints a `SERVICE_PORTS {...}` line, and
+once it is warm a `SERVICE_READY {...}` line, so a supervisor (the Node
+server) can route traffic as soon as the service is usable. With
+SERVER_PORTS_FILE set, the same JSON is also written there when ready.
+"""
+import json
+import logging
+import os
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HTTP_PORT = 8000
+PORT_SEARCH_ATTEMPTS = 50
+
+
+def process_age():
+    """Seconds since this process was created, or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def port_setting(value):
+    """Parse a *_PORT setting: None when unset (search), 0 for kernel-assigned"""
+    if value is None or value.strip() == '':
+        return None
+    try:
+        return max(0, int(value))
+    except ValueError:
+        logger.warning(f"Invalid port {value!r}, searching for a free one")
+        return None
+
+
+def bind_listener(port, search_from=DEFAULT_HTTP_PORT, host='0.0.0.0', reuse_port=False):
+    """Bind a TCP socket once and return it (not yet listening)
+
+    port > 0 binds exactly that port, 0 lets the kernel choose and None
+    takes the first free port from search_from upward.
+    """
+    candidates = [port] if port is not None else range(search_from, search_from + PORT_SEARCH_ATTEMPTS)
+    for candidate in candidates:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            if os.name != 'nt':
+                # On Windows SO_REUSEADDR would let us share a port that is in use
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if reuse_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind((host, candidate))
+        except OSError:
+            sock.close()
+            if port is not None:
+                raise
+            logger.debug(f"Port {candidate} is busy")
+            continue
+        return sock
+    raise OSError(f"No available port in range {search_from}-{search_from + PORT_SEARCH_ATTEMPTS - 1}")
+
+
+def bind_unix_listener(path):
+    """Bind and listen on a Unix domain socket, replacing a stale socket file left by a dead process"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.bind(path)
+        except OSError:
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except OSError:
+                # Nobody is listening: a leftover from an unclean exit
+                os.unlink(path)
+                sock.bind(path)
+            else:
+                raise OSError(f"Another process is listening on {path}")
+            finally:
+                probe.close()
+        sock.listen(socket.SOMAXCONN)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def remove_unix_socket(path, inode):
+    """Unlink a Unix socket path if it is still the file we bound (os.stat(path).st_ino at bind time)"""
+    try:
+        if inode is not None and os.stat(path).st_ino == inode:
+            os.unlink(path)
+    except OSError:
+        pass
+
+
+class StartupTimer:
+    """Cold-start phases, measured from process creation where the OS tells us"""
+
+    def __init__(self):
+        age = process_age()
+        now = time.monotonic()
+        self.measured_from = 'process_start' if age is not None else 'module_import'
+        self.began = now - (age or 0.0)
+        self._last = self.began
+        self.phases = {}
+        self.phase = 'starting'
+        self.cold_start_ms = None
+
+    def mark(self, phase, next_phase=None):
+        """Close the current phase as `phase` and move on to next_phase"""
+        now = time.monotonic()
+        self.phases[phase] = round((now - self._last) * 1000, 1)
+        self._last = now
+        if next_phase:
+            self.phase = next_phase
+
+    def ready(self):
+        self.cold_start_ms = round((time.monotonic() - self.began) * 1000, 1)
+        self.phase = 'ready'
+
+    @property
+    def is_ready(self):
+        return self.cold_start_ms is not None
+
+    def info(self):
+        return {
+            'ready': self.is_ready,
+            'phase': self.phase,
+            'cold_start_ms': self.cold_start_ms,
+            'phases_ms': self.phases,
+            'measured_from': self.measured_from
+        }
+
+
+def announce(event, payload, ports_file=None):
+    """Print a machine-readable startup line and, when ready, write the ports file"""
+    print(f"{event} {json.dumps(payload)}", flush=True)
+    if ports_file and event == 'SERVICE_READY':
+        tmp = f'{ports_file}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(payload, f)
+        os.replace(tmp, ports_file)
+
+
+def remove_ports_file(ports_file):
+    if ports_file:
+        try:
+            os.remove(ports_file)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,281 @@
+"""Push-based report subscriptions over the WebSocket connection.
+
+Instead of polling /attention-report, a client sends
+
+    {"type": "subscribe", "session_ids": ["abc", ...], "interval_ms": 1000}
+
+("*" subscribes to every session) and receives "report_update" messages.
+The first update for a session carries all of its participants ("full":
+true); later ones carry only the participants whose scores changed since
+the previous update, participants that were removed, and the session
+summary. Changes are coalesced per subscriber and sent at most once per
+interval, so monitoring traffic follows the rate of change (capped by the
+interval) rather than the poll rate. {"type": "unsubscribe"} stops
+updates for some or all sessions.
+
+Changes arrive through ReportAggregates.on_change, which already sees
+every frame, eviction and reset.
+"""
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+
+import websockets
+
+from config import env_int
+from reports import attention_grade
+
+logger = logging.getLogger(__name__)
+
+ALL_SESSIONS = '*'
+
+# Participant fields carried by an update (a subset of REPORT_FIELDS)
+UPDATE_FIELDS = ('name', 'total_frames', 'attention_score', 'recent_attention', 'last_seen')
+
+
+class Subscriber:
+    """One connection's subscription: which sessions, and what changed since the last update"""
+
+    __slots__ = ('websocket', 'sessions', 'wildcard', 'interval', 'pending', 'removed',
+                 'reset', 'wake', 'last_sent', 'task', 'updates_sent')
+
+    def __init__(self, websocket, interval):
+        self.websocket = websocket
+        self.sessions = set()
+        self.wildcard = False
+        self.interval = interval
+        # session_id -> set of changed participant ids, or None for the whole session
+        self.pending = {}
+        self.removed = {}
+        self.reset = False
+        self.wake = asyncio.Event()
+        self.last_sent = 0.0
+        self.task = None
+        self.updates_sent = 0
+
+    def mark(self, session_id, participant_id=None, removed=False):
+        changed = self.pending.get(session_id, ())
+        if participant_id is None:
+            self.pending[session_id] = None
+            self.removed.pop(session_id, None)
+        elif changed is None:
+            pass  # a full refresh is already due and covers this change
+        elif removed:
+            self.removed.setdefault(session_id, set()).add(participant_id)
+            if changed:
+                changed.discard(participant_id)
+        else:
+            if not changed:
+                changed = self.pending[session_id] = set()
+            changed.add(participant_id)
+        self.wake.set()
+
+
+class ReportSubscriptions:
+    """Tracks report subscribers and sends them coalesced, rate-limited deltas"""
+
+    def __init__(self, reports, default_interval_ms=1000, min_interval_ms=250, max_sessions=100):
+        self.reports = reports
+        self.default_interval_ms = default_interval_ms
+        self.min_interval_ms = min_interval_ms
+        self.max_sessions = max_sessions
+        self._get_state = lambda: {}
+        self._subscribers = {}
+        self._by_session = {}
+        self._wildcard = set()
+
+        self.changes_seen = 0
+        self.updates_sent = 0
+        self.participants_sent = 0
+
+    @classmethod
+    def from_env(cls, reports):
+        return cls(
+            reports,
+            default_interval_ms=env_int('SUBSCRIPTION_INTERVAL_MS', 1000),
+            min_interval_ms=env_int('SUBSCRIPTION_MIN_INTERVAL_MS', 250),
+            max_sessions=env_int('SUBSCRIPTION_MAX_SESSIONS', 100)
+        )
+
+    def start(self, get_state):
+        """get_state returns the service's current attention_data"""
+        self._get_state = get_state
+
+    def stop(self):
+        for websocket in list(self._subscribers):
+            self.drop(websocket)
+
+    async def subscribe(self, websocket, session_ids, interval_ms=None):
+        """Add sessions to a connection's subscription; raises ValueError for bad requests"""
+        if isinstance(session_ids, str):
+            session_ids = [session_ids]
+        if not isinstance(session_ids, list) or not session_ids:
+            raise ValueError('session_ids must be a non-empty list (use "*" for all sessions)')
+        interval = max(self.min_interval_ms, int(interval_ms or self.default_interval_ms)) / 1000
+
+        subscriber = self._subscribers.get(websocket)
+        new_sessions = [sid for sid in dict.fromkeys(session_ids) if sid != ALL_SESSIONS]
+        existing = len(subscriber.sessions) if subscriber is not None else 0
+        if len(set(new_sessions) | (subscriber.sessions if subscriber is not None else set())) > self.max_sessions:
+            raise ValueError(f'at most {self.max_sessions} sessions per connection')
+
+        if subscriber is None:
+            subscriber = self._subscribers[websocket] = Subscriber(websocket, interval)
+            subscriber.task = asyncio.create_task(self._run(subscriber))
+        subscriber.interval = interval
+        for session_id in new_sessions:
+            subscriber.sessions.add(session_id)
+            self._by_session.setdefault(session_id, set()).add(subscriber)
+        if ALL_SESSIONS in session_ids:
+            subscriber.wildcard = True
+            self._wildcard.add(subscriber)
+
+        await websocket.send(json.dumps({
+            'type': 'subscribed',
+            'session_ids': [ALL_SESSIONS] if subscriber.wildcard else sorted(subscriber.sessions, key=str),
+            'interval_ms': round(interval * 1000),
+            'timestamp': datetime.now().isoformat()
+        }))
+        logger.info(f"📡 Report subscription: {len(subscriber.sessions) - existing} new sessions"
+                    f"{' (all sessions)' if subscriber.wildcard else ''}, every {interval:.2f}s")
+
+        # The first update for each existing session is a full snapshot; sessions
+        # that have not started yet appear with their first participant
+        attention_data = self._get_state()
+        initial = attention_data.keys() if ALL_SESSIONS in session_ids else new_sessions
+        for session_id in initial:
+            if session_id in attention_data:
+                subscriber.mark(session_id)
+
+    def unsubscribe(self, websocket, session_ids=None):
+        subscriber = self._subscribers.get(websocket)
+        if subscriber is None:
+            return
+        if not session_ids or ALL_SESSIONS in session_ids:
+            self.drop(websocket)
+            return
+        for session_id in session_ids:
+            subscriber.sessions.discard(session_id)
+            subscriber.pending.pop(session_id, None)
+            subscriber.removed.pop(session_id, None)
+            self._discard(session_id, subscriber)
+        if not subscriber.sessions and not subscriber.wildcard:
+            self.drop(websocket)
+
+    def drop(self, websocket):
+        """Forget a connection's subscription (on unsubscribe or disconnect)"""
+        subscriber = self._subscribers.pop(websocket, None)
+        if subscriber is None:
+            return
+        for session_id in subscriber.sessions:
+            self._discard(session_id, subscriber)
+        self._wildcard.discard(subscriber)
+        if subscriber.task is not None:
+            subscriber.task.cancel()
+
+    def _discard(self, session_id, subscriber):
+        subscribers = self._by_session.get(session_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._by_session[session_id]
+
+    def on_change(self, session_id, participant_id=None, removed=False):
+        """ReportAggregates hook: a participant changed or was removed, a session
+        ended (participant_id None) or everything was rebuilt (session_id None)"""
+        if not self._subscribers:
+            return
+        self.changes_seen += 1
+        if session_id is None:
+            sessions = self._get_state().keys()
+            for subscriber in self._subscribers.values():
+                subscriber.reset = True
+                for sid in (sessions if subscriber.wildcard else subscriber.sessions):
+                    subscriber.mark(sid)
+            return
+        for subscriber in self._by_session.get(session_id, ()):
+            subscriber.mark(session_id, participant_id, removed)
+        for subscriber in self._wildcard:
+            if session_id not in subscriber.sessions:
+                subscriber.mark(session_id, participant_id, removed)
+
+    async def _run(self, subscriber):
+        try:
+            while True:
+                await subscriber.wake.wait()
+                # Rate limit: everything that changes while we wait goes into one update
+                delay = subscriber.last_sent + subscriber.interval - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                subscriber.wake.clear()
+                message = self._build_update(subscriber)
+                if message is None:
+                    continue
+                await subscriber.websocket.send(json.dumps(message))
+                subscriber.last_sent = time.monotonic()
+                subscriber.updates_sent += 1
+                self.updates_sent += 1
+        except asyncio.CancelledError:
+            pass
+        except websockets.exceptions.ConnectionClosed:
+            self.drop(subscriber.websocket)
+        except Exception as e:
+            logger.error(f"❌ Report subscription update failed: {e}")
+            self.drop(subscriber.websocket)
+
+    def _build_update(self, subscriber):
+        pending, removed, reset = subscriber.pending, subscriber.removed, subscriber.reset
+        subscriber.pending, subscriber.removed, subscriber.reset = {}, {}, False
+        if not pending and not removed and not reset:
+            return None
+
+        attention_data = self._get_state()
+        sessions = {}
+        for session_id in dict.fromkeys([*pending, *removed]):
+            sessions[session_id] = self._session_entry(
+                attention_data.get(session_id), session_id,
+                pending.get(session_id, ()), removed.get(session_id))
+        message = {'type': 'report_update', 'sessions': sessions, 'timestamp': datetime.now().isoformat()}
+        if reset:
+            # Everything was cleared or rebuilt: drop state for sessions not listed
+            message['reset'] = True
+        return message
+
+    def _session_entry(self, session, session_id, changed, removed):
+        if session is None:
+            return {'ended': True}
+        participant_ids = session.keys() if changed is None else changed
+        participants = {}
+        for participant_id in participant_ids:
+            participant = session.get(participant_id)
+            if participant is not None:
+                participants[participant_id] = participant.to_dict(participant.last_seen_mono, UPDATE_FIELDS)
+        self.participants_sent += len(participants)
+
+        aggregate = self.reports.sessions.get(session_id)
+        overall = aggregate.overall_score() if aggregate is not None else 0
+        entry = {
+            'full': changed is None,
+            'participants': participants,
+            'participant_count': len(session),
+            'overall_attention_score': overall,
+            'grade': attention_grade(overall)['grade'],
+            'version': aggregate.version if aggregate is not None else None
+        }
+        if removed:
+            entry['removed'] = sorted(removed, key=str)
+        return entry
+
+    def info(self):
+        return {
+            'subscribers': len(self._subscribers),
+            'sessions_watched': len(self._by_session),
+            'all_sessions_subscribers': len(self._wildcard),
+            'changes_seen': self.changes_seen,
+            'updates_sent': self.updates_sent,
+            'participants_sent': self.participants_sent,
+            'default_interval_ms': self.default_interval_ms,
+            'min_interval_ms': self.min_interval_ms
+        }
@@ -0,0 +1,34 @@
+from admission import ROLE_ATTENDEE, ROLE_HOST, SHED_IN_FLIGHT, AdmissionController
+
+
+def test_untrusted_clients_cannot_claim_host():
+    admission = AdmissionController(relay_token='secret')
+    frame = {'session_id': 's1', 'participant_id': 'p1', 'role': 'HOST'}
+    assert admission.role(frame) == ROLE_ATTENDEE
+    assert admission.role(frame, trusted=True) == ROLE_HOST
+    assert admission.role({'participant_id': 'p1'}, trusted=True) == ROLE_ATTENDEE
+    assert admission.info()['role_claims_ignored'] == 1
+
+
+def test_configured_host_ids_are_hosts_on_any_connection():
+    admission = AdmissionController(host_ids=['teacher'])
+    assert admission.role({'participant_id': 'teacher'}) == ROLE_HOST
+    assert admission.role({'participant_id': 'student', 'role': 'host'}) == ROLE_ATTENDEE
+
+
+def test_trusted_connections():
+    admission = AdmissionController(relay_token='secret')
+    assert admission.trusted('Bearer secret')
+    assert admission.trusted(None, local=True)
+    assert not admission.trusted('Bearer wrong')
+    assert not admission.trusted('secret')
+    assert not admission.trusted(None)
+    # Without a relay token only the Unix socket is trusted
+    assert not AdmissionController().trusted('Bearer ')
+
+
+def test_spoofed_host_is_shed_like_an_attendee():
+    admission = AdmissionController(max_in_flight=4, host_reserve=0.5)
+    role = admission.role({'participant_id': 'p1', 'role': 'host'})
+    assert admission.admit_frame('s1', role, in_flight=2, retry_ms=100) == (SHED_IN_FLIGHT, 250)
+    assert admission.admit_frame('s1', ROLE_HOST, in_flight=2, retry_ms=100) is None
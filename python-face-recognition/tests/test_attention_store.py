@@ -0,0 +1,124 @@
+import asyncio
+import os
+
+import pytest
+
+from attention_store import FRAME_RECORD, AttentionStore
+from participants import ParticipantState
+
+WINDOWS = (30, 300)
+RING_SIZE = 16
+
+
+def record(store, attention_data, session_id, participant_id, frames):
+    """Add frames for one participant to attention_data and the store's log"""
+    session = attention_data.setdefault(session_id, {})
+    participant = session.get(participant_id)
+    if participant is None:
+        participant = session[participant_id] = ParticipantState(participant_id, RING_SIZE, WINDOWS, now=1000.0)
+        store.add_participant(session_id, participant_id, participant)
+    for detected in frames:
+        now = 1000.0 + participant.total_frames * 0.5
+        participant.record_frame(detected, now)
+        store.record_frame(participant, detected, now)
+    return participant
+
+
+def summary(attention_data):
+    return {
+        (session_id, participant_id): (p.total_frames, p.face_detected_frames, [t.tolist() for t in p.history()])
+        for session_id, participants in attention_data.items()
+        for participant_id, p in participants.items()
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AttentionStore(str(tmp_path))
+
+
+def test_recovers_logged_frames(store, tmp_path):
+    attention_data = {}
+    record(store, attention_data, 's1', 'p1', [True, False, True])
+    record(store, attention_data, 's1', 'p2', [True] * 20)
+    asyncio.run(store.flush())
+
+    recovered = AttentionStore(str(tmp_path)).recover(RING_SIZE, WINDOWS)
+    assert summary(recovered) == summary(attention_data)
+
+
+def test_replay_ignores_a_truncated_tail(store, tmp_path):
+    attention_data = {}
+    record(store, attention_data, 's1', 'p1', [True, True])
+    asyncio.run(store.snapshot(attention_data))
+    record(store, attention_data, 's1', 'p1', [False, True, False])
+    record(store, attention_data, 's2', 'p2', [True])
+    asyncio.run(store.flush())
+    expected = summary(attention_data)
+
+    # A crash mid-write leaves half a frame record and a torn meta line
+    generation = store.generation
+    with open(os.path.join(str(tmp_path), f'frames-{generation:06d}.bin'), 'ab') as f:
+        f.write(b'\x01\x00\x00\x00\x10')
+    with open(os.path.join(str(tmp_path), f'meta-{generation:06d}.jsonl'), 'a') as f:
+        f.write('{"t": "participant", "pid": 9, "sess')
+
+    recovered_store = AttentionStore(str(tmp_path))
+    recovered = recovered_store.recover(RING_SIZE, WINDOWS)
+    assert summary(recovered) == expected
+    assert recovered_store.generation > generation
+
+
+def test_snapshot_matches_rings_written_during_the_copy(store, tmp_path):
+    attention_data = {}
+    participant = record(store, attention_data, 's1', 'p1', [True] * RING_SIZE)
+
+    async def snapshot_while_recording():
+        snapshot = asyncio.ensure_future(store.snapshot(attention_data))
+        # Let it capture state and hand the rings to the executor. Frames
+        # recorded now go to the next generation's log and may or may not
+        # already be in the copied rings.
+        await asyncio.sleep(0)
+        generation = store.generation
+        record(store, attention_data, 's1', 'p1', [False] * 5)
+        await snapshot
+        await store.flush()
+        assert store.generation == generation
+
+    asyncio.run(snapshot_while_recording())
+    recovered = AttentionStore(str(tmp_path)).recover(RING_SIZE, WINDOWS)
+    assert summary(recovered) == summary(attention_data)
+    assert recovered['s1']['p1'].window_scores() == participant.window_scores()
+
+
+def test_reset_and_remove_are_replayed(store, tmp_path):
+    attention_data = {}
+    record(store, attention_data, 's1', 'p1', [True])
+    removed = record(store, attention_data, 's2', 'p2', [True])
+    record(store, attention_data, 's2', 'p3', [False])
+    store.reset('s1')
+    store.remove_participant(removed)
+    asyncio.run(store.flush())
+
+    recovered = AttentionStore(str(tmp_path)).recover(RING_SIZE, WINDOWS)
+    assert list(recovered) == ['s2']
+    assert list(recovered['s2']) == ['p3']
+
+
+def test_frame_records_are_fixed_size():
+    assert FRAME_RECORD.itemsize == 9
+
+
+def test_snapshot_of_partly_grown_rings(tmp_path):
+    store = AttentionStore(str(tmp_path))
+    attention_data = {'s1': {}}
+    for participant_id, count in (('few', 3), ('some', 20), ('many', 200)):
+        participant = attention_data['s1'][participant_id] = ParticipantState(participant_id, 64, WINDOWS, now=1000.0)
+        store.add_participant('s1', participant_id, participant)
+        for i in range(count):
+            participant.record_frame(i % 2 == 0, 1000.0 + i * 0.5)
+    assert len({len(p._times) for p in attention_data['s1'].values()}) == 3
+    asyncio.run(store.snapshot(attention_data))
+
+    recovered = AttentionStore(str(tmp_path)).recover(64, WINDOWS)
+    assert summary(recovered) == summary(attention_data)
@@ -0,0 +1,70 @@
+import cv2
+import numpy as np
+import pytest
+
+from batch import BatchSource
+
+SETTINGS = {'detector': 'haar'}
+
+
+def image_directory(tmp_path, count):
+    for i in range(count):
+        (tmp_path / f'frame-{i:03d}.jpg').write_bytes(b'')
+    return str(tmp_path)
+
+
+def video_file(tmp_path, count, fps):
+    path = str(tmp_path / 'clip.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (64, 48))
+    if not writer.isOpened():
+        pytest.skip('OpenCV cannot write MJPG video here')
+    for i in range(count):
+        writer.write(np.full((48, 64, 3), i, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def cuts(source, segment_seconds):
+    return [(s.start, s.stop) for s in source.segments(segment_seconds, SETTINGS, 'fp')]
+
+
+def test_image_segments_cover_every_image_once(tmp_path):
+    source = BatchSource(image_directory(tmp_path, 10), sample_fps=2.0, image_fps=2.0)
+    segments = list(source.segments(2.0, SETTINGS, 'fp'))
+    assert [(s.start, s.stop) for s in segments] == [(0, 4), (4, 8), (8, 10)]
+    assert [p for s in segments for p in s.paths] == source.paths
+
+
+def test_image_segments_start_on_sampled_frames(tmp_path):
+    source = BatchSource(image_directory(tmp_path, 11), sample_fps=1.0, image_fps=2.0)
+    assert source.step == 2
+    segments = list(source.segments(3.0, SETTINGS, 'fp'))
+    assert all(s.start % source.step == 0 for s in segments)
+    # The same frames are sampled however the source is cut
+    assert [p for s in segments for p in s.paths] == source.paths[::source.step]
+    whole = list(source.segments(60.0, SETTINGS, 'fp'))
+    assert len(whole) == 1 and whole[0].paths == source.paths[::source.step]
+
+
+def test_last_video_segment_reads_to_the_end(tmp_path):
+    source = BatchSource(video_file(tmp_path, 25, 10.0), sample_fps=5.0, image_fps=2.0)
+    assert (source.frame_count, source.step) == (25, 2)
+    # Container frame counts are not always exact, so the last cut is open-ended
+    assert cuts(source, 1.0) == [(0, 10), (10, 20), (20, None)]
+    assert cuts(source, 60.0) == [(0, None)]
+
+
+def test_segment_keys_change_with_the_cut_and_settings(tmp_path):
+    source = BatchSource(image_directory(tmp_path, 8), sample_fps=2.0, image_fps=2.0)
+    keys = [s.key for s in source.segments(2.0, SETTINGS, 'fp')]
+    assert len(set(keys)) == len(keys)
+    assert keys == [s.key for s in source.segments(2.0, SETTINGS, 'fp')]
+    assert keys[0] not in [s.key for s in source.segments(2.0, {'detector': 'dnn'}, 'fp')]
+    assert keys[0] not in [s.key for s in source.segments(2.0, SETTINGS, 'other model')]
+    assert keys[0] not in [s.key for s in source.segments(1.0, SETTINGS, 'fp')]
+
+
+def test_participant_id_from_spec(tmp_path):
+    directory = image_directory(tmp_path, 1)
+    assert BatchSource(directory, 2.0, 2.0).participant_id == tmp_path.name
+    assert BatchSource(f'alice={directory}', 2.0, 2.0).participant_id == 'alice'
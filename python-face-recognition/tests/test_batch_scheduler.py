@@ -0,0 +1,149 @@
+import asyncio
+
+import pytest
+
+from detection_engine import BatchScheduler
+
+
+class FakeEngine:
+    """Records each pool call; calls block while `gate` is closed"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.calls = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.fail = None
+
+    async def detect_batch(self, jobs):
+        self.calls.append([image for image, _ in jobs])
+        await self.gate.wait()
+        if self.fail is not None:
+            raise self.fail
+        return [{'frame': image, 'options': options} for image, options in jobs]
+
+    async def detect(self, image, options=None):
+        self.calls.append([image])
+        return {'frame': image}
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_idle_worker_gets_a_frame_immediately():
+    async def scenario():
+        engine = FakeEngine(workers=2)
+        scheduler = BatchScheduler(engine, max_batch_size=8, window_ms=0)
+        result = await scheduler.submit('a', {'n': 1})
+        return engine, result
+
+    engine, result = run(scenario())
+    assert engine.calls == [['a']]
+    assert result['frame'] == 'a' and result['options'] == {'n': 1}
+    assert result['batch_wait_ms'] < 50
+
+
+def test_frames_queue_while_workers_are_busy():
+    async def scenario():
+        engine = FakeEngine(workers=2)
+        engine.gate.clear()
+        scheduler = BatchScheduler(engine, max_batch_size=4, window_ms=0)
+        first = [asyncio.ensure_future(scheduler.submit(image)) for image in 'ab']
+        await asyncio.sleep(0)
+        queued = [asyncio.ensure_future(scheduler.submit(image)) for image in 'cdefgh']
+        await asyncio.sleep(0)
+        busy_calls = list(engine.calls)
+        pending = scheduler.info()['pending']
+        engine.gate.set()
+        results = await asyncio.gather(*first, *queued)
+        return engine, busy_calls, pending, results
+
+    engine, busy_calls, pending, results = run(scenario())
+    # One frame per idle worker, then the rest wait for a free one
+    assert busy_calls == [['a'], ['b']]
+    assert pending == 6
+    # Freed workers take at most max_batch_size frames per call
+    assert all(len(call) <= 4 for call in engine.calls)
+    assert sorted(image for call in engine.calls for image in call) == list('abcdefgh')
+    # Each caller gets the result for its own frame
+    assert [result['frame'] for result in results] == list('abcdefgh')
+
+
+def test_window_flush_splits_across_idle_workers():
+    async def scenario():
+        engine = FakeEngine(workers=3)
+        scheduler = BatchScheduler(engine, max_batch_size=8, window_ms=20)
+        results = await asyncio.gather(*(scheduler.submit(image) for image in 'abcdef'))
+        return engine, results
+
+    engine, results = run(scenario())
+    assert engine.calls == [['a', 'b'], ['c', 'd'], ['e', 'f']]
+    assert [result['frame'] for result in results] == list('abcdef')
+
+
+def test_full_batch_flushes_before_the_window():
+    async def scenario():
+        engine = FakeEngine(workers=1)
+        scheduler = BatchScheduler(engine, max_batch_size=3, window_ms=10_000)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        results = await asyncio.wait_for(asyncio.gather(*(scheduler.submit(image) for image in 'abc')), 5)
+        return engine, results, loop.time() - started
+
+    engine, results, elapsed = run(scenario())
+    assert engine.calls == [['a', 'b', 'c']]
+    assert [result['frame'] for result in results] == list('abc')
+    assert elapsed < 1
+
+
+def test_window_holds_a_partial_batch():
+    async def scenario():
+        engine = FakeEngine(workers=1)
+        scheduler = BatchScheduler(engine, max_batch_size=8, window_ms=30)
+        futures = [asyncio.ensure_future(scheduler.submit(image)) for image in 'ab']
+        await asyncio.sleep(0.005)
+        held = list(engine.calls)
+        results = await asyncio.gather(*futures)
+        return engine, held, results
+
+    engine, held, results = run(scenario())
+    assert held == []
+    assert engine.calls == [['a', 'b']]
+    assert all(result['batch_wait_ms'] >= 25 for result in results)
+
+
+def test_failed_call_fails_only_its_own_frames():
+    async def scenario():
+        engine = FakeEngine(workers=1)
+        engine.fail = RuntimeError('pool died')
+        scheduler = BatchScheduler(engine, max_batch_size=2, window_ms=0)
+        return await asyncio.gather(*(scheduler.submit(image) for image in 'ab'), return_exceptions=True)
+
+    results = run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_batch_size_one_bypasses_the_queue():
+    async def scenario():
+        engine = FakeEngine(workers=1)
+        scheduler = BatchScheduler(engine, max_batch_size=1, window_ms=50)
+        return engine, await scheduler.submit('a')
+
+    engine, result = run(scenario())
+    assert engine.calls == [['a']]
+    assert result['batch_wait_ms'] == 0.0
+
+
+@pytest.mark.parametrize('workers, frames', [(1, 5), (4, 13)])
+def test_every_frame_is_answered(workers, frames):
+    async def scenario():
+        engine = FakeEngine(workers=workers)
+        scheduler = BatchScheduler(engine, max_batch_size=3, window_ms=0)
+        results = await asyncio.gather(*(scheduler.submit(i) for i in range(frames)))
+        return scheduler, results
+
+    scheduler, results = run(scenario())
+    assert [result['frame'] for result in results] == list(range(frames))
+    assert scheduler.info()['pending'] == 0
+    assert scheduler.info()['inflight_batches'] == 0
@@ -0,0 +1,76 @@
+import asyncio
+import json
+import shutil
+
+import pytest
+from aiohttp.test_utils import make_mocked_request
+
+from cluster import ClusterSupervisor, WorkerProcess
+
+
+def participant(frames):
+    return {'name': 'n', 'total_frames': frames, 'face_detected_frames': frames, 'attention_score': 100.0,
+            'recent_attention': {'30s': 100.0, '5m': 100.0}, 'last_seen': '2026-01-01T00:00:00',
+            'session_start': '2026-01-01T00:00:00'}
+
+
+# What each worker's /attention-report answers; a worker that does not hold
+# the requested session falls back to every session it has
+WORKER_DATA = [
+    {'room-a': {'p1': participant(3)}, 'room-b': {'p2': participant(1)}},
+    {'room-c': {'p3': participant(2)}},
+]
+
+
+@pytest.fixture
+def supervisor(monkeypatch):
+    supervisor = ClusterSupervisor(2, 0, 0, None)
+    supervisor.workers = [WorkerProcess(index, None, {}) for index in range(2)]
+    requests = []
+
+    async def fake_request(worker, method, path, params=None, *args, **kwargs):
+        requests.append((worker.index, path, dict(params or {})))
+        if path == '/attention-report':
+            data = WORKER_DATA[worker.index]
+            session_id = (params or {}).get('session_id')
+            if session_id in data:
+                data = {session_id: data[session_id]}
+            return 200, {'success': True, 'data': data}
+        return 404, {'success': False, 'error': 'not found'}
+
+    monkeypatch.setattr(supervisor, '_request', fake_request)
+    supervisor.requests = requests
+    yield supervisor
+    shutil.rmtree(supervisor.socket_dir, ignore_errors=True)
+
+
+def call(handler, path, match_info=None):
+    response = asyncio.run(handler(make_mocked_request('GET', path, match_info=match_info or {})))
+    return response.status, json.loads(response.text)
+
+
+def test_report_merges_every_worker(supervisor):
+    _, report = call(supervisor.attention_report, '/attention-report')
+    assert sorted(report['data']) == ['room-a', 'room-b', 'room-c']
+    assert report['summary']['total_sessions'] == 3
+    assert report['workers_answered'] == 2
+
+
+def test_filtered_report_only_has_the_requested_session(supervisor):
+    _, report = call(supervisor.attention_report, '/attention-report?session_id=room-c')
+    assert list(report['data']) == ['room-c']
+    assert report['summary']['total_sessions'] == 1
+    assert report['summary']['total_participants'] == 1
+
+
+def test_filtered_report_for_an_unknown_session_falls_back_to_all(supervisor):
+    _, report = call(supervisor.attention_report, '/attention-report?session_id=nowhere')
+    assert report['summary']['total_sessions'] == 3
+
+
+def test_ids_are_encoded_in_worker_paths(supervisor):
+    call(supervisor.session_report, '/session/x/report', {'session_id': 'a/b?c'})
+    call(supervisor.participant_timeline, '/session/x/participant/y/timeline',
+         {'session_id': 'a/b', 'participant_id': '#1%'})
+    paths = {path for _, path, _ in supervisor.requests}
+    assert paths == {'/session/a%2Fb%3Fc/report', '/session/a%2Fb/participant/%231%25/timeline'}
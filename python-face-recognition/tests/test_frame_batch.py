@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+from frame_batch import FrameBatch
+
+
+class Response:
+    def __init__(self):
+        self.body = b''
+
+    async def write(self, data):
+        self.body += data
+
+    def lines(self):
+        return [json.loads(line) for line in self.body.decode().splitlines()]
+
+
+async def frames(participants):
+    for participant_id in participants:
+        yield json.dumps({'session_id': 's1', 'participant_id': participant_id}), b'image'
+
+
+def run_batch(participants, concurrency, analyze_delay=0.005):
+    async def scenario():
+        running = []
+        peak = []
+
+        async def analyze(frame_info, image_data, received_at):
+            running.append(frame_info['participant_id'])
+            peak.append(len(running))
+            await asyncio.sleep(analyze_delay)
+            running.remove(frame_info['participant_id'])
+            return {'participant_id': frame_info['participant_id'], 'free': not batch._slots.locked()}
+
+        batch = FrameBatch(analyze, concurrency, max_frames=100)
+        response = Response()
+        await asyncio.wait_for(batch.run(frames(participants), response), 5)
+        return response.lines(), max(peak)
+
+    return asyncio.run(scenario())
+
+
+def test_chained_frames_do_not_hold_slots_while_waiting():
+    lines, peak = run_batch(['p1'] * 6, concurrency=2)
+    results, end = lines[:-1], lines[-1]
+    # One participant's frames run one at a time, in request order
+    assert peak == 1
+    assert [result['index'] for result in results] == list(range(6))
+    # ...and only the running frame holds a slot, leaving the other for other participants
+    assert all(result['free'] for result in results)
+    assert (end['frames'], end['completed']) == (6, 6)
+
+
+def test_participants_share_the_slots():
+    lines, peak = run_batch(['p1', 'p2', 'p3', 'p1', 'p2', 'p3'], concurrency=2)
+    assert peak == 2
+    assert lines[-1]['completed'] == 6
+    for participant_id in ('p1', 'p2', 'p3'):
+        indexes = [line['index'] for line in lines[:-1] if line['participant_id'] == participant_id]
+        assert indexes == sorted(indexes)
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from frame_decode import FrameDecodeError, FrameDecoder
+
+
+@pytest.mark.parametrize('frame_format', ['yuv420', 'nv12'])
+@pytest.mark.parametrize('color', [True, False])
+def test_yuv_frames_decode_to_full_size(frame_format, color):
+    data = np.zeros(640 * 480 * 3 // 2, dtype=np.uint8).tobytes()
+    image, scale, width, height = FrameDecoder(scale=1).decode(
+        data, {'format': frame_format, 'width': 640, 'height': 480}, color, 0)
+    assert (width, height, scale) == (640, 480, 1)
+    assert image.shape[:2] == (480, 640)
+
+
+@pytest.mark.parametrize('frame_format', ['yuv420', 'nv12'])
+@pytest.mark.parametrize('width, height', [(641, 480), (640, 481), (5, 3)])
+def test_yuv_frames_with_odd_dimensions_are_rejected(frame_format, width, height):
+    data = bytes(width * height * 2)
+    with pytest.raises(FrameDecodeError, match='even width and height'):
+        FrameDecoder().decode(data, {'format': frame_format, 'width': width, 'height': height}, True, 0)
+
+
+def test_odd_gray_frames_still_decode():
+    image, _, width, height = FrameDecoder(scale=1).decode(bytes(5 * 3), {'format': 'gray', 'width': 5, 'height': 3},
+                                                           False, 0)
+    assert (width, height) == (5, 3) and image.shape == (3, 5)
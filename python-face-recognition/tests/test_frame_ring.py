@@ -0,0 +1,90 @@
+import struct
+from multiprocessing import resource_tracker
+
+import pytest
+
+from frame_ring import HEADER_BYTES, SLOT_SEQ, FrameRing, FrameRingError, FrameRingWriter
+
+
+def attach(ring, writer):
+    try:
+        ring.attach(writer.name)
+    finally:
+        # Attaching untracks the block, which in a real deployment belongs to
+        # another process; here it is the writer's, which unlinks it at the end
+        resource_tracker.register(writer._shm._name, 'shared_memory')
+
+
+@pytest.fixture
+def writer():
+    ring = FrameRingWriter(slots=4, slot_bytes=256)
+    yield ring
+    ring.close()
+
+
+@pytest.fixture
+def reader(writer):
+    ring = FrameRing(max_message_bytes=1024)
+    attach(ring, writer)
+    yield ring
+    ring.close()
+
+
+def test_read_returns_written_frames(writer, reader):
+    seqs = [writer.write(f'frame {i}'.encode()) for i in range(3)]
+    assert seqs == [1, 2, 3]
+    assert [reader.read(seq) for seq in seqs] == [b'frame 0', b'frame 1', b'frame 2']
+    assert (reader.slots, reader.frames_read, reader.stale) == (4, 3, 0)
+
+
+def test_reused_slot_counts_as_stale(writer, reader):
+    first = writer.write(b'old')
+    for i in range(writer.slots):
+        writer.write(b'new %d' % i)
+    # Frame `first` has been overwritten by the frame `slots` later
+    assert reader.read(first) is None
+    assert reader.stale == 1
+    assert reader.read(first + writer.slots) == b'new 3'
+
+
+def test_slot_being_rewritten_counts_as_stale(writer, reader):
+    seq = writer.write(b'frame')
+    # The producer zeroes a slot's seq before rewriting it
+    SLOT_SEQ.pack_into(writer._shm.buf, HEADER_BYTES + (seq % writer.slots) * writer.slot_bytes, 0)
+    assert reader.read(seq) is None
+    assert reader.stale == 1
+
+
+def test_read_rejects_bad_doorbells(writer, reader):
+    with pytest.raises(FrameRingError, match='positive integer'):
+        reader.read(0)
+    with pytest.raises(FrameRingError, match='No ring attached'):
+        FrameRing(1024).read(1)
+
+
+def test_read_enforces_message_limit(writer):
+    ring = FrameRing(max_message_bytes=8)
+    attach(ring, writer)
+    try:
+        with pytest.raises(FrameRingError, match='message limit'):
+            ring.read(writer.write(b'more than eight bytes'))
+    finally:
+        ring.close()
+
+
+def test_write_rejects_oversized_messages(writer):
+    with pytest.raises(FrameRingError, match='exceeds'):
+        writer.write(b'x' * (writer.capacity + 1))
+
+
+def test_attach_rejects_bad_names_and_layouts(writer):
+    ring = FrameRing(1024)
+    with pytest.raises(FrameRingError, match='shared memory block name'):
+        ring.attach('../etc/passwd')
+    with pytest.raises(FrameRingError, match='Cannot open'):
+        ring.attach('no-such-frame-ring')
+
+    struct.pack_into('<4s', writer._shm.buf, 0, b'XXXX')
+    with pytest.raises(FrameRingError, match='not a version 1 frame ring'):
+        attach(ring, writer)
+    assert not ring.attached
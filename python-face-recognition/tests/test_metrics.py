@@ -0,0 +1,25 @@
+from metrics import ServiceMetrics
+
+
+def test_session_counters_are_dropped_with_their_session():
+    metrics = ServiceMetrics()
+    metrics.count('s1', 'frames')
+    metrics.count('s2', 'errors')
+    metrics.forget_session('s1')
+    metrics.forget_session('missing')
+    assert list(metrics.sessions) == ['s2']
+    metrics.forget_sessions({})
+    assert metrics.sessions == {}
+
+
+def test_unattributed_frames_do_not_create_session_counters():
+    metrics = ServiceMetrics()
+    for i in range(100):
+        metrics.count(None, 'errors')
+    metrics.count(None, 'dropped', 3)
+    assert metrics.sessions == {}
+    assert metrics.unattributed == {'frames': 0, 'dropped': 3, 'errors': 100}
+
+    text = metrics.render_prometheus(gauges={})
+    assert 'face_service_unattributed_errors_total 100' in text
+    assert 'session=' not in text
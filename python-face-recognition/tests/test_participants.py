@@ -0,0 +1,46 @@
+import pytest
+
+from participants import DEFAULT_RING_SIZE, INITIAL_RING_SLOTS, ParticipantState, ring_size_for
+
+
+def naive_scores(frames, now, windows):
+    """Window scores recomputed from every (time, detected) frame"""
+    scores = {}
+    for seconds, label in windows:
+        recent = [d for t, d in frames if t >= now - seconds]
+        scores[label] = round(sum(recent) / len(recent) * 100, 2) if recent else 0
+    return scores
+
+
+def test_default_ring_holds_the_longest_window_at_the_client_rate():
+    assert DEFAULT_RING_SIZE == 600
+    assert ring_size_for((30, 120)) == 240
+    assert ring_size_for((30,), fps=0.5) == 15
+
+
+def test_ring_grows_with_frames_up_to_its_size():
+    participant = ParticipantState('p', ring_size=100, windows=(30,), now=0.0)
+    assert len(participant._times) == INITIAL_RING_SLOTS
+    for i in range(60):
+        participant.record_frame(True, now=i * 0.5)
+    assert INITIAL_RING_SLOTS < len(participant._times) <= 100
+    for i in range(60, 300):
+        participant.record_frame(True, now=i * 0.5)
+    assert len(participant._times) == participant.ring_size == 100
+
+
+@pytest.mark.parametrize('count', [5, INITIAL_RING_SLOTS, INITIAL_RING_SLOTS + 1, 70, 250])
+def test_growing_ring_keeps_history_and_window_scores(count):
+    participant = ParticipantState('p', ring_size=100, windows=(10, 60), now=0.0)
+    frames = [(i * 0.5, i % 3 != 0) for i in range(count)]
+    for t, detected in frames:
+        participant.record_frame(detected, now=t)
+
+    times, detected = participant.history()
+    kept = frames[-100:]
+    assert times.tolist() == [int(t * 1000) for t, _ in kept]
+    assert detected.tolist() == [int(d) for _, d in kept]
+    # Windows longer than the ring only cover what the ring still holds
+    now = frames[-1][0]
+    assert participant.window_scores(now) == naive_scores(kept, now, [(10, '10s'), (60, '1m')])
+    assert participant.total_frames == count
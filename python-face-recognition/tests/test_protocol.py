@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from participants import ParticipantState
+from protocol import (FRAME_HEADER, PROTOCOL_V2, ChannelTable, ProtocolError, decode_result, encode_error,
+                      encode_overloaded, encode_result, format_code, parse_v1_frame)
+
+
+def test_parse_v1_frame_splits_header_and_image():
+    message = json.dumps({'session_id': 's1', 'participant_id': 'p1'}).encode() + b'\n' + b'\xff\xd8image'
+    frame_info, image_data = parse_v1_frame(message)
+    assert frame_info == {'session_id': 's1', 'participant_id': 'p1'}
+    assert isinstance(image_data, memoryview)
+    assert bytes(image_data) == b'\xff\xd8image'
+
+
+@pytest.mark.parametrize('message, error', [
+    (b'no separator', 'no header separator'),
+    (b'{}\n', 'No image data'),
+    (b'{not json\nimage', 'Invalid JSON'),
+    (b'[1, 2]\nimage', 'expected an object'),
+])
+def test_parse_v1_frame_rejects_malformed_messages(message, error):
+    with pytest.raises(ProtocolError, match=error):
+        parse_v1_frame(message)
+
+
+def test_channel_table_reuses_channel_on_repeated_hello():
+    channels = ChannelTable()
+    first = channels.bind('s1', 'p1', 'Alice')
+    second = channels.bind('s1', 'p2', 'Bob')
+    assert (first, second) == (0, 1)
+    assert channels.bind('s1', 'p1', 'Alice (renamed)', role='host') == first
+
+
+def test_channel_table_parses_v2_frames():
+    channels = ChannelTable()
+    channel = channels.bind('s1', 'p1', 'Alice')
+    message = FRAME_HEADER.pack(PROTOCOL_V2, format_code('gray'), channel, 41, 320, 240) + b'pixels'
+    frame_info, image_data = channels.parse_frame(message)
+    assert frame_info['session_id'] == 's1'
+    assert frame_info['participant_id'] == 'p1'
+    assert frame_info['seq'] == 41
+    assert (frame_info['format'], frame_info['width'], frame_info['height']) == ('gray', 320, 240)
+    assert bytes(image_data) == b'pixels'
+
+    # Encoded frames carry no format; the decoder sniffs it
+    frame_info, _ = channels.parse_frame(FRAME_HEADER.pack(PROTOCOL_V2, 0, channel, 42, 0, 0) + b'jpeg')
+    assert 'format' not in frame_info
+
+
+@pytest.mark.parametrize('message, error', [
+    (FRAME_HEADER.pack(PROTOCOL_V2, 0, 0, 1, 0, 0), 'shorter than the v2 header'),
+    (FRAME_HEADER.pack(3, 0, 0, 1, 0, 0) + b'x', 'Unsupported frame version'),
+    (FRAME_HEADER.pack(PROTOCOL_V2, 0, 5, 1, 0, 0) + b'x', 'Unknown channel'),
+    (FRAME_HEADER.pack(PROTOCOL_V2, 200, 0, 1, 0, 0) + b'x', 'Unknown frame format'),
+])
+def test_channel_table_rejects_malformed_frames(message, error):
+    channels = ChannelTable()
+    channels.bind('s1', 'p1', 'Alice')
+    with pytest.raises(ProtocolError, match=error):
+        channels.parse_frame(message)
+
+
+def test_result_round_trip():
+    participant = ParticipantState('Alice', now=100.0)
+    for i in range(4):
+        participant.record_frame(i != 3, now=100.0 + i)
+    frame_info = {'channel': 3, 'seq': 7}
+    detection = {'faces': [(10, 20, 30, 40, 0.9), (50, 60, 70, 80, 0.5)], 'detect_ms': 12.345}
+
+    result = decode_result(encode_result(frame_info, participant, detection, [75.0, 87.5], 12.9, dropped=2),
+                           ['30s', '5m'])
+
+    assert result['channel'] == 3
+    assert result['seq'] == 7
+    assert result['faces_detected'] == 2
+    assert result['faces'][0] == {'x': 10, 'y': 20, 'width': 30, 'height': 40, 'confidence': pytest.approx(0.9)}
+    assert result['attention_score'] == 75.0
+    assert result['attention_level'] == 'medium'
+    assert result['recent_attention'] == {'30s': 75.0, '5m': 87.5}
+    assert result['dropped_frames'] == 2
+    assert (result['total_frames'], result['face_detected_frames']) == (4, 3)
+    assert result['session_duration_seconds'] == 12
+    assert result['detect_ms'] == pytest.approx(12.35, abs=0.01)
+
+
+def test_error_and_overloaded_round_trip():
+    frame_info = {'channel': 1, 'seq': 9}
+    assert decode_result(encode_error(frame_info, 'bad frame'), []) == \
+        {'channel': 1, 'seq': 9, 'error': 'bad frame'}
+    assert decode_result(encode_error(None, 'unparsed'), []) == {'channel': 0, 'seq': 0, 'error': 'unparsed'}
+    assert decode_result(encode_overloaded(frame_info, 250, 'in_flight'), []) == \
+        {'channel': 1, 'seq': 9, 'overloaded': True, 'reason': 'in_flight', 'retry_after_ms': 250}
@@ -0,0 +1,68 @@
+from reports import ReportAggregates
+
+
+def test_etag_changes_with_every_recorded_frame():
+    reports = ReportAggregates()
+    reports.record('s1', 'p1', 0, 100.0, new_participant=True)
+    before = reports.etag('report')
+    session_before = reports.etag('session', 's1')
+
+    reports.record('s1', 'p1', 100.0, 50.0)
+    assert reports.etag('report') != before
+    assert reports.etag('session', 's1') != session_before
+
+
+def test_session_etag_only_changes_with_its_session():
+    reports = ReportAggregates()
+    reports.record('s1', 'p1', 0, 100.0, new_participant=True)
+    reports.record('s2', 'p2', 0, 100.0, new_participant=True)
+    s1 = reports.etag('session', 's1')
+
+    reports.record('s2', 'p2', 100.0, 80.0)
+    assert reports.etag('session', 's1') == s1
+    assert reports.session_version('s2') > reports.session_version('s1')
+
+
+def test_session_etag_does_not_contain_the_session_id():
+    reports = ReportAggregates()
+    session_id = 'room "A" / ü'
+    reports.record(session_id, 'p1', 0, 100.0, new_participant=True)
+    etag = reports.etag('session', session_id)
+    assert session_id not in etag
+    assert etag.startswith('"session-') and etag.endswith('"')
+    assert etag.isascii() and etag.count('"') == 2
+    assert etag != reports.etag('session', 'other')
+
+
+def test_recreated_session_never_reuses_an_etag():
+    reports = ReportAggregates()
+    reports.record('s1', 'p1', 0, 100.0, new_participant=True)
+    seen = reports.etag('session', 's1')
+
+    reports.forget_session('s1')
+    assert reports.session_version('s1') is None
+    reports.record('s1', 'p1', 0, 100.0, new_participant=True)
+    assert reports.etag('session', 's1') != seen
+
+
+def test_etags_differ_between_process_lifetimes():
+    first, second = ReportAggregates(), ReportAggregates()
+    second.epoch = 'restarted'
+    assert first.etag('report') != second.etag('report')
+
+
+def test_cached_renders_once_per_version():
+    reports = ReportAggregates()
+    reports.record('s1', 'p1', 0, 100.0, new_participant=True)
+    renders = []
+
+    def render():
+        renders.append(1)
+        return f'body {len(renders)}'
+
+    version = reports.session_version('s1')
+    assert reports.cached('session', 's1', version, render) == 'body 1'
+    assert reports.cached('session', 's1', version, render) == 'body 1'
+    reports.record('s1', 'p1', 100.0, 0.0)
+    assert reports.cached('session', 's1', reports.session_version('s1'), render) == 'body 2'
+    assert (reports.cache_hits, reports.cache_misses) == (1, 2)
@@ -6,9 +6,10 @@ import helmet from 'helmet';
 import rateLimit from 'express-rate-limit';
 import { v4 as uuidv4 } from 'uuid';
 import 'dotenv/config';
-import { networkInterfaces } from 'os';
+import { networkInterfaces, tmpdir } from 'os';
 import WebSocket from 'ws';
 import { spawn } from 'child_process';
+import { randomBytes } from 'crypto';
 import path from 'path';
 import axios from 'axios';
 import morgan from 'morgan';
@@ -213,6 +214,46 @@ class FaceRecognitionService {
     this.pythonProcess = null;
     this.isRunning = false;
     this.startupPromise = null;
+    // Updated from the service's SERVICE_PORTS / SERVICE_READY announcements
+    this.httpPort = 8000;
+    this.wsPort = 8001;
+    // Frames are sent over this Unix socket instead of TCP when the service offers one
+    this.wsUnixSocket = null;
+    // Shared with the service so only this relay may mark frames as coming from a host
+    this.relayToken = process.env.RELAY_TOKEN || randomBytes(32).toString('hex');
+  }
+
+  get wsOptions() {
+    return { headers: { Authorization: `Bearer ${this.relayToken}` } };
+  }
+
+  get httpUrl() {
+    return `http://localhost:${this.httpPort}`;
+  }
+
+  get wsUrl() {
+    if (this.wsUnixSocket) {
+      return `ws+unix://${this.wsUnixSocket}:/`;
+    }
+    return `ws://localhost:${this.wsPort}`;
+  }
+
+  // Handle one `SERVICE_PORTS {...}` / `SERVICE_READY {...}` stdout line; returns the event name
+  handleAnnouncement(line) {
+    const match = /^(SERVICE_PORTS|SERVICE_READY) (\{.*\})$/.exec(line.trim());
+    if (!match) return null;
+    try {
+      const info = JSON.parse(match[2]);
+      if (info.http_port) this.httpPort = info.http_port;
+      if (info.ws_port) this.wsPort = info.ws_port;
+      this.wsUnixSocket = info.ws_unix_socket || null;
+      if (match[1] === 'SERVICE_READY') {
+        console.log(`✅ Face recognition service ready on ${this.httpUrl} / ${this.wsUrl} (cold start ${info.cold_start_ms} ms)`);
+      }
+    } catch {
+      return null;
+    }
+    return match[1];
   }
 
   async start() {
@@ -229,21 +270,38 @@ class FaceRecognitionService {
       const pythonPath = process.env.PYTHON_PATH || 'python';
       const scriptPath = path.join(process.cwd(), '../python-face-recognition/server.py');
       
+      // The service runs on this host, so ask it for a Unix socket WebSocket
+      // listener and keep frames off the TCP stack
+      const env = { ...process.env };
+      if (process.platform !== 'win32' && env.WS_UNIX_SOCKET === undefined) {
+        env.WS_UNIX_SOCKET = path.join(tmpdir(), `face-recognition-${process.pid}.sock`);
+      }
+      env.RELAY_TOKEN = this.relayToken;
+      
       this.pythonProcess = spawn(pythonPath, [scriptPath], {
+        env,
         stdio: ['pipe', 'pipe', 'pipe'],
         cwd: path.join(process.cwd(), '../python-face-recognition')
       });
 
       let hasResolved = false;
+      let pending = '';
 
       this.pythonProcess.stdout.on('data', (data) => {
         const output = data.toString();
         console.log('[Python Service]:', output);
         
-        if (output.includes('Starting Enhanced Face Recognition') && !hasResolved) {
-          this.isRunning = true;
-          hasResolved = true;
-          resolve();
+        // Announcements are whole lines, but a chunk may end mid-line
+        pending += output;
+        const lines = pending.split('\n');
+        pending = lines.pop();
+        for (const line of lines) {
+          // Resolve once the detector is warm, not when the process merely started
+          if (this.handleAnnouncement(line) === 'SERVICE_READY' && !hasResolved) {
+            this.isRunning = true;
+            hasResolved = true;
+            resolve();
+          }
         }
       });
 
@@ -346,7 +404,7 @@ class FaceRecognitionService {
     if (!this.isRunning) return false;
     
     try {
-      const response = await axios.get('http://localhost:8000/', { timeout: 5000 });
+      const response = await axios.get(`${this.httpUrl}/ready`, { timeout: 5000 });
       return response.status === 200;
     } catch {
       return false;
@@ -369,7 +427,7 @@ const createFaceRecognitionConnection = (socketId, roomId, user) => {
   }
 
   try {
-    const ws = new WebSocket('ws://localhost:8001');
+    const ws = new WebSocket(faceRecognitionService.wsUrl, faceRecognitionService.wsOptions);
     
     ws.on('open', () => {
       console.log(`Face recognition connection established for user ${user.username}`);
@@ -585,6 +643,8 @@ async function initializeServer() {
             id: roomId,
             users: new Map(),
             createdAt: new Date(),
+            // Whoever opens the room hosts it; the face service gives hosts admission priority
+            hostUserId: user._id.toString(),
             faceRecognitionEnabled: true
           });
         }
@@ -633,9 +693,11 @@ async function initializeServer() {
         if (faceWs && faceWs.readyState === WebSocket.OPEN) {
           try {
             // Prepare frame data for Python service
+            const room = rooms.get(data.roomId);
             const frameData = {
               session_id: data.roomId || 'unknown',
               participant_id: user._id.toString(),
+              role: room && room.hostUserId === user._id.toString() ? 'host' : 'attendee',
               ts_ms: Date.now(),
               seq: data.seq || 0,
               w: data.width || 640,
@@ -879,7 +941,7 @@ async function initializeServer() {
 
     app.get('/api/face-recognition/report/:sessionId', async (req, res) => {
       try {
-        const response = await axios.get('http://localhost:8000/attention-report', {
+        const response = await axios.get(`${faceRecognitionService.httpUrl}/attention-report`, {
           timeout: 5000
         });
         res.json(response.data);
@@ -894,7 +956,7 @@ async function initializeServer() {
 
     app.post('/api/face-recognition/reset', async (req, res) => {
       try {
-        const response = await axios.post('http://localhost:8000/reset-attention', {}, {
+        const response = await axios.post(`${faceRecognitionService.httpUrl}/reset-attention`, {}, {
           timeout: 5000
         });
         res.json(response.data);